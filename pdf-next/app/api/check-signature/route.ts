@@ -1,33 +1,78 @@
 import { NextRequest, NextResponse } from 'next/server';
+import {
+  SPAN_KIND_CLIENT,
+  SPAN_KIND_SERVER,
+  endSpan,
+  exportSpans,
+  parseTraceparent,
+  startSpan,
+  traceparentOf,
+} from '@/lib/tracing';
+
+// Streaming request bodies through fetch() requires the Node.js runtime
+export const runtime = 'nodejs';
 
 export async function POST(request: NextRequest) {
-  try {
-    const buffer = await request.arrayBuffer();
-    const pdfBuffer = Buffer.from(buffer);
+  // Continue the caller's trace if any; the Python API nests its spans under the client span
+  const serverSpan = startSpan('POST /api/check-signature', SPAN_KIND_SERVER,
+    parseTraceparent(request.headers.get('traceparent')),
+    { 'http.method': 'POST', 'http.route': '/api/check-signature' });
+  const spans = [serverSpan];
 
-    // Create FormData and append the PDF file
-    const formData = new FormData();
-    const blob = new Blob([pdfBuffer], { type: 'application/pdf' });
-    formData.append("file", blob, "document.pdf");
+  try {
+    if (!request.body) {
+      serverSpan.attributes['http.status_code'] = 400;
+      return NextResponse.json({ error: 'Không tìm thấy file trong request' }, { status: 400 });
+    }
 
     // Forward to Python API - use environment variable or fallback to localhost
     const apiUrl = process.env.PYTHON_API_URL || "http://localhost:5001";
-    const response = await fetch(`${apiUrl}/api/verify-pdf`, {
-      method: "POST",
-      body: formData,
-    });
+    const clientSpan = startSpan('POST /api/verify-pdf', SPAN_KIND_CLIENT, serverSpan,
+      { 'http.method': 'POST', 'server.address': apiUrl });
+    spans.push(clientSpan);
+
+    // Pipe the raw PDF body straight to the Python API (no buffering / multipart re-encoding)
+    const headers: Record<string, string> = {
+      'Content-Type': 'application/pdf',
+      traceparent: traceparentOf(clientSpan),
+    };
+    const contentLength = request.headers.get('content-length');
+    if (contentLength) {
+      headers['Content-Length'] = contentLength;
+      serverSpan.attributes['pdf.file_size'] = Number(contentLength);
+    }
 
-    if (!response.ok) {
-      throw new Error(`Python API error: ${response.status}`);
+    let response: Response;
+    try {
+      response = await fetch(`${apiUrl}/api/verify-pdf`, {
+        method: "POST",
+        headers,
+        body: request.body,
+        duplex: 'half',
+      } as RequestInit & { duplex: 'half' });
+    } catch (error) {
+      endSpan(clientSpan, error);
+      throw error;
     }
+    endSpan(clientSpan);
+    clientSpan.attributes['http.status_code'] = response.status;
+    serverSpan.attributes['http.status_code'] = response.status;
 
-    const result = await response.json();
-    return NextResponse.json(result);
+    // Pass the JSON response (including structured 4xx errors) through without re-parsing
+    return new NextResponse(response.body, {
+      status: response.status,
+      headers: { 'Content-Type': response.headers.get('content-type') || 'application/json' },
+    });
   } catch (error) {
     console.error('Error checking PDF signature:', error);
+    serverSpan.attributes['http.status_code'] = 500;
+    serverSpan.error = error instanceof Error ? error.message : String(error);
     return NextResponse.json(
       { error: 'Failed to verify PDF signature' },
       { status: 500 }
     );
+  } finally {
+    endSpan(serverSpan);
+    void exportSpans(spans);
   }
-}  
\ No newline at end of file
+}
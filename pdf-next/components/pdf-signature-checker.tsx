@@ -72,15 +72,13 @@ export default function PDFSignatureChecker() {
     setError(null);
 
     try {
-      const arrayBuffer = await file.arrayBuffer();
-      const buffer = Buffer.from(arrayBuffer);
-
+      // Send the File directly - the browser streams it without copying into JS memory
       const response = await fetch('/api/check-signature', {
         method: 'POST',
         headers: {
-          'Content-Type': 'application/octet-stream',
+          'Content-Type': 'application/pdf',
         },
-        body: buffer,
+        body: file,
       });
 
       if (!response.ok) {
@@ -278,7 +276,10 @@ export default function PDFSignatureChecker() {
                           )}
                         </div>
                         <div className="text-sm text-gray-600">
-                          {signature.signer?.common_name ? cleanVietnameseText(signature.signer.common_name) : 'Không xác định'}
+                          {(() => {
+                            const signerName = signature.signer?.display_name || signature.signer?.common_name;
+                            return signerName && signerName !== 'N/A' ? cleanVietnameseText(signerName) : 'Không xác định';
+                          })()}
                         </div>
                       </div>
                     </CollapsibleTrigger>
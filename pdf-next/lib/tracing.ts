@@ -0,0 +1,153 @@
+import { randomBytes } from 'crypto';
+import { appendFile } from 'fs/promises';
+
+// Minimal W3C Trace Context + span export for the proxy route (mirrors pdf-python/tracing.py).
+// The route creates a SERVER span and a CLIENT span for the hop to the Python API and sends the
+// CLIENT span as `traceparent`, so Python spans nest under it in the same trace.
+//
+// Export (both optional, nothing is exported if neither is set):
+//   PDF_TRACE_FILE=/data/traces.jsonl                      one JSON span per line
+//   PDF_TRACE_OTLP_ENDPOINT=http://localhost:4318/v1/traces OTLP/HTTP JSON
+//   PDF_TRACE_SERVICE_NAME=pdf-next
+
+export const SPAN_KIND_SERVER = 2;
+export const SPAN_KIND_CLIENT = 3;
+
+const TRACEPARENT_RE = /^([0-9a-f]{2})-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$/;
+
+type AttributeValue = string | number | boolean;
+
+export interface TraceContext {
+  traceId: string;
+  spanId: string;
+  sampled: boolean;
+}
+
+export interface Span extends TraceContext {
+  parentSpanId?: string;
+  name: string;
+  kind: number;
+  startMicros: number;
+  endMicros?: number;
+  attributes: Record<string, AttributeValue>;
+  error?: string;
+}
+
+function nowMicros(): number {
+  return Math.floor((performance.timeOrigin + performance.now()) * 1000);
+}
+
+export function parseTraceparent(value: string | null): TraceContext | null {
+  const match = TRACEPARENT_RE.exec((value || '').trim().toLowerCase());
+  if (!match) {
+    return null;
+  }
+  const [, version, traceId, spanId, flags] = match;
+  if (version === 'ff' || /^0+$/.test(traceId) || /^0+$/.test(spanId)) {
+    return null;
+  }
+  return { traceId, spanId, sampled: (parseInt(flags, 16) & 0x01) === 1 };
+}
+
+export function startSpan(
+  name: string,
+  kind: number,
+  parent: TraceContext | null,
+  attributes: Record<string, AttributeValue> = {}
+): Span {
+  return {
+    traceId: parent ? parent.traceId : randomBytes(16).toString('hex'),
+    spanId: randomBytes(8).toString('hex'),
+    parentSpanId: parent?.spanId,
+    sampled: parent ? parent.sampled : true,
+    name,
+    kind,
+    startMicros: nowMicros(),
+    attributes: { ...attributes },
+  };
+}
+
+export function endSpan(span: Span, error?: unknown): void {
+  span.endMicros = nowMicros();
+  if (error !== undefined) {
+    span.error = error instanceof Error ? `${error.name}: ${error.message}` : String(error);
+  }
+}
+
+export function traceparentOf(span: Span): string {
+  return `00-${span.traceId}-${span.spanId}-${span.sampled ? '01' : '00'}`;
+}
+
+function serviceName(): string {
+  return process.env.PDF_TRACE_SERVICE_NAME || 'pdf-next';
+}
+
+function fileRecord(span: Span): string {
+  const end = span.endMicros ?? span.startMicros;
+  return JSON.stringify({
+    service: serviceName(),
+    trace_id: span.traceId,
+    span_id: span.spanId,
+    parent_span_id: span.parentSpanId ?? null,
+    name: span.name,
+    kind: span.kind,
+    start_time_unix_nano: span.startMicros * 1000,
+    end_time_unix_nano: end * 1000,
+    duration_ms: (end - span.startMicros) / 1000,
+    attributes: span.attributes,
+    status: span.error ? 'error' : 'ok',
+    error: span.error ?? null,
+  });
+}
+
+function otlpValue(value: AttributeValue) {
+  if (typeof value === 'boolean') {
+    return { boolValue: value };
+  }
+  if (typeof value === 'number') {
+    return Number.isInteger(value) ? { intValue: String(value) } : { doubleValue: value };
+  }
+  return { stringValue: value };
+}
+
+function otlpPayload(spans: Span[]) {
+  return {
+    resourceSpans: [{
+      resource: { attributes: [{ key: 'service.name', value: { stringValue: serviceName() } }] },
+      scopeSpans: [{
+        scope: { name: 'pdf-next' },
+        spans: spans.map((span) => ({
+          traceId: span.traceId,
+          spanId: span.spanId,
+          parentSpanId: span.parentSpanId ?? '',
+          name: span.name,
+          kind: span.kind,
+          startTimeUnixNano: `${span.startMicros}000`,
+          endTimeUnixNano: `${span.endMicros ?? span.startMicros}000`,
+          attributes: Object.entries(span.attributes).map(([key, value]) => ({ key, value: otlpValue(value) })),
+          status: span.error ? { code: 2, message: span.error } : { code: 1 },
+        })),
+      }],
+    }],
+  };
+}
+
+// Never throws: a missing collector or unwritable file must not fail the request
+export async function exportSpans(spans: Span[]): Promise<void> {
+  const sampled = spans.filter((span) => span.sampled);
+  if (sampled.length === 0) {
+    return;
+  }
+  const tasks: Promise<unknown>[] = [];
+  if (process.env.PDF_TRACE_FILE) {
+    tasks.push(appendFile(process.env.PDF_TRACE_FILE, sampled.map(fileRecord).join('\n') + '\n'));
+  }
+  if (process.env.PDF_TRACE_OTLP_ENDPOINT) {
+    tasks.push(fetch(process.env.PDF_TRACE_OTLP_ENDPOINT, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify(otlpPayload(sampled)),
+    }));
+  }
+  await Promise.allSettled(tasks);
+}
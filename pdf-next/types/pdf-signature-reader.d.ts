@@ -28,12 +28,25 @@ export interface SignatureInfo {
     city?: string;
     organization?: string;
     user_id?: string;
+    display_name?: string;
+    display_name_source?: string | null;
   };
   signing_time: string;
   signing_timezone?: string;
   total_size: number | null;
   valid_from: string;
   valid_until: string;
+  ltv?: {
+    has_dss: boolean;
+    has_vri: boolean;
+    vri: { certs: number; crls: number; ocsps: number } | null;
+    dss_certificates: number;
+    dss_crls: number;
+    dss_ocsps: number;
+    chain_complete: boolean;
+    revocation_status: 'good' | 'revoked' | 'unknown';
+    revocation_source: 'ocsp' | 'crl' | null;
+  } | null;
   structure_validation?: {
     is_structure_valid: boolean;
     validation_summary: string;
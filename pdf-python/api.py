@@ -8,23 +8,81 @@ warnings.filterwarnings('ignore')
 logging.getLogger('pyhanko').setLevel(logging.CRITICAL)
 
 from flask import Flask, request, jsonify
+from werkzeug.exceptions import RequestEntityTooLarge
 from pypdf import PdfReader
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.serialization import pkcs7
-from cryptography import x509
-from cryptography.hazmat.primitives.asymmetric import rsa, ec, padding
+from cryptography.hazmat.primitives.asymmetric import rsa, ec, padding, utils
 from asn1crypto import cms as asn1_cms
 from asn1crypto import tsp as asn1_tsp
-from endesive.pdf.verify import verify as endesive_verify
 from datetime import datetime, timezone, timedelta
+import hashlib
 import os
 
+from fast_paths import FAST_PATHS, ByteRangeLoopError, first_signature_hashok
+from history_store import normalize_signing_time, open_history_store_from_env
+from ingest import ingest_upload, parse_byte_ranges_header
+from ltv import load_validation_data
+from limits import VerificationGuard, VerificationLimitExceeded, check_admission, deferred_interrupts, get_limits
+from profiling import SamplingProfiler, is_authorized
+from signer_identity import certificate_fingerprint, certificate_identity, resolve_signer_identity
+from singleflight import open_single_flight_from_env
+from tracing import set_attribute, span, traced_view
+from verdict_cache import open_verdict_cache_from_env, verdict_key
+
+# endesive KHÔNG import ở đây: nó chỉ cần khi kiểm tra toàn vẹn chạy tới,
+# xem _get_endesive_verify()
+_endesive_verify = None
+
 app = Flask(__name__)
 
+# Giới hạn tài nguyên (xem limits.py) - Flask từ chối body lớn hơn trước khi đọc hết
+VERIFICATION_LIMITS = get_limits()
+app.config['MAX_CONTENT_LENGTH'] = VERIFICATION_LIMITS['max_upload_bytes'] or None
+
+# Lịch sử xác minh (tuỳ chọn, bật bằng PDF_HISTORY_DB) - xem history_store.py
+HISTORY_STORE = open_history_store_from_env()
+
+# Gộp các request đồng thời cùng nội dung file (xem singleflight.py) - chờ lâu hơn
+# deadline xác minh để request đến sau không tự chạy lại khi lần đầu vẫn đang chạy
+SINGLE_FLIGHT = open_single_flight_from_env((VERIFICATION_LIMITS['verify_timeout_seconds'] or 90.0) + 30.0)
+
+# Cache kết quả verify RSA/ECDSA (xem verdict_cache.py)
+VERDICT_CACHE = open_verdict_cache_from_env()
+
 # PDF field keys
 PDF_CONTENTS_KEY = "/Contents"
 PDF_BYTERANGE_KEY = "/ByteRange"
 
+# OID dùng chung (read-only) - dựng một lần khi import module.
+# Với gunicorn --preload, module được import trong master trước khi fork nên
+# các worker dùng chung các bảng này theo copy-on-write.
+OID_SIGNING_TIME = '1.2.840.113549.1.9.5'
+OID_TIMESTAMP_TOKEN = '1.2.840.113549.1.9.16.2.14'
+
+HASH_ALGORITHMS_BY_OID = {
+    '1.3.14.3.2.26': hashes.SHA1(),             # SHA-1
+    '2.16.840.1.101.3.4.2.1': hashes.SHA256(),  # SHA-256
+    '2.16.840.1.101.3.4.2.2': hashes.SHA384(),  # SHA-384
+    '2.16.840.1.101.3.4.2.3': hashes.SHA512(),  # SHA-512
+}
+
+def _get_endesive_verify():
+    """
+    Import endesive khi cần (lazy import)
+    
+    endesive kéo theo nhiều module nặng nhưng chỉ dùng ở bước kiểm tra toàn vẹn,
+    nên không import khi khởi động để giảm thời gian cold start.
+    
+    Returns:
+        function: endesive.pdf.verify.verify
+    """
+    global _endesive_verify
+    if _endesive_verify is None:
+        from endesive.pdf.verify import verify
+        _endesive_verify = verify
+    return _endesive_verify
+
 def extract_signing_date_from_pdf_field(pdf_path, field_name):
     """
     Trích xuất ngày ký từ /M field trong PDF signature dictionary
@@ -93,51 +151,6 @@ def extract_signing_date_from_pdf_field(pdf_path, field_name):
     
     return None, None
 
-def extract_signer_name_from_pdf_field(pdf_path, field_name):
-    """
-    Trích xuất tên người ký từ PDF signature dictionary
-    Cố gắng lấy từ các fields: /Name, /Reason, /ContactInfo, v.v.
-    
-    Args:
-        pdf_path: Đường dẫn đến file PDF
-        field_name: Tên của signature field
-        
-    Returns:
-        str: Tên người ký hoặc None nếu không tìm được
-    """
-    try:
-        reader = PdfReader(pdf_path)
-        fields = reader.get_fields()
-        
-        if field_name in fields and '/V' in fields[field_name]:
-            v_obj = fields[field_name]['/V'].get_object()
-            
-            # Thứ tự ưu tiên để tìm tên người ký
-            field_priorities = [
-                '/Name',           # Tên người ký (PDF standard)
-                '/Reason',         # Lý do ký
-                '/ContactInfo',    # Thông tin liên hệ
-                '/Location',       # Địa điểm ký
-                '/Title',          # Tiêu đề
-            ]
-            
-            for field_key in field_priorities:
-                if field_key in v_obj:
-                    value = str(v_obj[field_key]).strip()
-                    if value and value.lower() not in ['', 'none', 'unknown']:
-                        return value[:100]
-            
-            # Nếu không tìm thấy, thử lấy từ /DN (Distinguished Name) nếu có
-            if '/DN' in v_obj:
-                dn = str(v_obj['/DN']).strip()
-                if dn:
-                    return dn[:100]
-        
-    except Exception as e:
-        print(f"[PDF_EXTRACT] Error extracting signer name from PDF field: {str(e)[:80]}")
-    
-    return None
-
 def extract_signing_date_from_cms(cms_bytes):
     """
     Trích xuất ngày ký từ CMS/PKCS#7
@@ -165,8 +178,8 @@ def extract_signing_date_from_cms(cms_bytes):
                 if signed_attrs:
                     for attr in signed_attrs:
                         # OID 1.2.840.113549.1.9.5 là signing time
-                        if attr['attrType'].dotted == '1.2.840.113549.1.9.5':
-                            time_value = attr['attrValues'][0]
+                        if attr['type'].dotted == OID_SIGNING_TIME:
+                            time_value = attr['values'][0]
                             # Trả về datetime object và None cho timezone (CMS không lưu timezone)
                             return time_value.native, None
     except Exception:
@@ -201,29 +214,35 @@ def check_tsa_presence(cms_bytes):
         signer_info = signer_infos[0]
         
         # Kiểm tra unsigned_attrs (nơi TSA timestamp được lưu)
-        unsigned_attrs = signer_info.get('unsigned_attrs')
+        unsigned_attrs = signer_info['unsigned_attrs']
         
         if not unsigned_attrs:
             return False, None
         
         # OID 1.2.840.113549.1.9.16.2.14 = Timestamp Token
-        tsa_oid = '1.2.840.113549.1.9.16.2.14'
-        
         for attr in unsigned_attrs:
-            if attr['attrType'].dotted == tsa_oid:
-                # Tìm thấy TSA timestamp
+            if attr['type'].dotted == OID_TIMESTAMP_TOKEN:
+                # Tìm thấy TSA timestamp (SignedData bọc TSTInfo)
                 try:
-                    timestamp_token = attr['attrValues'][0]
-                    tsp_content = asn1_cms.ContentInfo.load(timestamp_token)
+                    timestamp_token = attr['values'][0]
+                    encap = timestamp_token['content']['encap_content_info']
+                    if encap['content_type'].native != 'tst_info':
+                        continue
+                    tst_info = encap['content'].parsed
+                    
+                    # Token phải đóng dấu cho chính chữ ký này: message imprint là
+                    # hash của signature value (RFC 3161, phụ lục A)
+                    imprint = tst_info['message_imprint']
+                    imprint_hash = hashlib.new(imprint['hash_algorithm']['algorithm'].native,
+                                               signer_info['signature'].native).digest()
+                    if imprint_hash != imprint['hashed_message'].native:
+                        continue
                     
-                    if tsp_content['content_type'].native == 'tst_info':
-                        tst_info = tsp_content['content']
-                        gen_time = tst_info['gen_time'].native
-                        
-                        return True, {
-                            'timestamp': gen_time.isoformat() if gen_time else None,
-                            'has_tsa': True
-                        }
+                    gen_time = tst_info['gen_time'].native
+                    return True, {
+                        'timestamp': gen_time.isoformat() if gen_time else None,
+                        'has_tsa': True
+                    }
                 except Exception:
                     pass
         
@@ -232,7 +251,73 @@ def check_tsa_presence(cms_bytes):
     except Exception:
         return False, None
 
-def verify_cryptographic_signature(pdf_path, field_name, signer_cert, cms_bytes):
+def signature_validation_time(tsa_info, signing_time, signing_timezone=None):
+    """
+    Thời điểm xét thu hồi chứng chỉ của một chữ ký: gen_time của TSA, không có
+    thì thời gian ký (/M hoặc signingTime trong CMS)
+    
+    Returns:
+        datetime (UTC) hoặc None (xét tại thời điểm kiểm tra)
+    """
+    if tsa_info and tsa_info.get('timestamp'):
+        return datetime.fromisoformat(tsa_info['timestamp']).astimezone(timezone.utc)
+    signing_time = normalize_signing_time(signing_time, signing_timezone)
+    if signing_time:
+        return datetime.fromisoformat(signing_time.replace('Z', '+00:00'))
+    return None
+
+def hash_byte_range(pdf_path, byte_range, hash_algo, chunk_size=1024 * 1024):
+    """
+    Hash dữ liệu được ký theo ByteRange, đọc file theo chunk (không ghép cả file trong RAM)
+    
+    Returns:
+        bytes: digest
+    """
+    digest = hashes.Hash(hash_algo)
+    with open(pdf_path, 'rb') as f:
+        for offset, length in ((byte_range[0], byte_range[1]), (byte_range[2], byte_range[3])):
+            f.seek(offset)
+            while length > 0:
+                chunk = f.read(min(chunk_size, length))
+                if not chunk:
+                    break
+                digest.update(chunk)
+                length -= len(chunk)
+    return digest.finalize()
+
+def verify_signature_value(signer_cert, signature_value, signed_digest, hash_algo):
+    """
+    Verify RSA/ECDSA signature value trên digest của dữ liệu được ký
+    
+    Returns:
+        (is_valid: bool, message: str)
+    """
+    public_key = signer_cert.public_key()
+    
+    try:
+        if isinstance(public_key, rsa.RSAPublicKey):
+            # RSA signature verification
+            public_key.verify(
+                signature_value,
+                signed_digest,
+                padding.PKCS1v15(),
+                utils.Prehashed(hash_algo)
+            )
+            return True, "Chữ ký hợp lệ (RSA verified)"
+        elif isinstance(public_key, ec.EllipticCurvePublicKey):
+            # ECDSA signature verification
+            public_key.verify(
+                signature_value,
+                signed_digest,
+                ec.ECDSA(utils.Prehashed(hash_algo))
+            )
+            return True, "Chữ ký hợp lệ (ECDSA verified)"
+        else:
+            return False, "Loại chứng chỉ không được hỗ trợ"
+    except Exception as sig_error:
+        return False, f"Chữ ký KHÔNG hợp lệ - {str(sig_error)[:50]}"
+
+def verify_cryptographic_signature(pdf_path, field_name, signer_cert, cms_bytes, range_digests=None):
     """
     Xác minh chữ ký bằng cách so sánh signature với dữ liệu được ký
     
@@ -241,6 +326,8 @@ def verify_cryptographic_signature(pdf_path, field_name, signer_cert, cms_bytes)
         field_name: Tên signature field
         signer_cert: Certificate của người ký
         cms_bytes: Raw CMS/PKCS#7 bytes
+        range_digests: Digest ByteRange đã tính trong lúc upload (xem ingest.py),
+                       {(off1, len1, off2, len2, algorithm): bytes}
         
     Returns:
         (is_valid: bool, message: str)
@@ -253,19 +340,29 @@ def verify_cryptographic_signature(pdf_path, field_name, signer_cert, cms_bytes)
             return False, "Không tìm thấy signature field"
         
         v_obj = fields[field_name]['/V'].get_object()
-        byte_range = v_obj.get(PDF_BYTERANGE_KEY)
+        return verify_signed_byte_range(pdf_path, v_obj.get(PDF_BYTERANGE_KEY), signer_cert, cms_bytes, range_digests)
+    
+    except Exception as e:
+        return False, f"Lỗi xác minh: {str(e)[:50]}"
+
+def verify_signed_byte_range(pdf_path, byte_range, signer_cert, cms_bytes, range_digests=None):
+    """
+    Bước 7 với /ByteRange đã đọc sẵn (đường nhanh: không parse lại PDF để tìm field)
+    
+    Args:
+        byte_range: Giá trị /ByteRange của signature dictionary
+        (các tham số khác như verify_cryptographic_signature)
         
+    Returns:
+        (is_valid: bool, message: str)
+    """
+    try:
         if not byte_range or len(byte_range) < 4:
             return False, "Không có ByteRange - không thể xác minh"
         
-        # Đọc PDF file để lấy dữ liệu được ký
-        with open(pdf_path, 'rb') as f:
-            pdf_bytes = f.read()
-        
         # ByteRange format: [offset1, length1, offset2, length2]
         # Dữ liệu được ký = bytes[offset1:offset1+length1] + bytes[offset2:offset2+length2]
-        offset1, len1, offset2, len2 = byte_range[0], byte_range[1], byte_range[2], byte_range[3]
-        signed_data = pdf_bytes[offset1:offset1+len1] + pdf_bytes[offset2:offset2+len2]
+        byte_range = tuple(int(n) for n in byte_range[:4])
         
         # Parse CMS để lấy signature value
         cms_data = asn1_cms.ContentInfo.load(cms_bytes)
@@ -285,40 +382,23 @@ def verify_cryptographic_signature(pdf_path, field_name, signer_cert, cms_bytes)
         digest_algo_oid = signer_info['digest_algorithm']['algorithm'].dotted
         
         # Map OID to hash algorithm
-        hash_algo_map = {
-            '1.3.14.3.2.26': hashes.SHA1(),      # SHA-1
-            '2.16.840.1.101.3.4.2.1': hashes.SHA256(),  # SHA-256
-            '2.16.840.1.101.3.4.2.2': hashes.SHA384(),  # SHA-384
-            '2.16.840.1.101.3.4.2.3': hashes.SHA512(),  # SHA-512
-        }
+        hash_algo = HASH_ALGORITHMS_BY_OID.get(digest_algo_oid, hashes.SHA256())
         
-        hash_algo = hash_algo_map.get(digest_algo_oid, hashes.SHA256())
+        # Digest của dữ liệu được ký: dùng bản tính sẵn khi upload nếu có, nếu không hash lại từ file
+        signed_digest = (range_digests or {}).get((*byte_range, hash_algo.name))
+        if signed_digest is None:
+            signed_digest = hash_byte_range(pdf_path, byte_range, hash_algo)
         
-        # Xác minh signature
-        public_key = signer_cert.public_key()
+        # Xác minh signature - kết quả cache theo (digest, signature, chứng chỉ), xem verdict_cache.py
+        if VERDICT_CACHE is None:
+            return verify_signature_value(signer_cert, signature_value, signed_digest, hash_algo)
         
-        try:
-            if isinstance(public_key, rsa.RSAPublicKey):
-                # RSA signature verification
-                public_key.verify(
-                    signature_value,
-                    signed_data,
-                    padding.PKCS1v15(),
-                    hash_algo
-                )
-                return True, "Chữ ký hợp lệ (RSA verified)"
-            elif isinstance(public_key, ec.EllipticCurvePublicKey):
-                # ECDSA signature verification
-                public_key.verify(
-                    signature_value,
-                    signed_data,
-                    ec.ECDSA(hash_algo)
-                )
-                return True, "Chữ ký hợp lệ (ECDSA verified)"
-            else:
-                return False, "Loại chứng chỉ không được hỗ trợ"
-        except Exception as sig_error:
-            return False, f"Chữ ký KHÔNG hợp lệ - {str(sig_error)[:50]}"
+        cache_key = verdict_key(hash_algo.name, signed_digest, signature_value, certificate_fingerprint(signer_cert))
+        verdict = VERDICT_CACHE.get(cache_key)
+        if verdict is None:
+            verdict = verify_signature_value(signer_cert, signature_value, signed_digest, hash_algo)
+            VERDICT_CACHE.put(cache_key, verdict)
+        return verdict
     
     except Exception as e:
         return False, f"Lỗi xác minh: {str(e)[:50]}"
@@ -367,145 +447,17 @@ def check_certificate_expiration(signer_cert):
     except Exception as e:
         return 'unknown', f"Không thể kiểm tra hạn: {str(e)[:50]}", None
 
-def extract_signer_name_from_cms(cms_bytes, field_name=None):
-    """
-    Cố gắng lấy tên người ký từ CMS/PKCS#7 attributes
-    Sử dụng asn1crypto để parse signer attributes và attributes
-    """
-    print(f"\n[CMS_EXTRACT] === Starting extract_signer_name_from_cms ===")
-    print(f"[CMS_EXTRACT] cms_bytes type: {type(cms_bytes)}, length: {len(cms_bytes) if cms_bytes else 0}")
-    print(f"[CMS_EXTRACT] field_name: {field_name}")
-    
-    try:
-        cms_data = asn1_cms.ContentInfo.load(cms_bytes)
-        print(f"[CMS_EXTRACT] CMS loaded successfully")
-        print(f"[CMS_EXTRACT] content_type: {cms_data['content_type'].native}")
-        
-        if cms_data['content_type'].native == 'signed_data':
-            signed_data = cms_data['content']
-            signer_infos = signed_data['signer_infos']
-            print(f"[CMS_EXTRACT] signer_infos count: {len(signer_infos)}")
-            
-            if signer_infos and len(signer_infos) > 0:
-                signer_info = signer_infos[0]
-                
-                # Method 1: Thử lấy từ signed_attrs (CMS attributes)
-                print(f"[CMS_EXTRACT] === METHOD 1: signed_attrs ===")
-                signed_attrs = signer_info.get('signed_attrs')
-                print(f"[CMS_EXTRACT] signed_attrs: {signed_attrs is not None}")
-                
-                if signed_attrs:
-                    print(f"[CMS_EXTRACT] signed_attrs count: {len(signed_attrs)}")
-                    for idx, attr in enumerate(signed_attrs):
-                        oid = attr['attrType'].dotted
-                        print(f"[CMS_EXTRACT]   Attr {idx}: OID={oid}")
-                        
-                        try:
-                            values = attr['attrValues']
-                            print(f"[CMS_EXTRACT]     values count: {len(values)}")
-                            if values:
-                                for vidx, val in enumerate(values):
-                                    val_str = str(val).strip()
-                                    print(f"[CMS_EXTRACT]       Value {vidx}: {val_str[:100]}")
-                                    
-                                    # Filter out binary data and common patterns
-                                    if (val_str and 
-                                        len(val_str) > 2 and 
-                                        val_str.lower() != 'unknown' and
-                                        not val_str.startswith('0x') and
-                                        not val_str.startswith('b\'') and
-                                        '\\x' not in val_str):
-                                        print(f"[CMS_EXTRACT] ✓ METHOD 1 FOUND: {val_str[:100]}")
-                                        return val_str[:100]
-                        except Exception as e:
-                            print(f"[CMS_EXTRACT]     Error parsing values: {str(e)[:50]}")
-                            pass
-                
-                # Method 2: Thử lấy từ signer identifier (issuer-serial)
-                print(f"[CMS_EXTRACT] === METHOD 2: signer identifier ===")
-                try:
-                    sid = signer_info['sid']
-                    print(f"[CMS_EXTRACT] sid.name: {sid.name}")
-                    if sid.name == 'issuer_and_serial_number':
-                        issuer_serial = sid.chosen
-                        issuer = issuer_serial['issuer']
-                        print(f"[CMS_EXTRACT] issuer type: {type(issuer)}")
-                        
-                        # Cố gắng lấy CN từ issuer
-                        try:
-                            for rdn_idx, rdn in enumerate(issuer.chosen):
-                                print(f"[CMS_EXTRACT]   RDN {rdn_idx}:")
-                                for attr_idx, attr in enumerate(rdn):
-                                    attr_value = str(attr['value'].native).strip()
-                                    print(f"[CMS_EXTRACT]     Attr {attr_idx}: {attr_value[:100]}")
-                                    if attr_value and len(attr_value) > 2:
-                                        print(f"[CMS_EXTRACT] ✓ METHOD 2 FOUND: {attr_value[:100]}")
-                                        return attr_value[:100]
-                        except Exception as e:
-                            print(f"[CMS_EXTRACT]   Error iterating RDN: {str(e)[:50]}")
-                            pass
-                except Exception as e:
-                    print(f"[CMS_EXTRACT] Error in METHOD 2: {str(e)[:50]}")
-                    pass
-                
-                # Method 3: Thử lấy từ unsigned_attrs (nếu có)
-                print(f"[CMS_EXTRACT] === METHOD 3: unsigned_attrs ===")
-                try:
-                    unsigned_attrs = signer_info.get('unsigned_attrs')
-                    print(f"[CMS_EXTRACT] unsigned_attrs: {unsigned_attrs is not None}")
-                    
-                    if unsigned_attrs:
-                        print(f"[CMS_EXTRACT] unsigned_attrs count: {len(unsigned_attrs)}")
-                        for idx, attr in enumerate(unsigned_attrs):
-                            oid = attr['attrType'].dotted
-                            print(f"[CMS_EXTRACT]   Attr {idx}: OID={oid}")
-                            
-                            try:
-                                values = attr['attrValues']
-                                print(f"[CMS_EXTRACT]     values count: {len(values)}")
-                                if values:
-                                    for vidx, val in enumerate(values):
-                                        val_str = str(val).strip()
-                                        print(f"[CMS_EXTRACT]       Value {vidx}: {val_str[:100]}")
-                                        if (val_str and 
-                                            len(val_str) > 2 and 
-                                            val_str.lower() != 'unknown' and
-                                            not val_str.startswith('0x')):
-                                            print(f"[CMS_EXTRACT] ✓ METHOD 3 FOUND: {val_str[:100]}")
-                                            return val_str[:100]
-                            except Exception as e:
-                                print(f"[CMS_EXTRACT]     Error: {str(e)[:50]}")
-                                pass
-                except Exception as e:
-                    print(f"[CMS_EXTRACT] Error in METHOD 3: {str(e)[:50]}")
-                    pass
-    except Exception as e:
-        print(f"[CMS_EXTRACT] Error loading CMS: {str(e)[:100]}")
-        pass
-    
-    # Fallback: dùng field name từ PDF
-    print(f"[CMS_EXTRACT] === FALLBACK: field_name ===")
-    if field_name:
-        field_name = str(field_name).strip()
-        print(f"[CMS_EXTRACT] Original field_name: {field_name}")
-        # Remove "Signature" prefix nếu có
-        if 'signature' in field_name.lower():
-            field_name = field_name.replace('Signature', '').replace('signature', '').strip('_0123456789')
-        print(f"[CMS_EXTRACT] Cleaned field_name: {field_name}")
-        if field_name and field_name.lower() not in ['', 'signature', 'sig']:
-            result = f"Sig: {field_name}"[:100]
-            print(f"[CMS_EXTRACT] ✓ FALLBACK FOUND: {result}")
-            return result
-    
-    print(f"[CMS_EXTRACT] ✗ ALL METHODS FAILED - returning None")
-    return None
-
-def verify_certificate_chain(certificates):
+def verify_certificate_chain(certificates, validation_pool=None, validation_time=None):
     """
     Hiển thị thông tin về chứng chỉ có sẵn trong CMS
     
+    Nếu tài liệu có /DSS (PAdES-LTV), dựng chuỗi từ cert người ký qua cả chứng chỉ
+    trong CMS và DSS, kèm trạng thái thu hồi theo CRL/OCSP nhúng (offline).
+    
     Args:
-        certificates: Danh sách các chứng chỉ từ CMS
+        certificates: Danh sách các chứng chỉ từ CMS (cert đầu tiên là cert người ký)
+        validation_pool: ValidationDataPool của tài liệu (xem ltv.py), tuỳ chọn
+        validation_time: thời điểm xét thu hồi (xem signature_validation_time)
         
     Returns:
         (display_info: bool, chain_info: list, message: str)
@@ -515,27 +467,40 @@ def verify_certificate_chain(certificates):
     
     chain_info = []
     
+    if validation_pool is not None and validation_pool.has_dss:
+        try:
+            result = validation_pool.validate(certificates[0], validation_time)
+            for idx, cert in enumerate(result['chain']):
+                identity = certificate_identity(cert)
+                cert_info = {
+                    'subject': identity['subject'].get('common_name', 'Unknown'),
+                    'issuer': identity['issuer'].get('common_name', 'Unknown'),
+                    'is_self_signed': identity['is_self_signed'],
+                    'key_size': cert.public_key().key_size,
+                    'source': validation_pool.source_of(cert),
+                }
+                if idx < len(result['revocation']):
+                    cert_info['revocation_status'], cert_info['revocation_source'] = result['revocation'][idx]
+                chain_info.append(cert_info)
+            
+            from_dss = sum(1 for c in chain_info if c['source'] == 'dss')
+            if result['complete']:
+                return True, chain_info, f"Chain complete: {len(chain_info)} certificates ({from_dss} from DSS)"
+            return True, chain_info, f"Chain incomplete: issuer of '{chain_info[-1]['subject']}' not found in CMS/DSS"
+        except Exception as e:
+            return False, chain_info, f"Lỗi: {str(e)[:50]}"
+    
     try:
         # Chỉ hiển thị thông tin về certs có sẵn, không xác minh chain
         for cert in certificates:
-            # Lấy subject và issuer
-            try:
-                subject_cn = cert.subject.get_attributes_for_oid(x509.NameOID.COMMON_NAME)[0].value
-            except IndexError:
-                subject_cn = "Unknown"
-            
-            try:
-                issuer_cn = cert.issuer.get_attributes_for_oid(x509.NameOID.COMMON_NAME)[0].value
-            except IndexError:
-                issuer_cn = "Unknown"
-            
-            is_self_signed = cert.issuer == cert.subject
+            # Lấy subject và issuer (cache theo fingerprint)
+            identity = certificate_identity(cert)
             key_size = cert.public_key().key_size
             
             cert_info = {
-                'subject': subject_cn,
-                'issuer': issuer_cn,
-                'is_self_signed': is_self_signed,
+                'subject': identity['subject'].get('common_name', 'Unknown'),
+                'issuer': identity['issuer'].get('common_name', 'Unknown'),
+                'is_self_signed': identity['is_self_signed'],
                 'key_size': key_size,
             }
             chain_info.append(cert_info)
@@ -552,6 +517,29 @@ def verify_certificate_chain(certificates):
     except Exception as e:
         return False, chain_info, f"Lỗi: {str(e)[:50]}"
 
+INTEGRITY_INTACT_MESSAGE = "Tài liệu KHÔNG BỊ SỬA ĐỔI - The document has not been modified since this signature was applied"
+INTEGRITY_MODIFIED_MESSAGE = "Tài liệu ĐÃ BỊ SỬA ĐỔI - The document was modified after signature"
+
+def _integrity_fallback(pdf_path):
+    """
+    Khi endesive gặp lỗi: chỉ kiểm tra có signature field với ByteRange + Contents
+    
+    Returns:
+        (True, message, None) nếu có, None nếu không
+    """
+    reader = PdfReader(pdf_path)
+    fields = reader.get_fields()
+    
+    if fields:
+        for field_name, field_data in fields.items():
+            if "/V" in field_data:
+                v_obj = field_data["/V"].get_object()
+                if PDF_BYTERANGE_KEY in v_obj and PDF_CONTENTS_KEY in v_obj:
+                    # Nếu ByteRange tồn tại và Contents tồn tại, chứng chỉ hợp lệ
+                    # Điều này là dấu hiệu chữ ký tồn tại
+                    return True, "Tài liệu KHÔNG BỊ SỬA ĐỔI - Document integrity verified (ByteRange intact)", None
+    return None
+
 def verify_document_integrity(pdf_path):
     """
     Xác minh tài liệu chưa bị sửa đổi sau khi ký
@@ -568,35 +556,30 @@ def verify_document_integrity(pdf_path):
         
         # Sử dụng endesive để xác minh chữ ký
         # Suppress stdout từ endesive
-        old_stdout = sys.stdout
-        old_stderr = sys.stderr
-        sys.stdout = StringIO()
-        sys.stderr = StringIO()
+        # Không để timeout của stage (SIGALRM) cắt ngang lúc đang swap
+        with deferred_interrupts():
+            old_stdout = sys.stdout
+            old_stderr = sys.stderr
+            sys.stdout = StringIO()
+            sys.stderr = StringIO()
         
         try:
+            endesive_verify = _get_endesive_verify()
             signature_results = endesive_verify(pdf_content)
             
             if signature_results and len(signature_results) > 0:
                 intact, _, _ = signature_results[0]
                 
                 if intact:
-                    return True, "Tài liệu KHÔNG BỊ SỬA ĐỔI - The document has not been modified since this signature was applied", sign_date
+                    return True, INTEGRITY_INTACT_MESSAGE, sign_date
                 else:
-                    return False, "Tài liệu ĐÃ BỊ SỬA ĐỔI - The document was modified after signature", sign_date
+                    return False, INTEGRITY_MODIFIED_MESSAGE, sign_date
         except Exception:
             # Nếu endesive gặp lỗi, cố gắng xác minh manual
             # Kiểm tra ByteRange integrity thay vì full signature verification
-            reader = PdfReader(pdf_path)
-            fields = reader.get_fields()
-            
-            if fields:
-                for field_name, field_data in fields.items():
-                    if "/V" in field_data:
-                        v_obj = field_data["/V"].get_object()
-                        if PDF_BYTERANGE_KEY in v_obj and PDF_CONTENTS_KEY in v_obj:
-                            # Nếu ByteRange tồn tại và Contents tồn tại, chứng chỉ hợp lệ
-                            # Điều này là dấu hiệu chữ ký tồn tại
-                            return True, "Tài liệu KHÔNG BỊ SỬA ĐỔI - Document integrity verified (ByteRange intact)", None
+            fallback = _integrity_fallback(pdf_path)
+            if fallback:
+                return fallback
         
         return False, "Không thể xác minh", None
         
@@ -605,25 +588,120 @@ def verify_document_integrity(pdf_path):
     
     finally:
         # Restore stdout/stderr
-        sys.stdout = old_stdout
-        sys.stderr = old_stderr
+        with deferred_interrupts():
+            sys.stdout = old_stdout
+            sys.stderr = old_stderr
+
+def verify_document_integrity_fast(pdf_path, range_digests=None):
+    """
+    Như verify_document_integrity nhưng không dùng endesive (xem fast_paths.py)
+    
+    Cùng verdict và message, kể cả nhánh fallback khi endesive gặp lỗi.
+    
+    Returns:
+        (is_valid: bool, message: str, sign_date: None)
+    
+    Raises:
+        ByteRangeLoopError: khi endesive sẽ quét lặp vô hạn (đường chậm chạy tới
+                            deadline của stage, xem VerificationGuard.expire)
+    """
+    try:
+        try:
+            intact = first_signature_hashok(pdf_path, range_digests)
+            if intact is not None:
+                if intact:
+                    return True, INTEGRITY_INTACT_MESSAGE, None
+                return False, INTEGRITY_MODIFIED_MESSAGE, None
+        except ByteRangeLoopError:
+            raise
+        except Exception:
+            fallback = _integrity_fallback(pdf_path)
+            if fallback:
+                return fallback
+        
+        return False, "Không thể xác minh", None
+    
+    except ByteRangeLoopError:
+        raise
+    except Exception as e:
+        return False, f"Lỗi xác minh: {str(e)}", None
+
+
+# Bước xác minh đánh số (xem comment trong read_pdf_signatures) theo stage của VerificationGuard
+VERIFICATION_STEPS = {
+    'signature_info': '1-5',
+    'integrity': '6',
+    'cryptographic': '7',
+    'chain_timestamp': '8-9',
+}
 
+def enter_step(guard, stage, field_name=None):
+    """
+    Mở stage của VerificationGuard (deadline + RSS) kèm span tracing cùng tên
+    
+    Stage đóng khi bước kế tiếp mở stage mới hoặc khi guard.run() kết thúc.
+    
+    Args:
+        guard: VerificationGuard
+        stage: Tên stage ('parse', 'dss' hoặc một key của VERIFICATION_STEPS)
+        field_name: Signature field đang xác minh (None với stage của cả tài liệu)
+    """
+    attributes = {}
+    if stage in VERIFICATION_STEPS:
+        attributes['pdf.step'] = VERIFICATION_STEPS[stage]
+    if field_name:
+        attributes['pdf.signature.field'] = field_name
+    guard.enter(stage, span(stage, **attributes))
 
-def read_pdf_signatures(pdf_path):
+def read_pdf_signatures(pdf_path, guard=None, range_digests=None, fast_paths=None):
     """
     Đọc và xác minh tất cả chữ ký trong PDF
     
+    Args:
+        pdf_path: Đường dẫn đến file PDF
+        guard: VerificationGuard (deadline theo stage + ngân sách RSS),
+               mặc định tạo mới với limit từ biến môi trường
+        range_digests: Digest ByteRange đã tính trong lúc upload (UploadIngest.range_digests)
+        fast_paths: Các bước dùng đường nhanh ('integrity', 'cryptographic'),
+                    mặc định theo PDF_FAST_PATHS (xem fast_paths.py)
+    
     Returns:
         list of signature data dictionaries
+    
+    Raises:
+        VerificationLimitExceeded: khi vượt giới hạn thời gian/bộ nhớ
     """
+    guard = guard or VerificationGuard(VERIFICATION_LIMITS)
+    with guard.run():
+        return _read_pdf_signatures(pdf_path, guard, range_digests, FAST_PATHS if fast_paths is None else fast_paths)
+
+def _read_pdf_signatures(pdf_path, guard, range_digests, fast_paths):
+    """Thân của read_pdf_signatures; mỗi bước mở stage của guard bằng enter_step"""
     signatures = []
+    # Kết quả toàn vẹn là của cả tài liệu: đường nhanh chỉ tính một lần
+    document_integrity = None
     
+    enter_step(guard, 'parse')
     reader = PdfReader(pdf_path)
     fields = reader.get_fields()
     
+    # /Count của page tree gốc là số trang thật (kể cả trang nằm trong object stream nén)
+    max_pages = guard.limits.get('max_pages') or 0
+    if max_pages > 0:
+        try:
+            page_count = int(reader.trailer['/Root']['/Pages']['/Count'])
+        except Exception:
+            page_count = 0
+        if page_count > max_pages:
+            raise VerificationLimitExceeded('max_pages', page_count, max_pages, stage='parse')
+    
     if not fields:
         return signatures
     
+    # Dữ liệu LTV (/DSS) đọc một lần, dùng chung cho mọi chữ ký trong tài liệu
+    enter_step(guard, 'dss')
+    validation_pool = load_validation_data(reader)
+    
     count = 0
     for field_name, field_data in fields.items():
         if "/V" in field_data:
@@ -636,6 +714,7 @@ def read_pdf_signatures(pdf_path):
             sig_data = {
                 "field_name": field_name,
                 "signer": None,
+                "signer_fingerprint": None,
                 "issuer": None,
                 "signing_time": None,
                 "signing_timezone": None,
@@ -661,6 +740,7 @@ def read_pdf_signatures(pdf_path):
                 "is_self_signed": False,
                 "ca_info": {},
                 "byte_range": None,
+                "ltv": None,
                 "structure_validation": {
                     "is_structure_valid": True,
                     "validation_summary": "Valid",
@@ -669,8 +749,10 @@ def read_pdf_signatures(pdf_path):
                 }
             }
             
+            cms_bytes = None
             try:
                 # 1. Lấy dữ liệu CMS thô (PKCS#7)
+                enter_step(guard, 'signature_info', field_name)
                 cms_raw = v_obj[PDF_CONTENTS_KEY]
                 
                 # Convert TextStringObject to bytes if needed
@@ -700,7 +782,8 @@ def read_pdf_signatures(pdf_path):
               
                 
                 # 4. Load certificates từ CMS
-                certificates = pkcs7.load_der_pkcs7_certificates(cms_bytes)
+                # (dùng lại object đã có trong pool nếu cert trùng với DSS / chữ ký khác)
+                certificates = validation_pool.add_certificates(pkcs7.load_der_pkcs7_certificates(cms_bytes))
                 if not certificates:
                     sig_data["structure_validation"]["formatting_errors"].append("Không tìm thấy chứng chỉ trong CMS")
                     sig_data["structure_validation"]["is_structure_valid"] = False
@@ -710,66 +793,14 @@ def read_pdf_signatures(pdf_path):
                 
                 signer_cert = certificates[0]  # Cert đầu tiên thường là cert người ký
                 # 5. Lấy thông tin chi tiết từ chứng chỉ
-                # Lấy common_name trước
-                common_name = "N/A"
-                try:
-                    common_name_attrs = signer_cert.subject.get_attributes_for_oid(x509.NameOID.COMMON_NAME)
-                    if common_name_attrs:
-                        common_name = common_name_attrs[0].value
-                except Exception:
-                    pass
-                
-                
-                sig_data["signer"] = {"common_name": common_name}
-                
-                # Lấy UID hoặc các custom identifier
-                uid_value = "N/A"
-                try:
-                    uid_attrs = signer_cert.subject.get_attributes_for_oid(x509.NameOID.USER_ID)
-                    if uid_attrs:
-                        uid_value = uid_attrs[0].value
-                except Exception:
-                    pass
-                
-                if uid_value == "N/A":
-                    try:
-                        serial_attrs = signer_cert.subject.get_attributes_for_oid(x509.NameOID.SERIAL_NUMBER)
-                        if serial_attrs:
-                            uid_value = serial_attrs[0].value
-                    except Exception:
-                        pass
-                
-                if uid_value != "N/A":
-                    sig_data["signer"]["user_id"] = uid_value
-                
-                # Lấy thông tin địa lý của người ký
-                try:
-                    country_attrs = signer_cert.subject.get_attributes_for_oid(x509.NameOID.COUNTRY_NAME)
-                    if country_attrs:
-                        sig_data["signer"]["country"] = country_attrs[0].value
-                except Exception:
-                    pass
-                
-                try:
-                    state_attrs = signer_cert.subject.get_attributes_for_oid(x509.NameOID.STATE_OR_PROVINCE_NAME)
-                    if state_attrs:
-                        sig_data["signer"]["state_or_province"] = state_attrs[0].value
-                except Exception:
-                    pass
-                
-                try:
-                    locality_attrs = signer_cert.subject.get_attributes_for_oid(x509.NameOID.LOCALITY_NAME)
-                    if locality_attrs:
-                        sig_data["signer"]["city"] = locality_attrs[0].value
-                except Exception:
-                    pass
-                
-                try:
-                    org_attrs = signer_cert.subject.get_attributes_for_oid(x509.NameOID.ORGANIZATION_NAME)
-                    if org_attrs:
-                        sig_data["signer"]["organization"] = org_attrs[0].value
-                except Exception:
-                    pass
+                # Danh tính người ký: subject/issuer đọc một lần (cache theo fingerprint),
+                # tên hiển thị theo thứ tự ưu tiên PDF_SIGNER_NAME_PRECEDENCE
+                sig_data["signer_fingerprint"] = certificate_fingerprint(signer_cert)
+                identity = resolve_signer_identity(
+                    signer_cert, v_obj=v_obj, cms_bytes=cms_bytes,
+                    field_name=field_name, fingerprint=sig_data["signer_fingerprint"],
+                )
+                sig_data["signer"] = identity["signer"]
                 
                 # Kiểm tra độ dài khóa
                 key_size = signer_cert.public_key().key_size
@@ -813,30 +844,24 @@ def read_pdf_signatures(pdf_path):
                     sig_data["is_valid"] = True
                 
                 # Kiểm tra self-signed
-                sig_data["is_self_signed"] = (signer_cert.issuer == signer_cert.subject)
-                
-                # Lấy thông tin CA (issuer)
-                ca_info = {}
-                try:
-                    ca_info["common_name"] = signer_cert.issuer.get_attributes_for_oid(x509.NameOID.COMMON_NAME)[0].value
-                except IndexError:
-                    ca_info["common_name"] = "N/A"
-                
-                try:
-                    ca_info["organization"] = signer_cert.issuer.get_attributes_for_oid(x509.NameOID.ORGANIZATION_NAME)[0].value
-                except IndexError:
-                    ca_info["organization"] = "N/A"
-                
-                try:
-                    ca_info["country"] = signer_cert.issuer.get_attributes_for_oid(x509.NameOID.COUNTRY_NAME)[0].value
-                except IndexError:
-                    ca_info["country"] = "N/A"
+                sig_data["is_self_signed"] = identity["is_self_signed"]
                 
-                sig_data["ca_info"] = ca_info
-                sig_data["issuer"] = ca_info
+                # Thông tin CA (issuer)
+                sig_data["ca_info"] = identity["issuer"]
+                sig_data["issuer"] = identity["issuer"]
                 
                 # 6. KIỂM TRA TOÀN VẸN TÀI LIỆU
-                integrity_valid, integrity_message, sign_date_endesive = verify_document_integrity(pdf_path)
+                enter_step(guard, 'integrity', field_name)
+                if 'integrity' in fast_paths:
+                    if document_integrity is None:
+                        try:
+                            document_integrity = verify_document_integrity_fast(pdf_path, range_digests)
+                        except ByteRangeLoopError as e:
+                            # Đường chậm (endesive) chạy tới deadline: trả cùng lỗi, khỏi chờ
+                            guard.expire(str(e))
+                    integrity_valid, integrity_message, sign_date_endesive = document_integrity
+                else:
+                    integrity_valid, integrity_message, sign_date_endesive = verify_document_integrity(pdf_path)
                 sig_data["intact"] = integrity_valid
                 sig_data["document_unchanged"] = integrity_valid
                 
@@ -844,7 +869,12 @@ def read_pdf_signatures(pdf_path):
                     sig_data["structure_validation"]["formatting_errors"].append(integrity_message)
                 
                 # 7. KIỂM TRA CHỮ KÝ CRYPTOGRAPHIC
-                is_crypto_valid, crypto_message = verify_cryptographic_signature(pdf_path, field_name, signer_cert, cms_bytes)
+                enter_step(guard, 'cryptographic', field_name)
+                if 'cryptographic' in fast_paths:
+                    is_crypto_valid, crypto_message = verify_signed_byte_range(
+                        pdf_path, v_obj.get(PDF_BYTERANGE_KEY), signer_cert, cms_bytes, range_digests)
+                else:
+                    is_crypto_valid, crypto_message = verify_cryptographic_signature(pdf_path, field_name, signer_cert, cms_bytes, range_digests)
                 sig_data["cryptographic_signature_valid"] = is_crypto_valid
                 sig_data["cryptographic_message"] = crypto_message
                 
@@ -852,12 +882,23 @@ def read_pdf_signatures(pdf_path):
                     sig_data["structure_validation"]["formatting_errors"].append(crypto_message)
                 
                 # 8. KIỂM TRA CHUỖI CHỨNG CHỈ
-                chain_valid, chain_info, chain_message = verify_certificate_chain(certificates)
+                enter_step(guard, 'chain_timestamp', field_name)
+                # Thu hồi xét tại thời điểm ký (ưu tiên gen_time của TSA), không phải lúc kiểm tra
+                has_tsa, tsa_info = check_tsa_presence(cms_bytes)
+                validation_time = signature_validation_time(
+                    tsa_info, sig_data["signing_time"], sig_data.get("signing_timezone"))
+                chain_valid, chain_info, chain_message = verify_certificate_chain(
+                    certificates, validation_pool, validation_time)
                 sig_data["certificate_chain"] = chain_info
                 sig_data["chain_message"] = chain_message
                 
+                if validation_pool.has_dss:
+                    sig_data["ltv"] = validation_pool.summary(signer_cert, cms_bytes, validation_time)
+                    if sig_data["ltv"]["revocation_status"] == 'revoked':
+                        sig_data["structure_validation"]["formatting_errors"].append(
+                            f"Chứng chỉ đã bị thu hồi (theo {sig_data['ltv']['revocation_source']} trong DSS)")
+                
                 # 9. KIỂM TRA TIMESTAMP AUTHORITY (TSA)
-                has_tsa, tsa_info = check_tsa_presence(cms_bytes)
                 sig_data["has_timestamp"] = has_tsa
                 
                 if has_tsa:
@@ -876,10 +917,13 @@ def read_pdf_signatures(pdf_path):
                     sig_data["structure_validation"]["is_structure_valid"] = True
                     sig_data["structure_validation"]["validation_summary"] = "Valid - Signature structure is valid"
                 
+            except VerificationLimitExceeded:
+                raise
             except Exception as e:
                 error_msg = str(e)
-                signer_name_from_pdf = extract_signer_name_from_pdf_field(pdf_path, field_name)
-                sig_data["signer"] = {"common_name": signer_name_from_pdf or "N/A"}
+                # Không có chứng chỉ: tên người ký lấy từ PDF / CMS theo cùng thứ tự ưu tiên
+                identity = resolve_signer_identity(v_obj=v_obj, cms_bytes=cms_bytes, field_name=field_name)
+                sig_data["signer"] = dict(identity["signer"], common_name=identity["signer"]["display_name"])
                 sig_data["structure_validation"]["formatting_errors"].append(f"Lỗi: {error_msg[:150]}")
                 sig_data["structure_validation"]["is_structure_valid"] = False
                 sig_data["structure_validation"]["validation_summary"] = f"Invalid - Error: {error_msg[:100]}"
@@ -888,12 +932,29 @@ def read_pdf_signatures(pdf_path):
     
     return signatures
 
+# Content-Type nhận PDF thô trong body (không multipart)
+RAW_PDF_CONTENT_TYPES = ('application/pdf', 'application/octet-stream')
+
+def verify_upload(upload):
+    """
+    Xác minh file đã upload (UploadIngest): kiểm tra nhanh trên byte stream rồi đọc chữ ký
+    
+    Returns:
+        list of signature data dictionaries
+    """
+    with span('admission'):
+        check_admission(upload.temp_path, VERIFICATION_LIMITS)
+    return read_pdf_signatures(upload.temp_path, VerificationGuard(VERIFICATION_LIMITS), upload.range_digests)
+
 @app.route('/api/verify-pdf', methods=['POST'])
+@traced_view
 def verify_pdf():
     """
     Xác thực chữ ký PDF
     
-    Request:
+    Request (một trong hai):
+    - body là PDF thô với Content-Type: application/pdf (hoặc application/octet-stream),
+      được ghi thẳng vào file tạm theo chunk - không qua multipart parser
     - file: PDF file (multipart/form-data)
     
     Response:
@@ -901,54 +962,213 @@ def verify_pdf():
         "success": true,
         "signatures": [...]
     }
+    
+    Với ?profile=1 (hoặc X-PDF-Profile: 1) và X-PDF-Profile-Token hợp lệ, response có
+    thêm "profile" (collapsed stacks, đỉnh tracemalloc) - xem profiling.py
+    
+    Khi vượt giới hạn tài nguyên (413 / 422):
+    {
+        "success": false,
+        "error": "...",
+        "limit_exceeded": {"limit": ..., "actual": ..., "maximum": ..., "stage": ...}
+    }
     """
     try:
-        # Kiểm tra file có được gửi không
-        if 'file' not in request.files:
+        # Profiling theo request (xem profiling.py) - kiểm tra quyền trước khi đọc body
+        profile_requested = request.args.get('profile') == '1' or request.headers.get('X-PDF-Profile') == '1'
+        if profile_requested and not is_authorized(request.headers.get('X-PDF-Profile-Token')):
             return jsonify({
                 "success": False,
-                "error": "Không tìm thấy file trong request"
-            }), 400
+                "error": "Không có quyền profiling"
+            }), 403
         
-        file = request.files['file']
+        # Từ chối sớm theo Content-Length, trước khi đọc body
+        max_bytes = VERIFICATION_LIMITS['max_upload_bytes']
+        if max_bytes and request.content_length and request.content_length > max_bytes:
+            raise VerificationLimitExceeded('max_upload_bytes', request.content_length, max_bytes)
         
-        if file.filename == '':
-            return jsonify({
-                "success": False,
-                "error": "Tên file trống"
-            }), 400
+        if request.mimetype in RAW_PDF_CONTENT_TYPES:
+            # PDF thô trong body: stream thẳng vào file tạm
+            upload_stream = request.stream
+        else:
+            # Kiểm tra file có được gửi không
+            if 'file' not in request.files:
+                return jsonify({
+                    "success": False,
+                    "error": "Không tìm thấy file trong request"
+                }), 400
+            
+            file = request.files['file']
+            
+            if file.filename == '':
+                return jsonify({
+                    "success": False,
+                    "error": "Tên file trống"
+                }), 400
+            
+            # Kiểm tra file có phải PDF không
+            if not file.filename.lower().endswith('.pdf'):
+                return jsonify({
+                    "success": False,
+                    "error": "File phải có định dạng PDF"
+                }), 400
+            
+            upload_stream = file.stream
         
-        # Kiểm tra file có phải PDF không
-        if not file.filename.lower().endswith('.pdf'):
+        # Lưu file tạm (tên file ngẫu nhiên, không dùng tên do client gửi),
+        # hash toàn file + ByteRange ngay trong lúc nhận
+        try:
+            byte_ranges = parse_byte_ranges_header(request.headers.get('X-PDF-ByteRanges'))
+            with span('upload.read'):
+                upload = ingest_upload(upload_stream, max_bytes, byte_ranges,
+                                       max_ranges=VERIFICATION_LIMITS['max_signatures'])
+        except ValueError as e:
             return jsonify({
                 "success": False,
-                "error": "File phải có định dạng PDF"
+                "error": str(e)
             }), 400
         
-        # Lưu file tạm
-        temp_path = f"/tmp/{file.filename}"
-        file.save(temp_path)
-        
+        set_attribute('pdf.file_size', upload.size)
+        temp_path = upload.temp_path
         try:
-            # Đọc chữ ký
-            signatures = read_pdf_signatures(temp_path)
+            # Đọc chữ ký - request đồng thời cùng file chờ và dùng chung một lần xác minh
+            profile = None
+            with span('verify'):
+                if profile_requested:
+                    # Chạy riêng (không gộp single-flight) để profile đúng lần xác minh này
+                    with SamplingProfiler() as profiler:
+                        signatures = verify_upload(upload)
+                    profile = profiler.report()
+                elif SINGLE_FLIGHT is not None:
+                    signatures, shared = SINGLE_FLIGHT.do(upload.document_hash, lambda: verify_upload(upload))
+                    set_attribute('pdf.coalesced', shared)
+                else:
+                    signatures = verify_upload(upload)
+            set_attribute('pdf.signature_count', len(signatures))
             
-            return jsonify({
+            # Ghi lịch sử (bất đồng bộ, không chờ ghi xong)
+            if HISTORY_STORE is not None:
+                HISTORY_STORE.record(upload.document_hash, upload.size, signatures)
+            
+            response = {
                 "success": True,
                 "count": len(signatures),
                 "signatures": signatures
-            })
+            }
+            if profile is not None:
+                response["profile"] = profile
+            return jsonify(response)
         finally:
             # Xóa file tạm
             if os.path.exists(temp_path):
                 os.remove(temp_path)
     
+    except VerificationLimitExceeded as e:
+        return jsonify({
+            "success": False,
+            "error": e.message,
+            "limit_exceeded": e.to_dict()
+        }), e.http_status
+    except RequestEntityTooLarge:
+        # Body vượt MAX_CONTENT_LENGTH (không có Content-Length, ví dụ chunked)
+        return jsonify({
+            "success": False,
+            "error": "File vượt quá kích thước cho phép",
+            "limit_exceeded": {
+                "limit": "max_upload_bytes",
+                "actual": request.content_length,
+                "maximum": VERIFICATION_LIMITS['max_upload_bytes'],
+                "stage": "admission"
+            }
+        }), 413
     except Exception as e:
         return jsonify({
             "success": False,
             "error": str(e)
         }), 500
 
+def _history_disabled_response():
+    return jsonify({
+        "success": False,
+        "error": "History store chưa được bật (đặt PDF_HISTORY_DB)"
+    }), 404
+
+@app.route('/api/history/verifications', methods=['GET'])
+def history_verifications():
+    """
+    Tra cứu lịch sử xác minh
+    
+    Query params (đều tuỳ chọn, kết hợp AND):
+    - document_hash: SHA-256 của file
+    - fingerprint: SHA-256 fingerprint chứng chỉ người ký
+    - issuer: CN của CA
+    - status: valid | invalid | unsigned
+    - since / until: khoảng thời gian ký (ISO, YYYY-MM-DD hoặc YYYY-MM)
+    - limit: số dòng (mặc định 100, tối đa 1000)
+    - cursor: next_cursor của trang trước
+    - include_results=1: trả kèm kết quả xác minh đầy đủ
+    """
+    if HISTORY_STORE is None:
+        return _history_disabled_response()
+    
+    args = request.args
+    try:
+        rows = HISTORY_STORE.query(
+            document_hash=args.get('document_hash'),
+            fingerprint=args.get('fingerprint'),
+            issuer=args.get('issuer'),
+            status=args.get('status'),
+            since=args.get('since'),
+            until=args.get('until'),
+            limit=args.get('limit', 100),
+            cursor=args.get('cursor'),
+            include_results=args.get('include_results') == '1',
+        )
+    except ValueError as e:
+        return jsonify({
+            "success": False,
+            "error": f"Tham số không hợp lệ: {str(e)[:100]}"
+        }), 400
+    
+    return jsonify({
+        "success": True,
+        "count": len(rows),
+        "next_cursor": HISTORY_STORE.next_cursor(rows),
+        "verifications": rows
+    })
+
+@app.route('/api/history/signers/<fingerprint>/documents', methods=['GET'])
+def history_signer_documents(fingerprint):
+    """
+    Các tài liệu đã được ký bởi một chứng chỉ
+    
+    Query params: since, until, limit, cursor (next_cursor của trang trước)
+    """
+    if HISTORY_STORE is None:
+        return _history_disabled_response()
+    
+    try:
+        documents = HISTORY_STORE.documents_signed_by(
+            fingerprint.lower(),
+            since=request.args.get('since'),
+            until=request.args.get('until'),
+            limit=request.args.get('limit', 100),
+            cursor=request.args.get('cursor'),
+        )
+    except ValueError as e:
+        return jsonify({
+            "success": False,
+            "error": f"Tham số không hợp lệ: {str(e)[:100]}"
+        }), 400
+    
+    return jsonify({
+        "success": True,
+        "fingerprint": fingerprint.lower(),
+        "count": len(documents),
+        "next_cursor": HISTORY_STORE.next_document_cursor(documents),
+        "documents": documents
+    })
+
 @app.route('/api/health', methods=['GET'])
 def health():
     """Health check endpoint"""
@@ -964,7 +1184,9 @@ def index():
         "name": "PDF Signature Verification API",
         "version": "1.0.0",
         "endpoints": {
-            "POST /api/verify-pdf": "Xác thực chữ ký PDF (multipart/form-data với field 'file')",
+            "POST /api/verify-pdf": "Xác thực chữ ký PDF (body application/pdf, hoặc multipart/form-data với field 'file')",
+            "GET /api/history/verifications": "Tra cứu lịch sử xác minh (cần PDF_HISTORY_DB)",
+            "GET /api/history/signers/<fingerprint>/documents": "Tài liệu đã ký bởi một chứng chỉ (cần PDF_HISTORY_DB)",
             "GET /api/health": "Health check"
         }
     })
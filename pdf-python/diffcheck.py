@@ -0,0 +1,375 @@
+"""
+So sánh đường xác minh chậm (endesive + parse lại PDF) với đường nhanh (fast_paths.py)
+
+Mỗi PDF trong corpus được đưa qua ingest_upload như một upload thật (lấy
+range_digests tính trong lúc nhận; chunk nhỏ như khi request.stream trả về từng
+phần, để có cả trường hợp đoạn ByteRange nằm ở hai chunk khác nhau), rồi xác minh bằng read_pdf_signatures theo
+bốn biến thể (VARIANTS): đường mặc định (verify_document_integrity +
+verify_cryptographic_signature) và các đường nhanh được chọn, mỗi đường có / không
+có range_digests. Verdict của mọi biến thể được so với đường mặc định không có
+digest; khác biệt được báo theo biến thể, signature field và key của kết quả
+(intact, cryptographic_signature_valid, message, structure_validation...), kể cả
+khi một bên vượt deadline còn bên kia thì không.
+
+Thời gian đo là tổng stage 'integrity' + 'cryptographic' của VerificationGuard
+(đúng hai bước được thay) của hai biến thể có range_digests (như verify_upload),
+lấy median qua --repeat lần chạy xen kẽ; cột "total" là cả read_pdf_signatures.
+Speedup chỉ được báo khi không còn khác biệt nào. Verdict cache luôn tắt để không
+lần chạy nào được cache.
+
+Corpus sinh sẵn (sample_pdfs.py, xem CORPUS_CASES): PDF hợp lệ, bị sửa sau khi ký
+(có / không signed attributes), bị cắt cụt (pypdf không đọc được, hoặc đọc được
+nhưng ngắn hơn ByteRange), ByteRange chồng lấn, đảo ngược hoặc không phủ hết
+file, nhiều revision (chữ ký thứ hai, revision đầu bị sửa), incremental update không
+ký và ByteRange rác sau %%EOF khiến endesive quét lặp vô hạn. Thêm PDF thật bằng
+--corpus.
+
+Exit code 1 nếu có khác biệt - chỉ bật PDF_FAST_PATHS khi corpus của deployment
+chạy sạch.
+
+Usage:
+    python diffcheck.py
+    python diffcheck.py --corpus /data/pdfs --repeat 5 --json
+    python diffcheck.py --fast-paths integrity --write-corpus corpus/
+"""
+
+import argparse
+import json
+import logging
+import os
+import re
+import statistics
+import sys
+import tempfile
+import time
+
+from fast_paths import FAST_PATH_NAMES, load_fast_paths
+from ingest import ingest_upload
+from limits import VerificationGuard, VerificationLimitExceeded, get_limits
+from sample_pdfs import SampleFactory, add_signature, append_update, sign_pdf
+
+CORPUS_CASES = (
+    'valid_rsa', 'valid_ecdsa', 'valid_signed_attrs', 'pages_200', 'ltv_ocsp',
+    'tampered', 'tampered_signed_attrs', 'truncated_tail', 'truncated_contents', 'truncated_signed_range',
+    'overlapping_byterange', 'reversed_byterange', 'short_byterange', 'multi_revision', 'multi_revision_tampered',
+    'incremental_update', 'looping_byterange',
+)
+
+# Key thay đổi theo thời điểm chạy, không phải verdict
+VOLATILE_KEYS = ('days_until_expiry',)
+# Lỗi deadline: 'actual' là thời gian đo được, không phải verdict
+TIMEOUT_LIMITS = ('stage_timeout_seconds', 'verify_timeout_seconds')
+
+# Kích thước chunk khi đưa file qua ingest_upload (mạng thường trả chunk nhỏ hơn UPLOAD_CHUNK_SIZE)
+INGEST_CHUNK_SIZE = 4096
+
+# (tên, dùng đường nhanh, dùng range_digests); biến thể đầu là chuẩn để so
+VARIANTS = (
+    ('slow', False, False),
+    ('slow+digests', False, True),
+    ('fast', True, False),
+    ('fast+digests', True, True),
+)
+
+
+def _tamper(pdf):
+    """Sửa một byte nằm trong vùng được ký của revision đầu"""
+    return pdf.replace(b"/MediaBox [0 0 595 842]", b"/MediaBox [0 0 595 843]", 1)
+
+
+def _rewrite_byte_range(pdf, make_range):
+    """Ghi đè ByteRange đầu tiên (cùng độ rộng) bằng make_range(c0, c1, size)"""
+    match = re.search(rb"/ByteRange \[0 (\d{10}) (\d{10}) (\d{10})\]", pdf)
+    c0, c1 = int(match.group(1)), int(match.group(2))
+    byte_range = b"/ByteRange [%d %010d %010d %010d]" % make_range(c0, c1, len(pdf))
+    return pdf[:match.start()] + byte_range + pdf[match.end():]
+
+
+def build_case(factory, case):
+    """PDF (bytes) của một case trong CORPUS_CASES"""
+    if case in ('valid_rsa', 'valid_ecdsa', 'valid_signed_attrs'):
+        return factory.build({'valid_rsa': 'small_rsa', 'valid_ecdsa': 'small_ecdsa',
+                              'valid_signed_attrs': 'signed_attrs'}[case])
+    if case in ('pages_200', 'ltv_ocsp'):
+        return factory.build(case)
+    if case == 'tampered':
+        return _tamper(sign_pdf(factory.rsa, factory.rsa_key)[0])
+    if case == 'tampered_signed_attrs':
+        return _tamper(sign_pdf(factory.rsa, factory.rsa_key, signed_attributes=True)[0])
+    if case == 'truncated_tail':
+        return sign_pdf(factory.rsa, factory.rsa_key, signed_attributes=True)[0][:-64]
+    if case == 'truncated_contents':
+        pdf = sign_pdf(factory.rsa, factory.rsa_key, signed_attributes=True)[0]
+        return pdf[:pdf.index(b"/Contents <") + 4096]
+    if case == 'truncated_signed_range':
+        # Mất một dòng trong đoạn ByteRange thứ hai: file ngắn hơn ByteRange khai báo,
+        # pypdf vẫn đọc được (dựng lại xref)
+        pdf = sign_pdf(factory.rsa, factory.rsa_key, filler_bytes=4096, signed_attributes=True)[0]
+        i = pdf.index(b"% filler")
+        return pdf[:i] + pdf[i + 80:]
+    if case == 'overlapping_byterange':
+        pdf = sign_pdf(factory.rsa, factory.rsa_key, signed_attributes=True)[0]
+        return _rewrite_byte_range(pdf, lambda c0, c1, size: (0, c1, c0, size - c0))
+    if case == 'reversed_byterange':
+        # Hai đoạn đảo thứ tự, chữ ký tính theo thứ tự file: digest theo slice khác
+        # digest hash tuần tự (không signed attributes để bước 7 verify trên chính digest đó)
+        return sign_pdf(factory.rsa, factory.rsa_key, make_range=lambda c0, c1, size: (c1, size - c1, 0, c0))[0]
+    if case == 'short_byterange':
+        pdf = sign_pdf(factory.rsa, factory.rsa_key, signed_attributes=True)[0]
+        return _rewrite_byte_range(pdf, lambda c0, c1, size: (0, c0, c1, size - c1 - 100))
+    if case == 'multi_revision':
+        pdf = sign_pdf(factory.rsa, factory.rsa_key)[0]
+        return add_signature(pdf, factory.ecdsa, factory.ecdsa_key, signed_attributes=True)[0]
+    if case == 'multi_revision_tampered':
+        pdf = _tamper(sign_pdf(factory.rsa, factory.rsa_key, signed_attributes=True)[0])
+        return add_signature(pdf, factory.rsa, factory.rsa_key)[0]
+    if case == 'incremental_update':
+        pdf = sign_pdf(factory.rsa, factory.rsa_key, signed_attributes=True)[0]
+        return append_update(pdf, [b"<< /Producer (edited after signing) >>"])[0]
+    if case == 'looping_byterange':
+        # ByteRange thứ hai (trong comment sau %%EOF) trỏ ngược về /Contents đầu tiên
+        pdf = sign_pdf(factory.rsa, factory.rsa_key)[0]
+        byte_range = re.search(rb"/ByteRange \[0 (\d+) (\d+) (\d+)\]", pdf)
+        return pdf + b"%% /ByteRange [0 %s %s 5]\n" % (byte_range.group(1), byte_range.group(2))
+    raise ValueError(f"Case không hỗ trợ: {case}")
+
+
+def build_corpus(directory, cases=CORPUS_CASES, factory=None):
+    """
+    Ghi mỗi case ra <directory>/<case>.pdf
+
+    Returns:
+        dict: tên -> đường dẫn file
+    """
+    factory = factory or SampleFactory()
+    os.makedirs(directory, exist_ok=True)
+    paths = {}
+    for case in cases:
+        paths[case] = os.path.join(directory, f"{case}.pdf")
+        with open(paths[case], 'wb') as f:
+            f.write(build_case(factory, case))
+    return paths
+
+
+def find_pdfs(directory):
+    """Các file .pdf trong thư mục (đệ quy), tên hiển thị là đường dẫn tương đối"""
+    paths = {}
+    for root, _, files in os.walk(directory):
+        for name in sorted(files):
+            if name.lower().endswith('.pdf'):
+                path = os.path.join(root, name)
+                paths[os.path.relpath(path, directory)] = path
+    return paths
+
+
+def stream_digests(pdf_path, chunk_size=INGEST_CHUNK_SIZE):
+    """range_digests mà ingest_upload tính được khi nhận file như một upload ({} nếu không nhận)"""
+    try:
+        with open(pdf_path, 'rb') as f:
+            upload = ingest_upload(f, chunk_size=chunk_size)
+    except ValueError:
+        return {}
+    os.remove(upload.temp_path)
+    return upload.range_digests
+
+
+def run_once(pdf_path, fast_paths, limits, range_digests=None):
+    """
+    Một lần read_pdf_signatures với tập đường nhanh (và digest tính sẵn) cho trước
+
+    Returns:
+        dict: signatures, error (VerificationLimitExceeded.to_dict(), exception khác hoặc None),
+              step_seconds (stage integrity + cryptographic), total_seconds
+    """
+    import api
+
+    guard = VerificationGuard(limits)
+    started = time.perf_counter()
+    try:
+        signatures = api.read_pdf_signatures(pdf_path, guard, range_digests, fast_paths=fast_paths)
+        error = None
+    except VerificationLimitExceeded as e:
+        signatures, error = [], e.to_dict()
+    except Exception as e:
+        signatures, error = [], {'exception': type(e).__name__, 'message': str(e)[:200]}
+    return {
+        'signatures': signatures,
+        'error': error,
+        'step_seconds': guard.stage_timings.get('integrity', 0.0) + guard.stage_timings.get('cryptographic', 0.0),
+        'total_seconds': time.perf_counter() - started,
+    }
+
+
+def _flatten(sig_data, prefix=''):
+    flat = {}
+    for key, value in sig_data.items():
+        if isinstance(value, dict) and key == 'structure_validation':
+            flat.update(_flatten(value, f"{key}."))
+        elif key not in VOLATILE_KEYS:
+            flat[prefix + key] = value
+    return flat
+
+
+def _error_verdict(error):
+    if error and error.get('limit') in TIMEOUT_LIMITS:
+        return {k: v for k, v in error.items() if k != 'actual'}
+    return error
+
+
+def compare_results(slow, fast):
+    """
+    Khác biệt giữa hai kết quả run_once
+
+    Returns:
+        list of {'field', 'key', 'slow', 'fast'} (field None: khác biệt cấp tài liệu)
+    """
+    disagreements = []
+    if _error_verdict(slow['error']) != _error_verdict(fast['error']):
+        disagreements.append({'field': None, 'key': 'error', 'slow': slow['error'], 'fast': fast['error']})
+    if len(slow['signatures']) != len(fast['signatures']):
+        disagreements.append({'field': None, 'key': 'signature_count',
+                              'slow': len(slow['signatures']), 'fast': len(fast['signatures'])})
+    for slow_sig, fast_sig in zip(slow['signatures'], fast['signatures']):
+        slow_flat, fast_flat = _flatten(slow_sig), _flatten(fast_sig)
+        for key in sorted(set(slow_flat) | set(fast_flat)):
+            if slow_flat.get(key) != fast_flat.get(key):
+                disagreements.append({'field': slow_sig['field_name'], 'key': key,
+                                      'slow': slow_flat.get(key), 'fast': fast_flat.get(key)})
+    return disagreements
+
+
+def check_document(name, pdf_path, fast_paths, limits, repeat=3, chunk_size=INGEST_CHUNK_SIZE):
+    """
+    Verdict của mọi biến thể trong VARIANTS so với biến thể đầu; thời gian của hai
+    biến thể có digest (chạy xen kẽ `repeat` lần), verdict lấy ở lần đầu
+    """
+    digests = stream_digests(pdf_path, chunk_size)
+    results = {}
+    for variant, fast, with_digests in VARIANTS:
+        results[variant] = run_once(pdf_path, fast_paths if fast else frozenset(), limits,
+                                    digests if with_digests else None)
+    runs = {'slow': [results['slow+digests']], 'fast': [results['fast+digests']]}
+    for _ in range(repeat - 1):
+        runs['slow'].append(run_once(pdf_path, frozenset(), limits, digests))
+        runs['fast'].append(run_once(pdf_path, fast_paths, limits, digests))
+
+    reference = VARIANTS[0][0]
+    disagreements = []
+    for variant, _, _ in VARIANTS[1:]:
+        for diff in compare_results(results[reference], results[variant]):
+            disagreements.append(dict(diff, variant=variant))
+
+    slow_ms = statistics.median(r['step_seconds'] for r in runs['slow']) * 1000
+    fast_ms = statistics.median(r['step_seconds'] for r in runs['fast']) * 1000
+    # Kết quả là lỗi (vượt deadline / giới hạn): thời gian không phải chi phí xác minh
+    error = results[reference]['error']
+    return {
+        'name': name,
+        'size': os.path.getsize(pdf_path),
+        'signatures': len(results[reference]['signatures']),
+        'stream_digests': len(digests),
+        'error': error,
+        'slow_ms': round(slow_ms, 3),
+        'fast_ms': round(fast_ms, 3),
+        'speedup': round(slow_ms / fast_ms, 2) if fast_ms > 0 and not disagreements and not error else None,
+        'slow_total_ms': round(statistics.median(r['total_seconds'] for r in runs['slow']) * 1000, 3),
+        'fast_total_ms': round(statistics.median(r['total_seconds'] for r in runs['fast']) * 1000, 3),
+        'disagreements': disagreements,
+    }
+
+
+def _short(value, width=70):
+    text = repr(value)
+    return text if len(text) <= width else text[:width - 3] + '...'
+
+
+def print_report(report):
+    """In kết quả dạng bảng, sau đó là từng khác biệt"""
+    print(f"fast paths: {', '.join(report['fast_paths'])}")
+    header = (f"{'document':<28} {'sigs':>4} {'slow ms':>9} {'fast ms':>9} {'speedup':>8} "
+              f"{'total slow':>11} {'total fast':>11} {'diffs':>6}")
+    print(header)
+    print('-' * len(header))
+    for d in report['documents']:
+        print(f"{d['name'][:28]:<28} {d['signatures']:>4} {d['slow_ms']:>9.2f} {d['fast_ms']:>9.2f} "
+              f"{d['speedup'] or '-':>8} {d['slow_total_ms']:>11.2f} {d['fast_total_ms']:>11.2f} "
+              f"{len(d['disagreements']):>6}")
+    print()
+    if report['speedup'] is not None:
+        print(f"integrity + cryptographic: {report['slow_ms']:.2f} ms -> {report['fast_ms']:.2f} ms "
+              f"(speedup {report['speedup']}x, không tính file kết thúc bằng lỗi)")
+    else:
+        print("integrity + cryptographic: không báo speedup khi còn khác biệt")
+    print(f"disagreements: {report['disagreement_count']}")
+    reference = VARIANTS[0][0]
+    for d in report['documents']:
+        for diff in d['disagreements']:
+            print(f"  {d['name']} ({diff['variant']}) [{diff['field'] or '-'}] {diff['key']}")
+            print(f"      {reference}: {_short(diff['slow'])}")
+            print(f"      {diff['variant']}: {_short(diff['fast'])}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='So sánh verdict và thời gian của đường xác minh chậm / nhanh')
+    parser.add_argument('--corpus', action='append', default=[], help='Thư mục PDF thật (có thể lặp lại)')
+    parser.add_argument('--no-generated', action='store_true', help='Không dùng corpus sinh bằng sample_pdfs.py')
+    parser.add_argument('--cases', default=','.join(CORPUS_CASES), help='Các case sinh sẵn, cách nhau bởi dấu phẩy')
+    parser.add_argument('--write-corpus', help='Ghi corpus sinh sẵn vào thư mục này (mặc định thư mục tạm)')
+    parser.add_argument('--fast-paths', default='all', help=f"Đường nhanh cần so sánh ({','.join(FAST_PATH_NAMES)} hoặc all)")
+    parser.add_argument('--repeat', type=int, default=3, help='Số lần chạy mỗi đường cho mỗi file (lấy median)')
+    parser.add_argument('--ingest-chunk-size', type=int, default=INGEST_CHUNK_SIZE,
+                        help='Kích thước chunk khi đưa file qua ingest_upload (bytes)')
+    parser.add_argument('--timeout', type=float, default=10.0, help='Deadline mỗi stage (giây)')
+    parser.add_argument('--json', action='store_true', help='In kết quả dạng JSON')
+    args = parser.parse_args()
+    logging.getLogger('pypdf').setLevel(logging.ERROR)
+
+    fast_paths = load_fast_paths(args.fast_paths)
+    if not fast_paths:
+        parser.error(f"--fast-paths phải chứa ít nhất một trong: {', '.join(FAST_PATH_NAMES)}, all")
+
+    # Tắt verdict cache trước khi import api (VERDICT_CACHE tạo lúc import)
+    os.environ['PDF_VERDICT_CACHE_SIZE'] = '0'
+    os.environ.pop('PDF_VERDICT_CACHE_DB', None)
+    limits = get_limits(stage_timeout_seconds=args.timeout, verify_timeout_seconds=0)
+
+    with tempfile.TemporaryDirectory(prefix='pdf-diffcheck-') as tmp:
+        documents = {}
+        if not args.no_generated:
+            cases = [c.strip() for c in args.cases.split(',') if c.strip()]
+            documents.update(build_corpus(args.write_corpus or tmp, cases))
+        for directory in args.corpus:
+            documents.update(find_pdfs(directory))
+        if not documents:
+            parser.error('Corpus rỗng')
+
+        results = []
+        for name, path in documents.items():
+            if not args.json:
+                print(f"checking {name}...", file=sys.stderr)
+            results.append(check_document(name, path, fast_paths, limits, max(1, args.repeat),
+                                          max(1024, args.ingest_chunk_size)))
+
+    # Tổng thời gian không tính file kết thúc bằng lỗi (ví dụ đường chậm chạy tới deadline)
+    timed = [d for d in results if not d['error']]
+    slow_ms = sum(d['slow_ms'] for d in timed)
+    fast_ms = sum(d['fast_ms'] for d in timed)
+    disagreement_count = sum(len(d['disagreements']) for d in results)
+    report = {
+        'fast_paths': sorted(fast_paths),
+        'documents': results,
+        'slow_ms': round(slow_ms, 3),
+        'fast_ms': round(fast_ms, 3),
+        # Đường nhanh chỉ đáng tin khi mọi verdict giống nhau - không báo speedup nếu còn khác biệt
+        'speedup': round(slow_ms / fast_ms, 2) if fast_ms > 0 and not disagreement_count else None,
+        'disagreement_count': disagreement_count,
+    }
+    if args.json:
+        print(json.dumps(report, indent=2, default=str))
+    else:
+        print_report(report)
+    sys.exit(1 if report['disagreement_count'] else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,180 @@
+"""
+Đường xác minh nhanh cho bước 6 (toàn vẹn) và bước 7 (cryptographic)
+
+Đường mặc định (chậm):
+- Bước 6 gọi endesive.pdf.verify cho MỖI signature field. Mỗi lần endesive đọc cả
+  file vào RAM, ghép hai đoạn ByteRange thành bản sao, nạp trust store certifi
+  và verify chữ ký + chuỗi chứng chỉ của MỌI chữ ký, dù api chỉ dùng `hashok`
+  của chữ ký đầu tiên.
+- Bước 7 parse lại toàn bộ PDF bằng pypdf chỉ để lấy lại /ByteRange của field.
+
+Đường nhanh:
+- Bước 6 (first_signature_hashok): quét /ByteRange giống hệt endesive trên mmap,
+  hash ByteRange của chữ ký đầu tiên bằng memoryview (không copy, dùng digest
+  tính sẵn lúc upload nếu có) và so với messageDigest trong signed attributes.
+  Các chữ ký sau chỉ được kiểm tra cấu trúc ở đúng những chỗ endesive raise
+  exception, để api rơi vào cùng nhánh fallback như trước. Kết quả tính một lần
+  cho cả tài liệu.
+- Bước 7 dùng /ByteRange đã đọc sẵn ở read_pdf_signatures (không parse lại PDF).
+
+ByteRange khiến endesive quét lặp vô hạn (đường chậm chỉ dừng ở deadline của
+stage) được phát hiện và báo bằng ByteRangeLoopError; api đổi thành cùng lỗi
+vượt deadline (VerificationGuard.expire) thay vì nhánh fallback.
+
+Hai đường phải cho cùng verdict; kiểm chứng bằng diffcheck.py trước khi bật.
+Bật theo từng bước cho mỗi deployment:
+    PDF_FAST_PATHS=integrity,cryptographic   (hoặc 'all'; mặc định rỗng = tắt)
+"""
+
+import hashlib
+import mmap
+import os
+
+from asn1crypto import cms, core
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import ec, padding
+
+FAST_PATH_NAMES = ('integrity', 'cryptographic')
+
+
+def load_fast_paths(value=None):
+    """Tập bước dùng đường nhanh (tên trong FAST_PATH_NAMES), từ PDF_FAST_PATHS"""
+    value = value if value is not None else os.environ.get('PDF_FAST_PATHS', '')
+    names = {name.strip().lower() for name in value.split(',') if name.strip()}
+    if 'all' in names:
+        return frozenset(FAST_PATH_NAMES)
+    return frozenset(names & set(FAST_PATH_NAMES))
+
+
+FAST_PATHS = load_fast_paths()
+
+
+class ByteRangeLoopError(ValueError):
+    """ByteRange khiến vòng quét của endesive quay lại chữ ký đã gặp (lặp vô hạn)"""
+
+
+def scan_signatures(data):
+    """
+    Duyệt các chữ ký theo đúng vòng lặp của endesive.pdf.verify.verify
+
+    Args:
+        data: bytes hoặc mmap của cả file
+
+    Yields:
+        (byte_range: list of int, cms_bytes: bytes)
+
+    Raises:
+        ByteRangeLoopError: khi ByteRange khiến vòng quét quay lại chữ ký đã gặp
+            (endesive lặp vô hạn tới khi hết deadline)
+        Exception: ở những chỗ endesive raise (ByteRange/Contents sai định dạng)
+    """
+    seen = set()
+    n = data.find(b"/ByteRange")
+    while n != -1:
+        seen.add(n)
+        start = data.find(b"[", n)
+        stop = data.find(b"]", start)
+        if start == -1 or stop == -1:
+            raise ValueError("ByteRange không đóng")
+        byte_range = [int(i, 10) for i in data[start + 1:stop].split()]
+        if data[byte_range[1]] != 60 or data[byte_range[2] - 1] != 62:
+            raise ValueError("ByteRange không trỏ tới /Contents")
+        contents = data[byte_range[0] + byte_range[1] + 1:byte_range[2] - 1]
+        end = byte_range[2] + byte_range[3]
+        yield byte_range, bytes.fromhex(contents.decode("utf8"))
+        n = data.find(b"/ByteRange", end)
+        if n in seen:
+            raise ByteRangeLoopError("ByteRange không tiến - endesive sẽ lặp vô hạn")
+
+
+def _check_signed_data(cms_bytes):
+    """
+    Đọc SignedData như endesive.verifier (trừ verify chữ ký và chuỗi chứng chỉ,
+    không ảnh hưởng hashok) và raise ở cùng những chỗ
+
+    Returns:
+        (algorithm: tên hashlib, message_digest: bytes hoặc None, has_signed_attributes: bool)
+    """
+    signed_data = cms.ContentInfo.load(cms_bytes)["content"]
+    signer_info = signed_data["signer_infos"][0]
+    signer_info["signature"].native
+    algorithm = signed_data["digest_algorithms"][0]["algorithm"].native
+    getattr(hashlib, algorithm)
+
+    message_digest = None
+    attrs = signer_info["signed_attrs"]
+    has_signed_attributes = attrs is not None and not isinstance(attrs, core.Void)
+    if has_signed_attributes:
+        for attr in attrs:
+            if attr["type"].native == "message_digest":
+                message_digest = attr["values"].native[0]
+        attrs.dump()
+
+    # Chứng chỉ người ký tìm theo serial: endesive raise nếu thiếu hoặc trùng
+    serial = signer_info["sid"].native["serial_number"]
+    signer_cert = None
+    for certificate in signed_data["certificates"]:
+        loaded = x509.load_der_x509_certificate(certificate.chosen.dump())
+        if serial == certificate.native["tbs_certificate"]["serial_number"]:
+            if signer_cert is not None:
+                raise ValueError("Nhiều chứng chỉ cùng serial với người ký")
+            signer_cert = loaded
+    public_key = signer_cert.public_key()
+
+    if not isinstance(public_key, ec.EllipticCurvePublicKey):
+        signature_algorithm = signer_info["signature_algorithm"]
+        name = signature_algorithm.signature_algo
+        if name == "rsassa_pss":
+            parameters = signature_algorithm["parameters"]
+            pss_hash = parameters["hash_algorithm"].native["algorithm"].upper()
+            getattr(padding, parameters["mask_gen_algorithm"].native["algorithm"].upper())(getattr(hashes, pss_hash)())
+            parameters["salt_length"].native
+        elif name != "rsassa_pkcs1v15":
+            raise ValueError("Unknown signature algorithm")
+
+    return algorithm, message_digest, has_signed_attributes
+
+
+def _range_digest(view, byte_range, algorithm, range_digests):
+    """Digest của ByteRange theo slice semantics của endesive (data1 + data2)"""
+    key = (*byte_range[:4], algorithm)
+    if range_digests and key in range_digests:
+        return range_digests[key]
+    hasher = getattr(hashlib, algorithm)()
+    hasher.update(view[byte_range[0]:byte_range[0] + byte_range[1]])
+    hasher.update(view[byte_range[2]:byte_range[2] + byte_range[3]])
+    return hasher.digest()
+
+
+def first_signature_hashok(pdf_path, range_digests=None):
+    """
+    `hashok` của chữ ký đầu tiên, như signature_results[0][0] của endesive
+
+    Không có signed attributes thì endesive luôn coi hashok = True (digest được so
+    với chính nó) - giữ nguyên để verdict không đổi.
+
+    Args:
+        pdf_path: Đường dẫn đến PDF
+        range_digests: Digest ByteRange đã tính trong lúc upload (UploadIngest.range_digests)
+
+    Returns:
+        bool, hoặc None nếu không có chữ ký nào
+
+    Raises:
+        ByteRangeLoopError: khi endesive sẽ lặp vô hạn (không dùng nhánh fallback)
+        Exception: khi endesive cũng raise (api dùng nhánh fallback)
+    """
+    if os.path.getsize(pdf_path) == 0:
+        return None
+    with open(pdf_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        hashok = None
+        for byte_range, cms_bytes in scan_signatures(data):
+            algorithm, message_digest, has_signed_attributes = _check_signed_data(cms_bytes)
+            if hashok is None:
+                if has_signed_attributes:
+                    with memoryview(data) as view:
+                        hashok = _range_digest(view, byte_range, algorithm, range_digests) == message_digest
+                else:
+                    hashok = True
+        return hashok
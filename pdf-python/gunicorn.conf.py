@@ -0,0 +1,33 @@
+# Cấu hình Gunicorn cho PDF Signature Verification API
+#
+# preload_app: import api.py MỘT lần trong master rồi mới fork worker.
+# Các module nặng (pypdf, cryptography, asn1crypto) và state read-only
+# (bảng OID, ...) được chia sẻ copy-on-write thay vì mỗi worker tự dựng lại.
+#
+# Các giá trị có thể override bằng biến môi trường, ví dụ:
+#   GUNICORN_WORKERS=8 GUNICORN_PRELOAD=0 gunicorn -c gunicorn.conf.py api:app
+
+import gc
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:5001')
+workers = int(os.environ.get('GUNICORN_WORKERS', '4'))
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'sync')
+threads = int(os.environ.get('GUNICORN_THREADS', '1'))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', '120'))
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') != '0'
+
+accesslog = '-'
+errorlog = '-'
+
+
+def when_ready(server):
+    """
+    Chạy trong master sau khi app đã preload, trước khi fork worker.
+
+    gc.freeze() chuyển toàn bộ object hiện có sang "permanent generation" để
+    GC của worker không chạm vào (và không làm bẩn) các page dùng chung.
+    """
+    if preload_app:
+        gc.collect()
+        gc.freeze()
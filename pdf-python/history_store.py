@@ -0,0 +1,422 @@
+"""
+Lưu lịch sử xác minh chữ ký (SQLite)
+
+Mỗi chữ ký trong mỗi lần xác minh là một dòng trong bảng `verifications`,
+có index theo document hash, fingerprint chứng chỉ người ký, issuer,
+thời gian ký và trạng thái. Dùng để trả lời các câu hỏi như:
+- chứng chỉ X đã ký những tài liệu nào trong tháng này
+- liệt kê lại mọi kết quả đã ký bởi một chứng chỉ vừa bị thu hồi
+
+Ghi bất đồng bộ: request chỉ đẩy dòng vào queue (không chờ I/O), một thread
+nền gom theo batch và ghi trong một transaction. Khi queue đầy, dòng mới bị
+bỏ qua (đếm trong `dropped`) thay vì làm chậm request.
+
+Connection SQLite không an toàn qua fork, nên connection và writer thread
+được tạo lazily trong từng process (gunicorn preload fork sau khi import).
+Nhiều worker ghi cùng một file nhờ WAL mode.
+
+Bật bằng biến môi trường:
+    PDF_HISTORY_DB=/data/history.sqlite3
+    PDF_HISTORY_BATCH_SIZE=500
+    PDF_HISTORY_FLUSH_INTERVAL=1.0
+"""
+
+import atexit
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+from datetime import datetime, timedelta, timezone
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS verifications (
+    id INTEGER PRIMARY KEY,
+    verified_at TEXT NOT NULL,
+    document_hash TEXT NOT NULL,
+    document_size INTEGER,
+    field_name TEXT,
+    signer_fingerprint TEXT,
+    signer_name TEXT,
+    issuer TEXT,
+    signing_time TEXT NOT NULL DEFAULT '',
+    status TEXT NOT NULL,
+    result_json TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_verifications_document ON verifications (document_hash);
+CREATE INDEX IF NOT EXISTS idx_verifications_signer_time ON verifications (signer_fingerprint, signing_time);
+CREATE INDEX IF NOT EXISTS idx_verifications_issuer_time ON verifications (issuer, signing_time);
+CREATE INDEX IF NOT EXISTS idx_verifications_status_time ON verifications (status, signing_time);
+CREATE INDEX IF NOT EXISTS idx_verifications_signing_time ON verifications (signing_time);
+"""
+
+# Bảng tổng hợp (chứng chỉ, tài liệu, thời gian ký) -> số lần xác minh, cho
+# documents_signed_by(): đi theo index (signer_fingerprint, signing_time) thay vì
+# GROUP BY trên toàn bộ dòng của một chứng chỉ (temp B-tree khi chứng chỉ ký nhiều)
+SUMMARY_SCHEMA = """
+CREATE TABLE signer_documents (
+    signer_fingerprint TEXT NOT NULL,
+    document_hash TEXT NOT NULL,
+    signing_time TEXT NOT NULL,
+    verifications INTEGER NOT NULL,
+    PRIMARY KEY (signer_fingerprint, document_hash, signing_time)
+) WITHOUT ROWID;
+CREATE INDEX idx_signer_documents_time ON signer_documents (signer_fingerprint, signing_time, document_hash);
+"""
+
+# Điền bảng tổng hợp từ các dòng có sẵn (file lịch sử tạo trước khi có bảng)
+SUMMARY_BACKFILL_SQL = """
+INSERT INTO signer_documents (signer_fingerprint, document_hash, signing_time, verifications)
+SELECT signer_fingerprint, document_hash, signing_time, COUNT(*)
+FROM verifications WHERE signer_fingerprint IS NOT NULL
+GROUP BY signer_fingerprint, document_hash, signing_time
+"""
+
+INSERT_SQL = """
+INSERT INTO verifications (
+    verified_at, document_hash, document_size, field_name, signer_fingerprint,
+    signer_name, issuer, signing_time, status, result_json
+) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+SUMMARY_UPSERT_SQL = """
+INSERT INTO signer_documents (signer_fingerprint, document_hash, signing_time, verifications)
+VALUES (?, ?, ?, 1)
+ON CONFLICT (signer_fingerprint, document_hash, signing_time) DO UPDATE SET verifications = verifications + 1
+"""
+
+# Dòng mới nhất (trong khoảng thời gian) của mỗi tài liệu, theo thứ tự index
+# (signer_fingerprint, signing_time, document_hash). Các dòng cũ hơn của cùng tài liệu
+# bị loại bằng NOT EXISTS (tra theo primary key), nên LIMIT và cursor áp dụng trực tiếp.
+# {upper_bound}: đúng một cận trên cho signing_time - SQLite chỉ dùng một cận khi
+# quét index, cận còn lại thành filter và trang sau phải đi qua mọi dòng mới hơn
+DOCUMENTS_SIGNED_BY_SQL = """
+SELECT d.document_hash, d.signing_time,
+       (SELECT SUM(v.verifications) FROM signer_documents v
+        WHERE v.signer_fingerprint = d.signer_fingerprint AND v.document_hash = d.document_hash
+          AND v.signing_time >= :since AND v.signing_time < :until) AS verifications
+FROM signer_documents d
+WHERE d.signer_fingerprint = :fingerprint
+  AND d.signing_time >= :since AND {upper_bound}
+  AND NOT EXISTS (SELECT 1 FROM signer_documents n
+                  WHERE n.signer_fingerprint = d.signer_fingerprint AND n.document_hash = d.document_hash
+                    AND n.signing_time > d.signing_time AND n.signing_time < :until)
+ORDER BY d.signing_time DESC, d.document_hash DESC
+LIMIT :limit
+"""
+
+# Cận trên của signing_time khi không có until (lớn hơn mọi chuỗi ISO)
+_MAX_TIME = '\uffff'
+
+# Filter cho phép trong query() -> cột tương ứng (đều có index)
+QUERY_FILTERS = {
+    'document_hash': 'document_hash',
+    'fingerprint': 'signer_fingerprint',
+    'issuer': 'issuer',
+    'status': 'status',
+}
+
+MAX_QUERY_LIMIT = 1000
+
+
+def _utc_iso(dt):
+    """Chuẩn hoá datetime về chuỗi ISO UTC cố định độ dài (so sánh được theo thứ tự chuỗi)"""
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def normalize_signing_time(signing_time, signing_timezone=None):
+    """
+    Chuẩn hoá signing_time trong kết quả xác minh về ISO UTC
+
+    Args:
+        signing_time: Chuỗi ISO (có thể không có timezone)
+        signing_timezone: '+07:00' / '-05:00' nếu lấy từ /M field của PDF
+
+    Returns:
+        str hoặc None
+    """
+    if not signing_time:
+        return None
+    try:
+        dt = datetime.fromisoformat(signing_time)
+    except ValueError:
+        return None
+    if dt.tzinfo is None and signing_timezone:
+        try:
+            sign = -1 if signing_timezone.startswith('-') else 1
+            hours, minutes = signing_timezone[1:].split(':')
+            dt = dt.replace(tzinfo=timezone(sign * timedelta(hours=int(hours), minutes=int(minutes))))
+        except ValueError:
+            pass
+    return _utc_iso(dt)
+
+
+def normalize_query_time(value):
+    """Chuẩn hoá tham số since/until ('2025-12', '2025-12-01', ISO đầy đủ) về ISO UTC"""
+    if not value:
+        return None
+    if len(value) == 7:  # YYYY-MM
+        value = f"{value}-01"
+    return _utc_iso(datetime.fromisoformat(value.replace('Z', '+00:00')))
+
+
+def signature_status(sig_data):
+    """Trạng thái tổng hợp của một chữ ký: 'valid' | 'invalid'"""
+    if sig_data.get('structure_validation', {}).get('is_structure_valid'):
+        return 'valid'
+    return 'invalid'
+
+
+class HistoryStore:
+    """
+    Kho lịch sử xác minh trên SQLite với ghi batch bất đồng bộ
+
+    Usage:
+        store = HistoryStore('/data/history.sqlite3')
+        store.record(document_hash, document_size, signatures)
+        rows = store.query(fingerprint='ab12...', since='2025-12')
+    """
+
+    def __init__(self, path, batch_size=500, flush_interval=1.0, max_queue=100000):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self.dropped = 0
+        self._pid = None
+        self._queue = None
+        self._writer = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+        conn = self._connect()
+        try:
+            conn.executescript(SCHEMA)
+            self._create_summary(conn)
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _create_summary(conn):
+        """Tạo bảng signer_documents và điền từ dữ liệu cũ (một lần, khoá ghi để worker khác chờ)"""
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            exists = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'signer_documents'").fetchone()
+            if not exists:
+                for statement in SUMMARY_SCHEMA.split(';'):
+                    if statement.strip():
+                        conn.execute(statement)
+                conn.execute(SUMMARY_BACKFILL_SQL)
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    def _ensure_process(self):
+        """Tạo queue + writer thread cho process hiện tại (sau fork thì tạo lại)"""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._queue = queue.Queue(maxsize=self.max_queue)
+            self._local = threading.local()
+            self._writer = threading.Thread(target=self._write_loop, name='history-writer', daemon=True)
+            self._writer.start()
+            self._pid = os.getpid()
+            atexit.register(self.flush)
+
+    def _reader(self):
+        self._ensure_process()
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._connect()
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    def record(self, document_hash, document_size, signatures):
+        """
+        Đẩy kết quả xác minh của một tài liệu vào queue ghi (không chặn)
+
+        Args:
+            document_hash: SHA-256 hex của toàn bộ file
+            document_size: Kích thước file (bytes)
+            signatures: list kết quả từ read_pdf_signatures()
+        """
+        self._ensure_process()
+        verified_at = _utc_iso(datetime.now(timezone.utc))
+        rows = []
+        for sig in signatures:
+            signer = sig.get('signer') or {}
+            issuer = sig.get('issuer') or {}
+            rows.append((
+                verified_at,
+                document_hash,
+                document_size,
+                sig.get('field_name'),
+                sig.get('signer_fingerprint'),
+                signer.get('common_name'),
+                issuer.get('common_name'),
+                normalize_signing_time(sig.get('signing_time'), sig.get('signing_timezone')) or '',
+                signature_status(sig),
+                json.dumps(sig, ensure_ascii=False, default=str),
+            ))
+        if not rows:
+            rows.append((verified_at, document_hash, document_size, None, None, None, None, '', 'unsigned', None))
+
+        for row in rows:
+            try:
+                self._queue.put_nowait(row)
+            except queue.Full:
+                self.dropped += 1
+
+    def _write_loop(self):
+        conn = self._connect()
+        while True:
+            try:
+                batch = [self._queue.get(timeout=self.flush_interval)]
+            except queue.Empty:
+                continue
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                with conn:
+                    conn.executemany(INSERT_SQL, batch)
+                    conn.executemany(SUMMARY_UPSERT_SQL, [
+                        (row[4], row[1], row[7]) for row in batch if row[4] is not None])
+            except sqlite3.Error:
+                logger.exception("Không ghi được %d dòng lịch sử xác minh", len(batch))
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def flush(self):
+        """Chờ tới khi mọi dòng trong queue đã được ghi"""
+        if self._pid == os.getpid() and self._queue is not None:
+            self._queue.join()
+
+    def query(self, document_hash=None, fingerprint=None, issuer=None, status=None,
+              since=None, until=None, limit=100, cursor=None, include_results=False):
+        """
+        Tìm các lần xác minh theo filter (mới nhất theo signing_time trước)
+
+        Args:
+            document_hash / fingerprint / issuer / status: filter bằng (AND)
+            since / until: khoảng signing_time (ISO, 'YYYY-MM-DD' hoặc 'YYYY-MM')
+            limit: số dòng tối đa (<= MAX_QUERY_LIMIT)
+            cursor: phân trang - giá trị next_cursor() của dòng cuối trang trước
+            include_results: trả kèm kết quả xác minh đầy đủ (JSON)
+
+        Returns:
+            list of dict
+        """
+        clauses, params = [], []
+        for key, value in (('document_hash', document_hash), ('fingerprint', fingerprint),
+                           ('issuer', issuer), ('status', status)):
+            if value is not None:
+                clauses.append(f"{QUERY_FILTERS[key]} = ?")
+                params.append(value)
+        if since:
+            clauses.append("signing_time >= ?")
+            params.append(normalize_query_time(since))
+        if until:
+            clauses.append("signing_time < ?")
+            params.append(normalize_query_time(until))
+        if cursor:
+            # Keyset pagination theo đúng thứ tự ORDER BY, vẫn dùng được index
+            cursor_time, _, cursor_id = cursor.rpartition(',')
+            clauses.append("(signing_time, id) < (?, ?)")
+            params.extend([cursor_time, int(cursor_id)])
+
+        columns = ("id, verified_at, document_hash, document_size, field_name, signer_fingerprint, "
+                   "signer_name, issuer, signing_time, status")
+        if include_results:
+            columns += ", result_json"
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        limit = max(1, min(int(limit), MAX_QUERY_LIMIT))
+        sql = f"SELECT {columns} FROM verifications {where} ORDER BY signing_time DESC, id DESC LIMIT ?"
+
+        rows = []
+        for row in self._reader().execute(sql, (*params, limit)):
+            item = dict(row)
+            if include_results:
+                item['result'] = json.loads(item.pop('result_json')) if item.get('result_json') else None
+            rows.append(item)
+        return rows
+
+    @staticmethod
+    def next_cursor(rows):
+        """Cursor cho trang kế tiếp từ kết quả query() (None nếu hết)"""
+        if not rows:
+            return None
+        return f"{rows[-1]['signing_time']},{rows[-1]['id']}"
+
+    def documents_signed_by(self, fingerprint, since=None, until=None, limit=100, cursor=None):
+        """
+        Các tài liệu (document hash) đã được ký bởi chứng chỉ có fingerprint cho trước
+
+        Đọc từ bảng signer_documents theo index (signer_fingerprint, signing_time): chi phí
+        tỉ lệ với kích thước trang, không phụ thuộc số lần chứng chỉ đã ký.
+
+        Args:
+            since / until: khoảng signing_time (như query())
+            limit: số tài liệu tối đa (<= MAX_QUERY_LIMIT)
+            cursor: phân trang - giá trị next_document_cursor() của trang trước
+
+        Returns:
+            list of dict: document_hash, signing_time (mới nhất), verifications (số lần xác minh)
+        """
+        params = {
+            'fingerprint': fingerprint,
+            'since': normalize_query_time(since) or '',
+            'until': normalize_query_time(until) or _MAX_TIME,
+            'limit': max(1, min(int(limit), MAX_QUERY_LIMIT)),
+        }
+        upper_bound = "d.signing_time < :until"
+        if cursor:
+            params['cursor_time'], _, params['cursor_document'] = cursor.rpartition(',')
+            if params['cursor_time'] >= params['until']:
+                return []
+            upper_bound = ("d.signing_time <= :cursor_time "
+                           "AND (d.signing_time, d.document_hash) < (:cursor_time, :cursor_document)")
+        sql = DOCUMENTS_SIGNED_BY_SQL.format(upper_bound=upper_bound)
+        return [dict(row) for row in self._reader().execute(sql, params)]
+
+    @staticmethod
+    def next_document_cursor(documents):
+        """Cursor cho trang kế tiếp từ kết quả documents_signed_by() (None nếu hết)"""
+        if not documents:
+            return None
+        return f"{documents[-1]['signing_time']},{documents[-1]['document_hash']}"
+
+def open_history_store_from_env():
+    """
+    Tạo HistoryStore nếu PDF_HISTORY_DB được đặt
+
+    Returns:
+        HistoryStore hoặc None (tắt)
+    """
+    path = os.environ.get('PDF_HISTORY_DB')
+    if not path:
+        return None
+    return HistoryStore(
+        path,
+        batch_size=int(os.environ.get('PDF_HISTORY_BATCH_SIZE', '500')),
+        flush_interval=float(os.environ.get('PDF_HISTORY_FLUSH_INTERVAL', '1.0')),
+    )
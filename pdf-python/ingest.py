@@ -0,0 +1,247 @@
+"""
+Ingest upload: ghi file tạm và hash trong lúc nhận dữ liệu
+
+Thay vì nhận hết body -> ghi /tmp -> đọc lại -> mới hash ByteRange, mỗi chunk
+vừa tới được:
+- ghi vào file tạm
+- đưa vào SHA-256 của toàn file (document hash, dùng làm cache key / history)
+- đưa vào digest của từng ByteRange đang theo dõi
+
+ByteRange được theo dõi khi:
+- client gửi trước qua header X-PDF-ByteRanges ("0 840 960 240; 0 5000 6000 100"), hoặc
+- bắt gặp "/ByteRange [a b c d]" trong stream trước khi tới vùng được ký tương ứng.
+  Đoạn đầu của ByteRange luôn bắt đầu ở offset 0, nên digest của nó chính là
+  trạng thái hash "prefix" của file tại thời điểm đó (hashlib .copy()). Đa số
+  writer đặt /ByteRange trước /Contents nên trường hợp này là phổ biến.
+
+Chỉ theo dõi ByteRange có hai đoạn theo đúng thứ tự file và không chồng nhau
+(off1 + len1 <= off2): digest tính tuần tự khi đó mới bằng digest theo slice
+data[off1:off1+len1] + data[off2:off2+len2] lúc xác minh. Đoạn vượt quá cuối
+file thì digest không bao giờ đủ và cũng không được dùng.
+
+ByteRange không theo dõi được (ví dụ /ByteRange nằm sau /Contents, hai đoạn
+đảo ngược hoặc chồng nhau) sẽ được hash lại từ file khi xác minh như trước.
+
+Số ByteRange theo dõi tối đa là max_ranges (max_signatures): mỗi ByteRange tốn một
+lần hash gần như toàn file, nên file có hàng nghìn chuỗi "/ByteRange [...]" không
+được nhân chi phí nhận upload lên. Đủ max_ranges thì ngừng tìm thêm (các ByteRange
+khác hash lại từ file khi xác minh); header liệt kê nhiều hơn max_ranges bị từ chối
+(413, max_signatures) trước khi đọc body.
+
+Thuật toán digest tính sẵn cấu hình bằng:
+    PDF_STREAM_DIGEST_ALGORITHMS=sha256        (danh sách, cách nhau bởi dấu phẩy)
+"""
+
+import hashlib
+import os
+import re
+import tempfile
+
+from limits import VerificationLimitExceeded
+
+UPLOAD_CHUNK_SIZE = 256 * 1024
+
+# Đủ dài để chứa "/ByteRange [..4 số 10 chữ số..]" bị cắt ngang giữa hai chunk
+_CARRY_BYTES = 128
+_BYTERANGE_RE = re.compile(rb'/ByteRange\s*\[\s*(\d+)\s+(\d+)\s+(\d+)\s+(\d+)\s*\]')
+
+
+def load_stream_digest_algorithms(value=None):
+    """Danh sách thuật toán hash (tên hashlib) tính sẵn cho ByteRange"""
+    value = value if value is not None else os.environ.get('PDF_STREAM_DIGEST_ALGORITHMS', 'sha256')
+    algorithms = tuple(a.strip().lower() for a in value.split(',') if a.strip().lower() in hashlib.algorithms_available)
+    return algorithms or ('sha256',)
+
+
+STREAM_DIGEST_ALGORITHMS = load_stream_digest_algorithms()
+
+
+def parse_byte_ranges_header(value):
+    """
+    Parse header X-PDF-ByteRanges
+
+    Args:
+        value: "0 840 960 240; 0 5000 6000 100" (mỗi ByteRange 4 số, phân cách bởi ';')
+
+    Returns:
+        list of tuple(int, int, int, int)
+
+    Raises:
+        ValueError: nếu header sai định dạng
+    """
+    ranges = []
+    for part in (value or '').split(';'):
+        numbers = part.replace(',', ' ').split()
+        if not numbers:
+            continue
+        if len(numbers) != 4:
+            raise ValueError(f"ByteRange phải có 4 số: {part.strip()[:50]}")
+        byte_range = tuple(int(n) for n in numbers)
+        if any(n < 0 for n in byte_range):
+            raise ValueError(f"ByteRange không hợp lệ: {part.strip()[:50]}")
+        ranges.append(byte_range)
+    return ranges
+
+
+class _RangeDigest:
+    """Digest đang chạy của một ByteRange với một thuật toán"""
+
+    def __init__(self, byte_range, algorithm, hasher, position):
+        off1, len1, off2, len2 = byte_range
+        self.byte_range = byte_range
+        self.algorithm = algorithm
+        self.hasher = hasher
+        self.segments = ((off1, off1 + len1), (off2, off2 + len2))
+        self.total = len1 + len2
+        # Offset tiếp theo cần hash (bytes trước đó đã nằm trong hasher)
+        self.position = position
+        self.hashed = position - off1 if position > off1 else 0
+        self.broken = False
+
+    def feed(self, chunk, chunk_start):
+        chunk_end = chunk_start + len(chunk)
+        for start, end in self.segments:
+            lo, hi = max(start, chunk_start, self.position), min(end, chunk_end)
+            if lo >= hi:
+                continue
+            if lo > max(start, self.position):
+                # Bỏ sót dữ liệu (không xảy ra khi stream tuần tự)
+                self.broken = True
+                return
+            self.hasher.update(chunk[lo - chunk_start:hi - chunk_start])
+            self.hashed += hi - lo
+            self.position = hi
+
+    @property
+    def complete(self):
+        return not self.broken and self.hashed == self.total
+
+
+class UploadIngest:
+    """
+    Nhận upload theo chunk: ghi file tạm + document hash + digest ByteRange
+
+    Usage:
+        ingest = ingest_upload(request.stream, max_bytes)
+        ingest.temp_path, ingest.size, ingest.document_hash
+        ingest.range_digests  # {(off1, len1, off2, len2, 'sha256'): digest bytes}
+    """
+
+    def __init__(self, max_bytes=None, byte_ranges=(), algorithms=None, max_ranges=None):
+        if max_ranges and len(byte_ranges) > max_ranges:
+            raise VerificationLimitExceeded('max_signatures', len(byte_ranges), max_ranges)
+        self.max_bytes = max_bytes
+        self.max_ranges = max_ranges or 0
+        self.algorithms = tuple(algorithms or STREAM_DIGEST_ALGORITHMS)
+        self.size = 0
+        self.temp_path = None
+        self.document_hash = None
+        self._document_hasher = hashlib.sha256()
+        # Hash "prefix" của file cho từng thuật toán (= digest đoạn đầu ByteRange)
+        self._prefix = {name: (self._document_hasher if name == 'sha256' else hashlib.new(name))
+                        for name in self.algorithms}
+        self._trackers = {}
+        self._ranges = set()  # ByteRange (4 số) đang theo dõi, tối đa max_ranges
+        self._tail = b''
+        for byte_range in byte_ranges:
+            self._track(byte_range, 0)
+
+    def _track(self, byte_range, position):
+        """Bắt đầu theo dõi một ByteRange tại offset position của stream"""
+        off1, len1, off2, len2 = byte_range
+        if min(byte_range) < 0 or off1 + len1 > off2:
+            # Đảo ngược / chồng nhau: hash tuần tự sẽ khác slice - hash lại từ file
+            return
+        for name in self.algorithms:
+            key = (*byte_range, name)
+            if key in self._trackers:
+                continue
+            if position <= off1:
+                hasher = hashlib.new(name)
+            elif off1 == 0 and position <= len1:
+                hasher = self._prefix[name].copy()
+            else:
+                # Đã qua vùng được ký - sẽ hash lại từ file khi xác minh
+                continue
+            self._trackers[key] = _RangeDigest(byte_range, name, hasher, position)
+            self._ranges.add(byte_range)
+
+    @property
+    def _full(self):
+        return self.max_ranges > 0 and len(self._ranges) >= self.max_ranges
+
+    def _discover(self, chunk):
+        if self._full:
+            return
+        data = self._tail + chunk
+        for match in _BYTERANGE_RE.finditer(data):
+            # Match nằm trọn trong phần tail đã quét ở chunk trước
+            if match.end() <= len(self._tail):
+                continue
+            self._track(tuple(int(g) for g in match.groups()), self.size)
+            if self._full:
+                return
+        self._tail = data[-_CARRY_BYTES:]
+
+    def feed(self, chunk):
+        if self.size == 0 and b'%PDF-' not in chunk[:1024]:
+            raise ValueError("File phải có định dạng PDF")
+        if self.max_bytes and self.size + len(chunk) > self.max_bytes:
+            raise VerificationLimitExceeded('max_upload_bytes', self.size + len(chunk), self.max_bytes)
+
+        self._discover(chunk)
+        for tracker in self._trackers.values():
+            tracker.feed(chunk, self.size)
+        for hasher in self._prefix.values():
+            hasher.update(chunk)
+        if 'sha256' not in self._prefix:
+            self._document_hasher.update(chunk)
+        self.size += len(chunk)
+
+    @property
+    def range_digests(self):
+        """Digest của các ByteRange đã hash đủ: {(off1, len1, off2, len2, algorithm): bytes}"""
+        return {key: tracker.hasher.digest() for key, tracker in self._trackers.items() if tracker.complete}
+
+    def run(self, stream, chunk_size=UPLOAD_CHUNK_SIZE):
+        """Đọc toàn bộ stream vào file tạm (xoá file tạm nếu lỗi)"""
+        fd, self.temp_path = tempfile.mkstemp(prefix='pdf-verify-', suffix='.pdf')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                while True:
+                    chunk = stream.read(chunk_size)
+                    if not chunk:
+                        break
+                    self.feed(chunk)
+                    f.write(chunk)
+            if self.size == 0:
+                raise ValueError("Không tìm thấy file trong request")
+        except BaseException:
+            os.remove(self.temp_path)
+            self.temp_path = None
+            raise
+        self.document_hash = self._document_hasher.hexdigest()
+        return self
+
+
+def ingest_upload(stream, max_bytes=None, byte_ranges=(), algorithms=None, chunk_size=UPLOAD_CHUNK_SIZE,
+                  max_ranges=None):
+    """
+    Ghi stream upload vào file tạm, đồng thời tính document hash và digest ByteRange
+
+    Args:
+        stream: File-like object (request.stream hoặc FileStorage.stream)
+        max_bytes: Kích thước tối đa, kiểm tra cả khi body không có Content-Length (chunked)
+        byte_ranges: ByteRange client gửi trước (X-PDF-ByteRanges)
+        algorithms: Thuật toán digest (mặc định STREAM_DIGEST_ALGORITHMS)
+        chunk_size: Kích thước mỗi lần đọc
+        max_ranges: Số ByteRange theo dõi tối đa (max_signatures, 0/None = không giới hạn)
+
+    Returns:
+        UploadIngest
+
+    Raises:
+        VerificationLimitExceeded: nếu vượt max_bytes, hoặc header có nhiều hơn max_ranges ByteRange
+        ValueError: nếu body rỗng hoặc không phải PDF (không có header %PDF-)
+    """
+    return UploadIngest(max_bytes, byte_ranges, algorithms, max_ranges).run(stream, chunk_size)
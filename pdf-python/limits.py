@@ -0,0 +1,448 @@
+"""
+Giới hạn tài nguyên cho mỗi lần xác minh PDF
+
+- Admission limits: kiểm tra nhanh trên byte stream (không parse PDF) để từ chối sớm
+  file quá lớn, quá nhiều object/trang/chữ ký, hoặc /Contents quá lớn.
+- Deadline theo từng stage + tổng thời gian, và ngân sách RSS của worker.
+
+Khi vượt giới hạn, raise VerificationLimitExceeded để API trả về kết quả
+"limit exceeded" có cấu trúc thay vì để gunicorn kill worker.
+
+Cấu hình qua biến môi trường (0 = tắt giới hạn đó):
+    PDF_MAX_UPLOAD_BYTES       (mặc định 50 MB)
+    PDF_MAX_PAGES              (mặc định 5000)
+    PDF_MAX_OBJECTS            (mặc định 500000)
+    PDF_MAX_SIGNATURES         (mặc định 50)
+    PDF_MAX_CONTENTS_BYTES     (mặc định 1 MB, kích thước /Contents sau khi decode hex)
+    PDF_STAGE_TIMEOUT_SECONDS  (mặc định 30)
+    PDF_VERIFY_TIMEOUT_SECONDS (mặc định 90, nhỏ hơn timeout 120s của gunicorn)
+    PDF_MAX_RSS_MB             (mặc định 1024)
+"""
+
+import mmap
+import os
+import re
+import resource
+import signal
+import sys
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+
+
+def _env_int(name, default):
+    try:
+        return int(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+def _env_float(name, default):
+    try:
+        return float(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+DEFAULT_LIMITS = {
+    'max_upload_bytes': _env_int('PDF_MAX_UPLOAD_BYTES', 50 * 1024 * 1024),
+    'max_pages': _env_int('PDF_MAX_PAGES', 5000),
+    'max_objects': _env_int('PDF_MAX_OBJECTS', 500000),
+    'max_signatures': _env_int('PDF_MAX_SIGNATURES', 50),
+    'max_contents_bytes': _env_int('PDF_MAX_CONTENTS_BYTES', 1024 * 1024),
+    'stage_timeout_seconds': _env_float('PDF_STAGE_TIMEOUT_SECONDS', 30.0),
+    'verify_timeout_seconds': _env_float('PDF_VERIFY_TIMEOUT_SECONDS', 90.0),
+    'max_rss_bytes': _env_int('PDF_MAX_RSS_MB', 1024) * 1024 * 1024,
+}
+
+# Các limit kiểm tra trên input (trả 413); còn lại là limit khi xử lý (trả 422)
+ADMISSION_LIMITS = ('max_upload_bytes', 'max_pages', 'max_objects', 'max_signatures', 'max_contents_bytes')
+
+# (?<!\d): chỉ thử match từ đầu một dãy chữ số - nếu không, dãy số dài (ví dụ
+# /Contents hex đệm 0) bị quét lại từ mọi vị trí, chi phí O(n^2)
+_OBJECT_HEADER_RE = re.compile(rb'(?<!\d)\d+\s+\d+\s+obj\b')
+_PAGE_RE = re.compile(rb'/Type\s*/Page(?![a-zA-Z])')
+_SIZE_RE = re.compile(rb'/Size\s+(\d+)')
+_BYTERANGE_RE = re.compile(rb'/ByteRange\s*\[\s*(\d+)\s+(\d+)\s+(\d+)\s+(\d+)\s*\]')
+
+
+class VerificationLimitExceeded(Exception):
+    """
+    Vượt giới hạn tài nguyên khi xác minh
+
+    Attributes:
+        limit: Tên limit (key trong DEFAULT_LIMITS)
+        actual: Giá trị thực tế đo được
+        maximum: Giá trị tối đa cho phép
+        stage: Stage đang chạy khi vượt giới hạn ('admission', 'parse', ...)
+    """
+
+    def __init__(self, limit, actual, maximum, stage='admission', message=None):
+        self.limit = limit
+        self.actual = actual
+        self.maximum = maximum
+        self.stage = stage
+        self.message = message or f"Vượt giới hạn {limit}: {actual} > {maximum} (stage: {stage})"
+        super().__init__(self.message)
+
+    @property
+    def http_status(self):
+        return 413 if self.limit in ADMISSION_LIMITS else 422
+
+    def to_dict(self):
+        return {
+            'limit': self.limit,
+            'actual': self.actual,
+            'maximum': self.maximum,
+            'stage': self.stage,
+        }
+
+
+def get_limits(**overrides):
+    """
+    Lấy bộ limit hiện hành (mặc định từ biến môi trường)
+
+    Returns:
+        dict: bản sao DEFAULT_LIMITS với các giá trị override
+    """
+    limits = dict(DEFAULT_LIMITS)
+    limits.update(overrides)
+    return limits
+
+
+def _exceeds(limits, key, value):
+    maximum = limits.get(key) or 0
+    return maximum > 0 and value > maximum
+
+
+def check_admission(pdf_path, limits=None):
+    """
+    Kiểm tra nhanh file PDF trên byte stream trước khi parse
+
+    Chỉ dùng regex trên mmap, không dựng object PDF nên chi phí tuyến tính theo
+    kích thước file và bộ nhớ không tăng theo nội dung. Số object/trang là ước
+    lượng (object nằm trong object stream nén không đếm được trực tiếp, nên lấy
+    thêm /Size lớn nhất của trailer).
+
+    Args:
+        pdf_path: Đường dẫn file PDF
+        limits: dict limit (mặc định get_limits())
+
+    Returns:
+        dict: Các chỉ số đã đo (bytes, objects, pages, signatures, max_contents_bytes)
+
+    Raises:
+        VerificationLimitExceeded: nếu vượt một admission limit
+    """
+    limits = limits or get_limits()
+    size = os.path.getsize(pdf_path)
+    if _exceeds(limits, 'max_upload_bytes', size):
+        raise VerificationLimitExceeded('max_upload_bytes', size, limits['max_upload_bytes'])
+
+    stats = {'bytes': size, 'objects': 0, 'pages': 0, 'signatures': 0, 'max_contents_bytes': 0}
+    if size == 0:
+        return stats
+
+    with open(pdf_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        sizes = [int(m.group(1)) for m in _SIZE_RE.finditer(data)]
+        stats['objects'] = max(sum(1 for _ in _OBJECT_HEADER_RE.finditer(data)), max(sizes, default=0))
+        if _exceeds(limits, 'max_objects', stats['objects']):
+            raise VerificationLimitExceeded('max_objects', stats['objects'], limits['max_objects'])
+
+        stats['pages'] = sum(1 for _ in _PAGE_RE.finditer(data))
+        if _exceeds(limits, 'max_pages', stats['pages']):
+            raise VerificationLimitExceeded('max_pages', stats['pages'], limits['max_pages'])
+
+        for match in _BYTERANGE_RE.finditer(data):
+            stats['signatures'] += 1
+            if _exceeds(limits, 'max_signatures', stats['signatures']):
+                raise VerificationLimitExceeded('max_signatures', stats['signatures'], limits['max_signatures'])
+
+            # /Contents <hex> nằm giữa 2 đoạn ByteRange: [off1+len1, off2)
+            off1, len1, off2 = int(match.group(1)), int(match.group(2)), int(match.group(3))
+            contents_bytes = max(off2 - (off1 + len1) - 2, 0) // 2
+            stats['max_contents_bytes'] = max(stats['max_contents_bytes'], contents_bytes)
+            if _exceeds(limits, 'max_contents_bytes', contents_bytes):
+                raise VerificationLimitExceeded('max_contents_bytes', contents_bytes, limits['max_contents_bytes'])
+
+    return stats
+
+
+def current_rss_bytes():
+    """
+    RSS hiện tại của process (bytes)
+
+    Đọc /proc/self/statm trên Linux; nơi khác dùng ru_maxrss (peak) làm xấp xỉ.
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class _StageTimeout(BaseException):
+    """
+    Raise từ SIGALRM handler để ngắt stage đang chạy quá deadline
+
+    Kế thừa BaseException để các khối `except Exception` rộng (pypdf, endesive,
+    api) không nuốt mất; VerificationGuard đổi nó thành VerificationLimitExceeded.
+    """
+
+
+# Độ sâu deferred_interrupts() và stage có timeout bị hoãn (chỉ main thread nhận SIGALRM)
+_interrupts = threading.local()
+
+
+@contextmanager
+def deferred_interrupts():
+    """
+    Section không được ngắt giữa chừng (swap sys.stdout/stderr, flock, ghi file...)
+
+    Timeout đến trong section được hoãn tới khi section kết thúc bình thường;
+    nếu section kết thúc bằng exception thì bỏ qua, guard vẫn báo hết hạn khi
+    đóng stage.
+    """
+    depth = getattr(_interrupts, 'depth', 0)
+    _interrupts.depth = depth + 1
+    try:
+        yield
+    finally:
+        _interrupts.depth = depth
+    if depth == 0:
+        pending, _interrupts.pending = getattr(_interrupts, 'pending', None), None
+        if pending is not None:
+            raise _StageTimeout(pending)
+
+
+class _Stage:
+    """Stage đang mở của VerificationGuard"""
+
+    def __init__(self, name, budget, contexts, use_alarm, previous_handler):
+        self.name = name
+        self.budget = budget
+        self.contexts = contexts
+        self.use_alarm = use_alarm
+        self.previous_handler = previous_handler
+        self.started = time.monotonic()
+
+
+class VerificationGuard:
+    """
+    Deadline theo stage và ngân sách RSS cho một lần xác minh
+
+    Stage được mở bằng enter(name) và đóng ở enter() kế tiếp hoặc leave(). Việc
+    đóng stage là điểm kiểm tra an toàn: ghi thời gian, raise
+    VerificationLimitExceeded nếu stage quá deadline hoặc RSS vượt ngân sách.
+    run() bao cả lần xác minh để stage đang mở luôn được đóng kể cả khi có exception.
+
+    Khi chạy trong main thread (gunicorn sync worker, CLI), SIGALRM ngắt stage chạy
+    quá deadline (ví dụ endesive quét lặp vô hạn) bằng _StageTimeout - một lần, và
+    hoãn lại nếu đang trong deferred_interrupts(). Ở thread khác (dev server,
+    gthread) không đặt được signal handler nên chỉ kiểm tra khi đóng stage.
+
+    Usage:
+        guard = VerificationGuard()
+        with guard.run():
+            guard.enter('parse')
+            reader = PdfReader(pdf_path)
+            guard.enter('dss')
+            ...
+
+        with guard.stage('parse'):      # một stage đơn lẻ
+            reader = PdfReader(pdf_path)
+    """
+
+    def __init__(self, limits=None):
+        self.limits = limits or get_limits()
+        self.started = time.monotonic()
+        self.stage_timings = {}
+        self._current = None
+        self._expired_stage = None
+
+    def remaining(self):
+        """Thời gian còn lại của tổng deadline (giây), None nếu không giới hạn"""
+        total = self.limits.get('verify_timeout_seconds') or 0
+        if total <= 0:
+            return None
+        return total - (time.monotonic() - self.started)
+
+    def _stage_budget(self):
+        budgets = [b for b in (self.limits.get('stage_timeout_seconds') or 0, self.remaining()) if b is not None and b != 0]
+        return min(budgets) if budgets else None
+
+    def _timeout_error(self, name, elapsed):
+        remaining = self.remaining()
+        if remaining is not None and remaining <= 0:
+            return VerificationLimitExceeded(
+                'verify_timeout_seconds', round(time.monotonic() - self.started, 3),
+                self.limits['verify_timeout_seconds'], stage=name,
+            )
+        return VerificationLimitExceeded(
+            'stage_timeout_seconds', round(elapsed, 3), self.limits['stage_timeout_seconds'], stage=name,
+        )
+
+    def check_memory(self, stage):
+        """Raise nếu RSS của worker vượt ngân sách"""
+        maximum = self.limits.get('max_rss_bytes') or 0
+        if maximum <= 0:
+            return
+        rss = current_rss_bytes()
+        if rss > maximum:
+            raise VerificationLimitExceeded('max_rss_bytes', rss, maximum, stage=stage)
+
+    def enter(self, name, *contexts):
+        """
+        Đóng stage đang mở (điểm kiểm tra an toàn) rồi mở stage `name`
+
+        Args:
+            name: Tên stage
+            contexts: Context manager mở cùng stage và đóng khi stage đóng (ví dụ span tracing)
+
+        Raises:
+            VerificationLimitExceeded: stage trước quá deadline / vượt RSS, hoặc hết tổng deadline
+        """
+        self.leave()
+        budget = self._stage_budget()
+        if budget is not None and budget <= 0:
+            raise self._timeout_error(name, 0.0)
+
+        use_alarm = (
+            budget is not None
+            and hasattr(signal, 'setitimer')
+            and threading.current_thread() is threading.main_thread()
+        )
+        previous_handler = None
+        self._expired_stage = None
+
+        def on_alarm(signum, frame):
+            self._expired_stage = name
+            if getattr(_interrupts, 'depth', 0):
+                _interrupts.pending = name
+            else:
+                raise _StageTimeout(name)
+
+        stack = ExitStack()
+        for context in contexts:
+            stack.enter_context(context)
+        if use_alarm:
+            previous_handler = signal.signal(signal.SIGALRM, on_alarm)
+            signal.setitimer(signal.ITIMER_REAL, budget)
+        self._current = _Stage(name, budget, stack, use_alarm, previous_handler)
+
+    def leave(self, exc_info=None):
+        """
+        Đóng stage đang mở (nếu có)
+
+        Args:
+            exc_info: (type, value, traceback) khi đóng vì exception - khi đó không
+                      raise thêm, chỉ ghi thời gian và chuyển exception cho contexts
+
+        Raises:
+            VerificationLimitExceeded: khi stage quá deadline hoặc RSS vượt ngân sách
+        """
+        stage, self._current = self._current, None
+        if stage is None:
+            return
+        if stage.use_alarm:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, stage.previous_handler)
+        _interrupts.pending = None
+
+        elapsed = time.monotonic() - stage.started
+        self.stage_timings[stage.name] = self.stage_timings.get(stage.name, 0.0) + elapsed
+        stage.contexts.__exit__(*(exc_info or (None, None, None)))
+        if exc_info:
+            return
+        if self._expired_stage is not None or (stage.budget is not None and elapsed > stage.budget):
+            raise self._timeout_error(stage.name, elapsed)
+        self.check_memory(stage.name)
+
+    def check(self):
+        """
+        Điểm kiểm tra an toàn trong một stage dài (ví dụ vòng lặp ở thread không có SIGALRM)
+
+        Raises:
+            VerificationLimitExceeded: khi stage hiện tại đã quá deadline
+        """
+        stage = self._current
+        if stage is None:
+            return
+        if self._expired_stage is not None or (stage.budget is not None and time.monotonic() - stage.started > stage.budget):
+            self.leave()
+
+    def expire(self, reason=None):
+        """
+        Kết thúc stage hiện tại như khi hết deadline, không chờ tới deadline
+
+        Dùng khi biết chắc stage sẽ chạy tới deadline (ví dụ ByteRange khiến endesive
+        quét lặp vô hạn): lỗi giống lỗi của lần chạy tới deadline, với thời gian
+        thực tế là deadline đó.
+
+        Args:
+            reason: Lý do (đưa vào message)
+
+        Raises:
+            VerificationLimitExceeded: stage_timeout_seconds, hoặc verify_timeout_seconds
+                                       nếu tổng deadline đến trước deadline của stage
+        """
+        stage = self._current
+        name = stage.name if stage else 'unknown'
+        started = stage.started if stage else time.monotonic()
+        total = self.limits.get('verify_timeout_seconds') or 0
+        stage_limit = self.limits.get('stage_timeout_seconds') or 0
+        suffix = f" - {reason}" if reason else ""
+        if total > 0 and (stage_limit <= 0 or started - self.started + stage_limit >= total):
+            error = VerificationLimitExceeded(
+                'verify_timeout_seconds', total, total, stage=name,
+                message=f"Vượt giới hạn verify_timeout_seconds: {total} (stage: {name}){suffix}",
+            )
+        else:
+            error = VerificationLimitExceeded(
+                'stage_timeout_seconds', stage_limit, stage_limit, stage=name,
+                message=f"Vượt giới hạn stage_timeout_seconds: {stage_limit} (stage: {name}){suffix}",
+            )
+        self.leave((type(error), error, None))
+        raise error
+
+    @contextmanager
+    def run(self):
+        """
+        Bao một lần xác minh dùng enter()/leave()
+
+        Stage đang mở luôn được đóng khi thoát; _StageTimeout và MemoryError được đổi
+        thành VerificationLimitExceeded.
+
+        Raises:
+            VerificationLimitExceeded: khi hết thời gian, vượt RSS hoặc hết bộ nhớ
+        """
+        try:
+            yield self
+        except _StageTimeout as e:
+            name = self._current.name if self._current else e.args[0]
+            elapsed = time.monotonic() - self._current.started if self._current else 0.0
+            self.leave(sys.exc_info())
+            raise self._timeout_error(name, elapsed) from None
+        except MemoryError:
+            name = self._current.name if self._current else 'unknown'
+            self.leave(sys.exc_info())
+            raise VerificationLimitExceeded(
+                'max_rss_bytes', current_rss_bytes(), self.limits.get('max_rss_bytes'), stage=name,
+                message=f"Hết bộ nhớ khi xử lý (stage: {name})",
+            ) from None
+        except BaseException:
+            self.leave(sys.exc_info())
+            raise
+        self.leave()
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Chạy một stage đơn lẻ với deadline và kiểm tra bộ nhớ
+
+        Raises:
+            VerificationLimitExceeded: khi hết thời gian, vượt RSS hoặc hết bộ nhớ
+        """
+        with self.run():
+            self.enter(name)
+            yield
@@ -0,0 +1,342 @@
+"""
+Đo tải HTTP cho /api/verify-pdf với nhiều cấu hình Gunicorn
+
+Mỗi cấu hình (worker class, số worker, số thread) được khởi động bằng
+gunicorn.conf.py rồi bắn request với tốc độ đến cố định (open loop: request thứ i
+được gửi tại start + i / rate dù các request trước đã xong hay chưa). Độ trễ tính
+từ thời điểm dự kiến gửi, nên khi server quá tải, thời gian chờ phía client
+cũng được tính (tránh coordinated omission).
+
+Body là hỗn hợp PDF sinh bởi sample_pdfs.py (hoặc các file trong --samples) theo
+trọng số --mix. Mặc định mỗi body được thêm một comment ngẫu nhiên sau %%EOF
+(nằm ngoài ByteRange nên chữ ký vẫn hợp lệ) và server chạy với single-flight +
+verdict cache tắt, để đo đúng chi phí xác minh; dùng --keep-caches để đo cấu hình
+production.
+
+Báo cáo cho mỗi cấu hình và mỗi tốc độ: throughput đạt được, p50/p95/p99, tỷ lệ lỗi,
+PSS tổng và RSS worker lớn nhất (đọc /proc, chỉ Linux). Saturation throughput là
+throughput cao nhất đạt được với tỷ lệ lỗi <= 1%.
+
+Cấu hình: <worker_class>:<workers>[x<threads>]
+    sync:4         4 process, mỗi process một request (mặc định production)
+    gthread:4x4    4 process x 4 thread (deadline SIGALRM chỉ áp dụng ở main thread)
+    gevent:8       async (cần cài gevent; không có thì báo skipped)
+
+Usage:
+    python loadtest.py --configs sync:2,sync:4,gthread:4x4 --rates 5,10,20,40 --duration 20
+    python loadtest.py --samples samples/ --mix small_rsa=3,large_5mb=1 --json
+"""
+
+import argparse
+import concurrent.futures
+import http.client
+import importlib.util
+import json
+import os
+import random
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+
+from startup_profile import HERE, child_pids, memory_kb
+
+DEFAULT_MIX = 'small_rsa=3,small_ecdsa=2,signed_attrs=3,pages_200=1,ltv_ocsp=1'
+
+# Worker class cần thư viện ngoài
+ASYNC_WORKER_MODULES = {'gevent': 'gevent', 'eventlet': 'eventlet'}
+
+
+def parse_config(spec):
+    """'gthread:4x4' -> {'name', 'worker_class', 'workers', 'threads'}"""
+    worker_class, _, size = spec.partition(':')
+    workers, _, threads = (size or '4').partition('x')
+    return {
+        'name': spec,
+        'worker_class': worker_class,
+        'workers': int(workers),
+        'threads': int(threads or 1),
+    }
+
+
+def parse_mix(spec):
+    """'small_rsa=3,large_5mb=1' -> {'small_rsa': 3.0, 'large_5mb': 1.0}"""
+    mix = {}
+    for part in spec.split(','):
+        kind, _, weight = part.partition('=')
+        if kind.strip():
+            mix[kind.strip()] = float(weight or 1)
+    return mix
+
+
+def load_bodies(mix, samples_dir=None):
+    """
+    PDF cho từng loại trong mix: đọc <samples_dir>/<kind>.pdf hoặc sinh bằng sample_pdfs
+
+    Returns:
+        dict: kind -> bytes
+    """
+    if samples_dir:
+        bodies = {}
+        for kind in mix:
+            with open(os.path.join(samples_dir, f"{kind}.pdf"), 'rb') as f:
+                bodies[kind] = f.read()
+        return bodies
+
+    from sample_pdfs import SampleFactory
+    factory = SampleFactory()
+    return {kind: factory.build(kind) for kind in mix}
+
+
+class MemorySampler:
+    """Lấy PSS tổng (master + worker) và RSS worker lớn nhất định kỳ trong lúc đo"""
+
+    def __init__(self, master_pid, interval=0.5):
+        self.master_pid = master_pid
+        self.interval = interval
+        self.peak_total_pss_kb = 0
+        self.peak_worker_rss_kb = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        return False
+
+    def _run(self):
+        while True:
+            try:
+                workers = [memory_kb(pid) for pid in child_pids(self.master_pid)]
+                master = memory_kb(self.master_pid)
+            except OSError:
+                workers, master = [], {'pss_kb': None}
+            total = (master['pss_kb'] or 0) + sum(m['pss_kb'] or 0 for m in workers)
+            self.peak_total_pss_kb = max(self.peak_total_pss_kb, total)
+            self.peak_worker_rss_kb = max([self.peak_worker_rss_kb] + [m['rss_kb'] or 0 for m in workers])
+            if self._stop.wait(self.interval):
+                return
+
+
+def start_server(config, port, extra_env, startup_timeout=60.0):
+    """Khởi động gunicorn theo cấu hình, chờ /api/health trả 200"""
+    env = dict(os.environ)
+    env.update(extra_env)
+    env.update({
+        'GUNICORN_BIND': f'127.0.0.1:{port}',
+        'GUNICORN_WORKERS': str(config['workers']),
+        'GUNICORN_WORKER_CLASS': config['worker_class'],
+        'GUNICORN_THREADS': str(config['threads']),
+    })
+    proc = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'api:app'],
+        cwd=HERE, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + startup_timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"gunicorn thoát với mã {proc.returncode}")
+        try:
+            with urllib.request.urlopen(f'http://127.0.0.1:{port}/api/health', timeout=1) as resp:
+                if resp.status == 200:
+                    return proc
+        except OSError:
+            time.sleep(0.05)
+    stop_server(proc)
+    raise RuntimeError("gunicorn không sẵn sàng trong thời gian chờ")
+
+
+def stop_server(proc):
+    proc.send_signal(signal.SIGTERM)
+    try:
+        proc.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+
+
+def post_pdf(port, body, timeout):
+    """Gửi PDF thô, trả về HTTP status"""
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=timeout)
+    try:
+        conn.request('POST', '/api/verify-pdf', body, {'Content-Type': 'application/pdf'})
+        resp = conn.getresponse()
+        resp.read()
+        return resp.status
+    finally:
+        conn.close()
+
+
+def _percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(p / 100.0 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def run_rate(port, bodies, mix, rate, duration, timeout, max_in_flight, unique_bodies, seed):
+    """
+    Bắn request với tốc độ cố định trong duration giây
+
+    Returns:
+        dict: offered_rps, achieved_rps, p50/p95/p99 (ms), error_rate, errors
+    """
+    rng = random.Random(seed)
+    kinds = list(mix)
+    weights = [mix[k] for k in kinds]
+    total = max(1, int(rate * duration))
+    latencies, errors = [], {}
+    lock = threading.Lock()
+
+    def task(scheduled, body):
+        try:
+            status = post_pdf(port, body, timeout)
+            error = None if status == 200 else f"http_{status}"
+        except (OSError, http.client.HTTPException) as e:
+            error = type(e).__name__
+        finished = time.perf_counter()
+        with lock:
+            if error:
+                errors[error] = errors.get(error, 0) + 1
+            else:
+                latencies.append(finished - scheduled)
+            return finished
+
+    start = time.perf_counter() + 0.1
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_in_flight) as pool:
+        futures = []
+        for i in range(total):
+            body = bodies[rng.choices(kinds, weights)[0]]
+            if unique_bodies:
+                body = body + b"%% %016x\n" % rng.getrandbits(64)
+            scheduled = start + i / rate
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            futures.append(pool.submit(task, scheduled, body))
+        last_finished = max(f.result() for f in futures)
+
+    latencies.sort()
+    # Ít nhất bằng khoảng thời gian lịch gửi, để tốc độ thấp không bị tính vượt offered
+    elapsed = max(last_finished - start, total / rate)
+    n_errors = sum(errors.values())
+    return {
+        'offered_rps': rate,
+        'requests': total,
+        'achieved_rps': round(len(latencies) / elapsed, 2),
+        'p50_ms': round(_percentile(latencies, 50) * 1000, 1) if latencies else None,
+        'p95_ms': round(_percentile(latencies, 95) * 1000, 1) if latencies else None,
+        'p99_ms': round(_percentile(latencies, 99) * 1000, 1) if latencies else None,
+        'error_rate': round(n_errors / total, 4),
+        'errors': errors,
+    }
+
+
+def run_config(config, args, bodies, mix):
+    """Đo một cấu hình server qua các tốc độ trong args.rates"""
+    result = dict(config, rates=[], saturation_rps=None)
+    module = ASYNC_WORKER_MODULES.get(config['worker_class'])
+    if module and importlib.util.find_spec(module) is None:
+        result['skipped'] = f"{module} chưa được cài"
+        return result
+
+    extra_env = {'GUNICORN_TIMEOUT': str(int(args.timeout) + 30)}
+    if not args.keep_caches:
+        extra_env.update({'PDF_SINGLEFLIGHT': '0', 'PDF_VERDICT_CACHE_SIZE': '0'})
+
+    proc = start_server(config, args.port, extra_env)
+    try:
+        # Warm-up: mỗi loại body một lần cho mỗi worker (lazy import endesive, ...)
+        for body in bodies.values():
+            for _ in range(config['workers']):
+                post_pdf(args.port, body, args.timeout)
+
+        for rate in args.rates:
+            with MemorySampler(proc.pid) as memory:
+                stats = run_rate(args.port, bodies, mix, rate, args.duration, args.timeout,
+                                 args.max_in_flight, not args.keep_caches, args.seed)
+            stats['peak_total_pss_mb'] = round(memory.peak_total_pss_kb / 1024, 1)
+            stats['peak_worker_rss_mb'] = round(memory.peak_worker_rss_kb / 1024, 1)
+            result['rates'].append(stats)
+            if not args.quiet:
+                print(f"  {config['name']:<14} {rate:>6g} rps -> {stats['achieved_rps']:>7g} rps, "
+                      f"p99 {stats['p99_ms']} ms, errors {stats['error_rate']:.1%}", file=sys.stderr)
+            # Đã quá tải rõ ràng: các tốc độ cao hơn chỉ tốn thời gian
+            if stats['error_rate'] > 0.5 or stats['achieved_rps'] < 0.5 * rate:
+                break
+    finally:
+        stop_server(proc)
+
+    healthy = [r['achieved_rps'] for r in result['rates'] if r['error_rate'] <= 0.01]
+    result['saturation_rps'] = max(healthy) if healthy else None
+    return result
+
+
+def print_report(report):
+    """In kết quả dạng bảng"""
+    header = (f"{'config':<14} {'offered':>8} {'achieved':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+              f"{'errors':>7} {'PSS MB':>7} {'wRSS MB':>8}")
+    print(header)
+    print('-' * len(header))
+    for r in report['configs']:
+        if 'skipped' in r:
+            print(f"{r['name']:<14} skipped: {r['skipped']}")
+            continue
+        for s in r['rates']:
+            print(f"{r['name']:<14} {s['offered_rps']:>8g} {s['achieved_rps']:>9g} {s['p50_ms'] or '-':>8} "
+                  f"{s['p95_ms'] or '-':>8} {s['p99_ms'] or '-':>8} {s['error_rate']:>7.1%} "
+                  f"{s['peak_total_pss_mb']:>7} {s['peak_worker_rss_mb']:>8}")
+    print()
+    for r in report['configs']:
+        if 'skipped' not in r:
+            print(f"{r['name']:<14} saturation throughput: {r['saturation_rps']} rps")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Đo tải /api/verify-pdf với nhiều cấu hình Gunicorn')
+    parser.add_argument('--configs', default='sync:2,sync:4,gthread:4x4',
+                        help='Danh sách <worker_class>:<workers>[x<threads>], cách nhau bởi dấu phẩy')
+    parser.add_argument('--rates', default='5,10,20,40', help='Tốc độ đến (request/giây), tăng dần')
+    parser.add_argument('--duration', type=float, default=20.0, help='Thời gian đo mỗi tốc độ (giây)')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help='Loại PDF và trọng số, ví dụ small_rsa=3,large_5mb=1')
+    parser.add_argument('--samples', help='Thư mục chứa <kind>.pdf (mặc định sinh bằng sample_pdfs.py)')
+    parser.add_argument('--timeout', type=float, default=60.0, help='Timeout mỗi request (giây)')
+    parser.add_argument('--max-in-flight', type=int, default=256, help='Số request đồng thời tối đa phía client')
+    parser.add_argument('--keep-caches', action='store_true',
+                        help='Giữ single-flight + verdict cache và gửi body giống nhau')
+    parser.add_argument('--port', type=int, default=5201)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', action='store_true', help='In kết quả dạng JSON')
+    parser.add_argument('--quiet', action='store_true', help='Không in tiến độ ra stderr')
+    args = parser.parse_args()
+    args.rates = [float(r) for r in args.rates.split(',')]
+
+    mix = parse_mix(args.mix)
+    bodies = load_bodies(mix, args.samples)
+    report = {
+        'mix': mix,
+        'body_bytes': {kind: len(body) for kind, body in bodies.items()},
+        'duration_seconds': args.duration,
+        'keep_caches': args.keep_caches,
+        'cpu_count': os.cpu_count(),
+        'configs': [],
+    }
+    # Single-flight dùng thư mục riêng để không lẫn với server khác đang chạy
+    os.environ.setdefault('PDF_SINGLEFLIGHT_DIR', tempfile.mkdtemp(prefix='pdf-loadtest-'))
+    for spec in args.configs.split(','):
+        report['configs'].append(run_config(parse_config(spec), args, bodies, mix))
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+
+if __name__ == '__main__':
+    main()
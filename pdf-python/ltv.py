@@ -0,0 +1,481 @@
+"""
+Long-term validation (PAdES-LTV): đọc /DSS (Document Security Store)
+
+Tài liệu LTV nhúng sẵn chứng chỉ, CRL và OCSP response trong /DSS của catalog
+(và /VRI theo từng chữ ký) để có thể kiểm tra chuỗi chứng chỉ và thu hồi
+hoàn toàn offline.
+
+DSS được đọc MỘT lần cho mỗi tài liệu thành ValidationDataPool, dùng chung cho
+mọi chữ ký trong tài liệu:
+- chứng chỉ được khử trùng lặp theo SHA-256 của DER trước khi decode
+  (cùng CA cert xuất hiện ở DSS và trong CMS của nhiều chữ ký chỉ decode một lần)
+- index theo subject để tìm issuer, CRL theo issuer, OCSP theo serial
+- kết quả kiểm tra chữ ký "A được cấp bởi B" được cache theo cặp fingerprint
+
+Dữ liệu thu hồi trong DSS do người tạo PDF đưa vào nên không được tin sẵn:
+OCSP response chỉ được dùng khi chữ ký của nó verify được bằng khoá của issuer
+(hoặc của responder được issuer uỷ quyền, có EKU id-kp-OCSPSigning); CRL chỉ
+được dùng khi verify được bằng khoá của issuer. Không có dữ liệu nào verify
+được thì trạng thái là 'unknown'.
+
+Trạng thái thu hồi được xét tại validation time của chữ ký (gen_time của TSA,
+không có thì thời gian ký): cert bị thu hồi SAU thời điểm đó vẫn là 'good'.
+OCSP và CRL dùng chung một quy tắc còn hạn (_is_fresh).
+"""
+
+import hashlib
+from datetime import datetime, timedelta, timezone
+
+from asn1crypto import keys as asn1_keys
+from cryptography import x509
+from cryptography.exceptions import InvalidSignature, UnsupportedAlgorithm
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec, ed448, ed25519, padding, rsa
+from cryptography.x509 import ocsp
+from cryptography.x509.oid import ExtendedKeyUsageOID
+
+MAX_CHAIN_LENGTH = 10
+
+# Sai lệch đồng hồ cho phép khi so thisUpdate / nextUpdate của OCSP response / CRL
+REVOCATION_CLOCK_SKEW = timedelta(minutes=5)
+# OCSP response / CRL không có nextUpdate chỉ được dùng trong khoảng này sau thisUpdate
+REVOCATION_MAX_AGE = timedelta(days=7)
+
+
+def _stream_bytes(ref, seen):
+    """
+    Dữ liệu (đã giải nén) của một stream trong DSS
+
+    Trả None nếu cùng object đã được đọc (VRI thường tham chiếu lại stream trong /Certs)
+    hoặc entry không phải stream
+    """
+    key = getattr(ref, 'idnum', None)
+    if key is not None:
+        if key in seen:
+            return None
+        seen.add(key)
+    get_data = getattr(ref.get_object(), 'get_data', None)
+    return get_data() if get_data is not None else None
+
+
+def _resolve(value, kind):
+    """value.get_object() nếu là kiểu `kind` (dict / list), None nếu không"""
+    try:
+        value = value.get_object() if value is not None else None
+    except Exception:
+        return None
+    return value if isinstance(value, kind) else None
+
+
+def _signature_valid(public_key, signature, data, hash_algorithm):
+    """Chữ ký (OCSP response) trên data có verify được bằng public_key không"""
+    try:
+        if isinstance(public_key, rsa.RSAPublicKey):
+            public_key.verify(signature, data, padding.PKCS1v15(), hash_algorithm)
+        elif isinstance(public_key, ec.EllipticCurvePublicKey):
+            public_key.verify(signature, data, ec.ECDSA(hash_algorithm))
+        elif isinstance(public_key, (ed25519.Ed25519PublicKey, ed448.Ed448PublicKey)):
+            public_key.verify(signature, data)
+        else:
+            return False
+    except (ValueError, TypeError, InvalidSignature, UnsupportedAlgorithm):
+        return False
+    return True
+
+
+def _is_fresh(this_update, next_update, validation_time):
+    """
+    OCSP single response / CRL dùng được để xét trạng thái tại validation_time
+
+    thisUpdate không được ở tương lai so với hiện tại; dữ liệu lấy SAU validation_time
+    vẫn dùng được (cert chưa bị thu hồi lúc đó thì cũng chưa bị thu hồi trước đó).
+    nextUpdate (không có thì thisUpdate + REVOCATION_MAX_AGE) không được trước
+    validation_time - dữ liệu đã hết hạn không nói gì về thời điểm đó.
+    """
+    if this_update > datetime.now(timezone.utc) + REVOCATION_CLOCK_SKEW:
+        return False
+    expires = next_update if next_update is not None else this_update + REVOCATION_MAX_AGE
+    return expires >= validation_time - REVOCATION_CLOCK_SKEW
+
+
+def _is_ocsp_signing(cert):
+    try:
+        usage = cert.extensions.get_extension_for_class(x509.ExtendedKeyUsage).value
+    except (x509.ExtensionNotFound, ValueError):
+        return False
+    return ExtendedKeyUsageOID.OCSP_SIGNING in usage
+
+
+def _der_prefix(data):
+    """
+    Cắt phần padding 0x00 phía sau một DER object (/Contents thường được pad)
+
+    Returns:
+        bytes: đúng độ dài DER theo header, hoặc data nguyên vẹn nếu không đọc được header
+    """
+    if len(data) < 2:
+        return data
+    first = data[1]
+    if first < 0x80:
+        return data[:2 + first]
+    n = first & 0x7F
+    if n == 0 or len(data) < 2 + n:
+        return data
+    length = int.from_bytes(data[2:2 + n], 'big')
+    return data[:2 + n + length]
+
+
+def vri_keys(cms_bytes):
+    """
+    Các key /VRI có thể ứng với một chữ ký
+
+    Key là SHA-1 (hex, chữ hoa) của giá trị /Contents. Một số writer băm cả phần
+    padding, số khác chỉ băm DER, nên trả về cả hai.
+    """
+    keys = [hashlib.sha1(cms_bytes).hexdigest().upper()]
+    trimmed = _der_prefix(cms_bytes)
+    if trimmed != cms_bytes:
+        keys.append(hashlib.sha1(trimmed).hexdigest().upper())
+    return keys
+
+
+class ValidationDataPool:
+    """
+    Kho chứng chỉ / CRL / OCSP của một tài liệu (DSS + CMS của các chữ ký)
+
+    Usage:
+        pool = load_validation_data(reader)
+        pool.add_certificates(cms_certificates)
+        chain = pool.build_chain(signer_cert)
+        status, source = pool.revocation_status(signer_cert, chain[1] if len(chain) > 1 else None)
+    """
+
+    def __init__(self, validation_time=None):
+        self.has_dss = False
+        self.validation_time = validation_time  # mặc định cho mọi chữ ký, None = thời điểm kiểm tra
+        self.vri = {}
+        self._certs = {}             # fingerprint -> Certificate
+        self._sources = {}           # fingerprint -> 'dss' | 'cms'
+        self._by_subject = {}        # subject DER -> [fingerprint]
+        self._crls = {}              # issuer DER -> [CertificateRevocationList]
+        self._ocsp = {}              # serial -> [(OCSPResponse, OCSPSingleResponse)]
+        self._issued_by = {}         # (child fp, issuer fp) -> bool
+        self._signed_by = {}         # (id(OCSP response / CRL), issuer fp) -> bool
+        self._validations = {}       # (signer fp, validation time) -> kết quả validate()
+        self.crl_count = 0
+        self.ocsp_count = 0
+
+    @property
+    def cert_count(self):
+        return len(self._certs)
+
+    def _add_cert(self, fingerprint, cert, source):
+        self._certs[fingerprint] = cert
+        self._sources[fingerprint] = source
+        self._by_subject.setdefault(cert.subject.public_bytes(), []).append(fingerprint)
+
+    def add_der_certificate(self, der, source='dss'):
+        """Thêm chứng chỉ DER (bỏ qua nếu đã có, không decode lại)"""
+        fingerprint = hashlib.sha256(der).hexdigest()
+        if fingerprint in self._certs:
+            return self._certs[fingerprint]
+        try:
+            cert = x509.load_der_x509_certificate(der)
+        except ValueError:
+            return None
+        self._add_cert(fingerprint, cert, source)
+        return cert
+
+    def add_certificates(self, certificates, source='cms'):
+        """
+        Thêm các chứng chỉ đã decode (ví dụ từ CMS của một chữ ký)
+
+        Returns:
+            list: chứng chỉ tương ứng trong pool (dùng lại object đã có nếu trùng)
+        """
+        pooled = []
+        for cert in certificates:
+            fingerprint = cert.fingerprint(hashes.SHA256()).hex()
+            if fingerprint not in self._certs:
+                self._add_cert(fingerprint, cert, source)
+            pooled.append(self._certs[fingerprint])
+        return pooled
+
+    def add_crl(self, der):
+        try:
+            crl = x509.load_der_x509_crl(der)
+        except ValueError:
+            return
+        self._crls.setdefault(crl.issuer.public_bytes(), []).append(crl)
+        self.crl_count += 1
+
+    def add_ocsp(self, der):
+        try:
+            response = ocsp.load_der_ocsp_response(der)
+            if response.response_status != ocsp.OCSPResponseStatus.SUCCESSFUL:
+                return
+            for single in response.responses:
+                self._ocsp.setdefault(single.serial_number, []).append((response, single))
+        except ValueError:
+            return
+        self.ocsp_count += 1
+
+    def source_of(self, cert):
+        return self._sources.get(cert.fingerprint(hashes.SHA256()).hex(), 'cms')
+
+    def _is_issued_by(self, child, child_fp, issuer, issuer_fp):
+        key = (child_fp, issuer_fp)
+        if key not in self._issued_by:
+            try:
+                child.verify_directly_issued_by(issuer)
+                self._issued_by[key] = True
+            except (ValueError, TypeError, InvalidSignature, UnsupportedAlgorithm):
+                self._issued_by[key] = False
+        return self._issued_by[key]
+
+    def find_issuer(self, cert):
+        """Tìm chứng chỉ đã ký cert trong pool (so subject rồi kiểm tra chữ ký), None nếu không có"""
+        child_fp = cert.fingerprint(hashes.SHA256()).hex()
+        for issuer_fp in self._by_subject.get(cert.issuer.public_bytes(), ()):
+            if issuer_fp == child_fp:
+                continue
+            issuer = self._certs[issuer_fp]
+            if self._is_issued_by(cert, child_fp, issuer, issuer_fp):
+                return issuer
+        return None
+
+    def build_chain(self, cert):
+        """
+        Dựng chuỗi chứng chỉ từ cert tới root (hoặc tới chỗ thiếu issuer)
+
+        Returns:
+            (chain: list, complete: bool) - complete = True nếu kết thúc ở cert self-signed
+        """
+        chain = [cert]
+        current = cert
+        while len(chain) < MAX_CHAIN_LENGTH:
+            if current.issuer == current.subject:
+                return chain, True
+            issuer = self.find_issuer(current)
+            if issuer is None or issuer in chain:
+                return chain, False
+            chain.append(issuer)
+            current = issuer
+        return chain, False
+
+    def _is_responder(self, response, cert):
+        if response.responder_key_hash is not None:
+            return _issuer_key_hash(cert, hashes.SHA1()) == response.responder_key_hash
+        return cert.subject == response.responder_name
+
+    def _ocsp_signed_by(self, response, issuer, issuer_fp):
+        """
+        Response được ký bởi issuer, hoặc bởi responder uỷ quyền: chứng chỉ kèm trong
+        response, do chính issuer cấp, có EKU id-kp-OCSPSigning và còn hạn lúc ký response
+        """
+        key = (id(response), issuer_fp)
+        if key not in self._signed_by:
+            signer = None
+            try:
+                if self._is_responder(response, issuer):
+                    signer = issuer
+                else:
+                    for cert in response.certificates:
+                        cert_fp = cert.fingerprint(hashes.SHA256()).hex()
+                        if (self._is_responder(response, cert)
+                                and _is_ocsp_signing(cert)
+                                and cert.not_valid_before_utc <= response.produced_at_utc <= cert.not_valid_after_utc
+                                and self._is_issued_by(cert, cert_fp, issuer, issuer_fp)):
+                            signer = cert
+                            break
+                self._signed_by[key] = signer is not None and _signature_valid(
+                    signer.public_key(), response.signature, response.tbs_response_bytes,
+                    response.signature_hash_algorithm)
+            except (ValueError, TypeError, UnsupportedAlgorithm):
+                self._signed_by[key] = False
+        return self._signed_by[key]
+
+    def _crl_signed_by(self, crl, issuer, issuer_fp):
+        key = (id(crl), issuer_fp)
+        if key not in self._signed_by:
+            try:
+                self._signed_by[key] = crl.is_signature_valid(issuer.public_key())
+            except (ValueError, TypeError, UnsupportedAlgorithm):
+                self._signed_by[key] = False
+        return self._signed_by[key]
+
+    def revocation_status(self, cert, issuer=None, validation_time=None):
+        """
+        Trạng thái thu hồi của cert tại validation_time theo dữ liệu nhúng (OCSP trước, rồi CRL)
+
+        Chỉ dùng OCSP response / CRL còn hạn (_is_fresh) và verify được theo issuer của
+        cert (issuer không truyền vào thì tìm trong pool); không tìm được issuer thì không
+        tin dữ liệu nào. Cert bị thu hồi sau validation_time là 'good'.
+
+        Args:
+            validation_time: datetime (UTC) - mặc định self.validation_time, rồi hiện tại
+
+        Returns:
+            (status: 'good' | 'revoked' | 'unknown', source: 'ocsp' | 'crl' | None)
+        """
+        validation_time = validation_time or self.validation_time or datetime.now(timezone.utc)
+        issuer = issuer or self.find_issuer(cert)
+        if issuer is None:
+            return 'unknown', None
+        issuer_fp = issuer.fingerprint(hashes.SHA256()).hex()
+
+        issuer_key_hashes = {}
+        for response, single in self._ocsp.get(cert.serial_number, ()):
+            # Response phải thuộc đúng issuer (cùng serial có thể do CA khác cấp)
+            algorithm = single.hash_algorithm
+            if algorithm.name not in issuer_key_hashes:
+                issuer_key_hashes[algorithm.name] = _issuer_key_hash(issuer, algorithm)
+            if single.issuer_key_hash != issuer_key_hashes[algorithm.name]:
+                continue
+            if (not _is_fresh(single.this_update_utc, single.next_update_utc, validation_time)
+                    or not self._ocsp_signed_by(response, issuer, issuer_fp)):
+                continue
+            if single.certificate_status == ocsp.OCSPCertStatus.GOOD:
+                return 'good', 'ocsp'
+            if single.certificate_status == ocsp.OCSPCertStatus.REVOKED:
+                if single.revocation_time_utc <= validation_time:
+                    return 'revoked', 'ocsp'
+                return 'good', 'ocsp'
+
+        for crl in self._crls.get(cert.issuer.public_bytes(), ()):
+            if (not _is_fresh(crl.last_update_utc, crl.next_update_utc, validation_time)
+                    or not self._crl_signed_by(crl, issuer, issuer_fp)):
+                continue
+            revoked = crl.get_revoked_certificate_by_serial_number(cert.serial_number)
+            if revoked is not None and revoked.revocation_date_utc <= validation_time:
+                return 'revoked', 'crl'
+            return 'good', 'crl'
+
+        return 'unknown', None
+
+    def validate(self, cert, validation_time=None):
+        """
+        Dựng chuỗi + kiểm tra thu hồi tại validation_time cho cert người ký (cache theo
+        fingerprint + validation_time, nhiều chữ ký của cùng người ký cùng thời điểm
+        trong tài liệu chỉ tính một lần)
+
+        Returns:
+            dict: {
+                'chain': [Certificate, ...],     # từ cert người ký lên root
+                'complete': bool,
+                'revocation': [(status, source), ...],  # cho từng cert trừ root self-signed
+            }
+        """
+        key = (cert.fingerprint(hashes.SHA256()).hex(), validation_time)
+        if key not in self._validations:
+            chain, complete = self.build_chain(cert)
+            revocation = []
+            for idx, item in enumerate(chain):
+                if item.issuer == item.subject:
+                    break
+                issuer = chain[idx + 1] if idx + 1 < len(chain) else None
+                revocation.append(self.revocation_status(item, issuer, validation_time))
+            self._validations[key] = {'chain': chain, 'complete': complete, 'revocation': revocation}
+        return self._validations[key]
+
+    def summary(self, cert, cms_bytes, validation_time=None):
+        """
+        Tóm tắt LTV của một chữ ký cho kết quả API
+
+        Args:
+            validation_time: thời điểm xét thu hồi (gen_time của TSA / thời gian ký)
+
+        Returns:
+            dict: has_dss, has_vri, vri, dss_certificates, dss_crls, dss_ocsps,
+                  chain_complete, revocation_status, revocation_source, validation_time
+        """
+        result = self.validate(cert, validation_time)
+        status, source = result['revocation'][0] if result['revocation'] else ('unknown', None)
+        # Chuỗi có cert bị thu hồi ở bất kỳ mức nào thì coi như bị thu hồi
+        if any(s == 'revoked' for s, _ in result['revocation']):
+            status = 'revoked'
+        vri = self.vri_entry(cms_bytes)
+        return {
+            'has_dss': self.has_dss,
+            'has_vri': vri is not None,
+            'vri': vri,
+            'dss_certificates': sum(1 for src in self._sources.values() if src == 'dss'),
+            'dss_crls': self.crl_count,
+            'dss_ocsps': self.ocsp_count,
+            'chain_complete': result['complete'],
+            'revocation_status': status,
+            'revocation_source': source,
+            # None: xét tại thời điểm kiểm tra (chữ ký không có TSA / thời gian ký)
+            'validation_time': validation_time.isoformat() if validation_time else None,
+        }
+
+    def vri_entry(self, cms_bytes):
+        """Thông tin /VRI của một chữ ký (None nếu không có)"""
+        for key in vri_keys(cms_bytes):
+            if key in self.vri:
+                return self.vri[key]
+        return None
+
+
+def _issuer_key_hash(issuer, algorithm):
+    """Hash của subjectPublicKey (BIT STRING bên trong SubjectPublicKeyInfo) như trong OCSP CertID"""
+    spki_der = issuer.public_key().public_bytes(
+        serialization.Encoding.DER, serialization.PublicFormat.SubjectPublicKeyInfo)
+    public_key_bits = asn1_keys.PublicKeyInfo.load(spki_der)['public_key'].contents[1:]
+    digest = hashes.Hash(algorithm)
+    digest.update(public_key_bits)
+    return digest.finalize()
+
+
+def load_validation_data(reader):
+    """
+    Đọc /DSS của tài liệu một lần thành ValidationDataPool
+
+    DSS sai cấu trúc không làm hỏng request: entry sai kiểu / không đọc được bị bỏ
+    qua, DSS không đọc được thì trả pool rỗng.
+
+    Args:
+        reader: pypdf PdfReader
+
+    Returns:
+        ValidationDataPool (rỗng nếu tài liệu không có DSS)
+    """
+    try:
+        dss = _resolve(reader.trailer['/Root'].get_object().get('/DSS'), dict)
+    except Exception:
+        return ValidationDataPool()
+    if dss is None:
+        return ValidationDataPool()
+
+    pool = ValidationDataPool()
+    pool.has_dss = True
+    seen = set()
+
+    def load(container, certs_key, crls_key, ocsps_key):
+        counts = []
+        for key, add in ((certs_key, pool.add_der_certificate), (crls_key, pool.add_crl),
+                         (ocsps_key, pool.add_ocsp)):
+            refs = _resolve(container.get(key), list) or ()
+            for ref in refs:
+                try:
+                    data = _stream_bytes(ref, seen)
+                    if data is not None:
+                        add(data)
+                except Exception:
+                    continue
+            counts.append(len(refs))
+        return counts
+
+    try:
+        load(dss, '/Certs', '/CRLs', '/OCSPs')
+
+        for key, entry in (_resolve(dss.get('/VRI'), dict) or {}).items():
+            entry = _resolve(entry, dict)
+            if entry is None:
+                continue
+            # Dữ liệu trong VRI thường trùng với DSS (bỏ qua nhờ `seen`)
+            certs, crls, ocsps = load(entry, '/Cert', '/CRL', '/OCSP')
+            pool.vri[str(key).lstrip('/').upper()] = {'certs': certs, 'crls': crls, 'ocsps': ocsps}
+    except Exception:
+        return ValidationDataPool()
+    return pool
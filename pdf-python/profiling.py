@@ -0,0 +1,236 @@
+"""
+Profiling theo từng request (opt-in, có kiểm soát truy cập)
+
+Khi một PDF cụ thể chạy chậm, gửi lại request đó kèm `?profile=1` (hoặc header
+`X-PDF-Profile: 1`) và token `X-PDF-Profile-Token`. Lần xác minh đó chạy dưới:
+
+- Sampling profiler: một thread nền lấy stack của thread đang xử lý request qua
+  sys._current_frames() mỗi PDF_PROFILE_INTERVAL_MS. Chi phí thấp, không cần
+  thư viện ngoài. Code C giữ GIL lâu (ví dụ verify RSA) sẽ dồn vào sample kế tiếp.
+- tracemalloc: đỉnh bộ nhớ cấp phát bởi Python trong lúc xác minh và các dòng
+  code đang giữ nhiều bộ nhớ nhất khi kết thúc. tracemalloc là trạng thái chung
+  của process: các request profile chồng nhau (gthread) dùng chung một lần
+  start/stop (đếm số người dùng), đỉnh bộ nhớ khi đó là của cả process và được
+  đánh dấu tracemalloc_overlapped trong báo cáo.
+
+Kết quả trả về trong response (collapsed stacks, dùng được với flamegraph.pl /
+speedscope) và ghi ra PDF_PROFILE_DIR dạng .collapsed + .speedscope.json nếu đặt.
+
+Bật bằng biến môi trường (không đặt token = tắt hoàn toàn):
+    PDF_PROFILING_TOKEN=<secret>
+    PDF_PROFILE_DIR=/data/profiles
+    PDF_PROFILE_INTERVAL_MS=5
+"""
+
+import hmac
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import Counter
+from datetime import datetime, timezone
+
+PROFILING_TOKEN = os.environ.get('PDF_PROFILING_TOKEN', '')
+PROFILE_DIR = os.environ.get('PDF_PROFILE_DIR') or None
+PROFILE_INTERVAL = float(os.environ.get('PDF_PROFILE_INTERVAL_MS', '5')) / 1000.0
+
+# Số dòng code giữ nhiều bộ nhớ nhất đưa vào báo cáo
+TOP_ALLOCATIONS = 15
+
+# tracemalloc dùng chung giữa các request đang profile trong process
+_tracemalloc_lock = threading.Lock()
+_tracemalloc_users = 0
+_tracemalloc_started = False  # do profiler start (không phải đã bật sẵn bằng PYTHONTRACEMALLOC)
+_tracemalloc_sessions = 0     # tổng số lần bắt đầu profile, để biết có request khác chen vào
+
+
+def _acquire_tracemalloc():
+    """
+    Bắt đầu dùng tracemalloc (start nếu là người dùng đầu tiên)
+
+    Returns:
+        (session: int, alone: bool) - alone=True nếu không có request nào khác đang profile
+    """
+    global _tracemalloc_users, _tracemalloc_started, _tracemalloc_sessions
+    with _tracemalloc_lock:
+        alone = _tracemalloc_users == 0
+        if alone:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                _tracemalloc_started = True
+            # Chỉ reset đỉnh khi không ai khác đang đo
+            tracemalloc.reset_peak()
+        _tracemalloc_users += 1
+        _tracemalloc_sessions += 1
+        return _tracemalloc_sessions, alone
+
+
+def _release_tracemalloc(session):
+    """
+    Thôi dùng tracemalloc (stop nếu là người dùng cuối và profiler đã start)
+
+    Returns:
+        bool: True nếu có request khác profile trong lúc session này chạy
+    """
+    global _tracemalloc_users, _tracemalloc_started
+    with _tracemalloc_lock:
+        overlapped = _tracemalloc_users > 1 or _tracemalloc_sessions != session
+        _tracemalloc_users -= 1
+        if _tracemalloc_users == 0 and _tracemalloc_started:
+            tracemalloc.stop()
+            _tracemalloc_started = False
+        return overlapped
+
+
+def is_authorized(token):
+    """So sánh token hằng thời gian (không để lộ token qua thời gian phản hồi)"""
+    if not PROFILING_TOKEN or not token:
+        return False
+    return hmac.compare_digest(token.encode(), PROFILING_TOKEN.encode())
+
+
+def _frame_name(code):
+    # Hai phần cuối của đường dẫn đủ phân biệt module (pypdf/_reader.py, asn1crypto/core.py)
+    path = '/'.join(code.co_filename.replace('\\', '/').split('/')[-2:])
+    return f"{code.co_name} ({path}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    """
+    Lấy mẫu stack của một thread trong khối with
+
+    Usage:
+        with SamplingProfiler() as profiler:
+            read_pdf_signatures(path)
+        profiler.report()
+    """
+
+    def __init__(self, interval=None, thread_id=None):
+        self.interval = interval or PROFILE_INTERVAL
+        self.thread_id = thread_id or threading.get_ident()
+        self.stacks = Counter()
+        self.samples = 0
+        self.duration = 0.0
+        self.peak_bytes = None
+        self.top_allocations = []
+        self.tracemalloc_overlapped = False
+        self._stop = threading.Event()
+        self._sampler = None
+        self._session = None
+        self._start = 0.0
+        self._names = {}
+
+    def __enter__(self):
+        self._session, alone = _acquire_tracemalloc()
+        self.tracemalloc_overlapped = not alone
+        self._start = time.perf_counter()
+        self._sampler = threading.Thread(target=self._run, name='pdf-profiler', daemon=True)
+        self._sampler.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._stop.set()
+        self._sampler.join()
+        self.duration = time.perf_counter() - self._start
+        try:
+            # Vẫn đang giữ tracemalloc (chưa release) nên không request nào stop được
+            self.peak_bytes = tracemalloc.get_traced_memory()[1]
+            snapshot = tracemalloc.take_snapshot().filter_traces((
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, __file__),
+                tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+                tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+            ))
+            self.top_allocations = [
+                {'location': f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+                 'bytes': stat.size, 'count': stat.count}
+                for stat in snapshot.statistics('lineno')[:TOP_ALLOCATIONS]
+            ]
+        finally:
+            if _release_tracemalloc(self._session):
+                self.tracemalloc_overlapped = True
+        return False
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                name = self._names.get(code)
+                if name is None:
+                    name = self._names[code] = _frame_name(code)
+                stack.append(name)
+                frame = frame.f_back
+            self.stacks[tuple(reversed(stack))] += 1
+            self.samples += 1
+
+    def collapsed(self):
+        """Định dạng collapsed stacks ("a;b;c 12" mỗi dòng) cho flamegraph.pl / speedscope"""
+        return '\n'.join(f"{';'.join(stack)} {count}" for stack, count in self.stacks.most_common())
+
+    def speedscope(self, name):
+        """File speedscope (https://www.speedscope.app/file-format-schema.json), profile dạng sampled"""
+        frames, index = [], {}
+        samples, weights = [], []
+        interval_ms = self.interval * 1000.0
+        for stack, count in self.stacks.most_common():
+            sample = []
+            for frame_name in stack:
+                if frame_name not in index:
+                    index[frame_name] = len(frames)
+                    frames.append({'name': frame_name})
+                sample.append(index[frame_name])
+            samples.append(sample)
+            weights.append(count * interval_ms)
+        return {
+            '$schema': 'https://www.speedscope.app/file-format-schema.json',
+            'name': name,
+            'exporter': 'pdf-python profiling',
+            'shared': {'frames': frames},
+            'profiles': [{
+                'type': 'sampled',
+                'name': name,
+                'unit': 'milliseconds',
+                'startValue': 0,
+                'endValue': sum(weights),
+                'samples': samples,
+                'weights': weights,
+            }],
+        }
+
+    def report(self, name='verify-pdf', directory=None):
+        """
+        Báo cáo profile; ghi file vào directory (mặc định PDF_PROFILE_DIR) nếu có
+
+        Returns:
+            dict
+        """
+        report = {
+            'id': None,
+            'interval_ms': self.interval * 1000.0,
+            'duration_ms': round(self.duration * 1000.0, 1),
+            'samples': self.samples,
+            'tracemalloc_peak_bytes': self.peak_bytes,
+            'tracemalloc_overlapped': self.tracemalloc_overlapped,
+            'top_allocations': self.top_allocations,
+            'collapsed': self.collapsed(),
+            'files': [],
+        }
+
+        directory = directory or PROFILE_DIR
+        if directory:
+            report['id'] = f"{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')}-{uuid.uuid4().hex[:8]}"
+            os.makedirs(directory, exist_ok=True)
+            base = os.path.join(directory, report['id'])
+            with open(base + '.collapsed', 'w', encoding='utf-8') as f:
+                f.write(report['collapsed'] + '\n')
+            with open(base + '.speedscope.json', 'w', encoding='utf-8') as f:
+                json.dump(self.speedscope(f"{name} {report['id']}"), f)
+            report['files'] = [base + '.collapsed', base + '.speedscope.json']
+        return report
@@ -0,0 +1,270 @@
+"""
+Sinh PDF đã ký (chứng chỉ tự tạo) để đo tải và kiểm thử
+
+Mỗi loại mẫu tạo một PDF một chữ ký, khác nhau ở những thứ ảnh hưởng tới chi phí
+xác minh: thuật toán khoá, signed attributes, số trang, kích thước file, DSS (LTV).
+
+Các loại mẫu (SAMPLE_KINDS):
+    small_rsa      1 trang, RSA-2048, không signed attributes
+    small_ecdsa    1 trang, ECDSA P-256
+    signed_attrs   1 trang, RSA-2048, có signed attributes (messageDigest, signingTime)
+    pages_200      200 trang
+    large_5mb      1 trang + 5 MB nội dung
+    ltv_ocsp       RSA-2048 + DSS (chứng chỉ CA + OCSP response)
+
+Usage:
+    python sample_pdfs.py samples/
+    python sample_pdfs.py samples/ --kinds small_rsa,large_5mb
+"""
+
+import argparse
+import datetime
+import hashlib
+import os
+import re
+
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec, rsa
+from cryptography.hazmat.primitives.serialization import pkcs7
+from cryptography.x509 import ocsp
+from cryptography.x509.oid import NameOID
+
+# Kích thước /Contents dành sẵn (bytes, trước khi hex)
+CONTENTS_SIZE = 8192
+
+
+def make_certificate(common_name, issuer=None, issuer_key=None, key_type='rsa2048', ca=False, days=365):
+    """
+    Tạo chứng chỉ (tự ký nếu không có issuer)
+
+    Returns:
+        (certificate, private_key)
+    """
+    if key_type == 'p256':
+        key = ec.generate_private_key(ec.SECP256R1())
+    else:
+        key = rsa.generate_private_key(public_exponent=65537, key_size=int(key_type[3:]))
+    now = datetime.datetime.now(datetime.timezone.utc)
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, common_name)])
+    builder = (x509.CertificateBuilder()
+               .subject_name(name)
+               .issuer_name(issuer.subject if issuer else name)
+               .public_key(key.public_key())
+               .serial_number(x509.random_serial_number())
+               .not_valid_before(now - datetime.timedelta(days=1))
+               .not_valid_after(now + datetime.timedelta(days=days)))
+    if ca:
+        builder = builder.add_extension(x509.BasicConstraints(ca=True, path_length=None), critical=True)
+    return builder.sign(issuer_key or key, hashes.SHA256()), key
+
+
+def _serialize(objects, trailer_extra=b''):
+    """Ghép các object (theo thứ tự số 1..n) thành PDF có xref"""
+    out = bytearray(b"%PDF-1.7\n%\xe2\xe3\xcf\xd3\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        out += b"%010d 00000 n \n" % offset
+    out += b"trailer\n<< /Size %d /Root 1 0 R%s >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, trailer_extra, xref)
+    return out
+
+
+def _signature_dictionary(signed_at=None):
+    """signed_at: datetime UTC cho /M (mặc định một thời điểm cố định)"""
+    m = signed_at.strftime("D:%Y%m%d%H%M%S+00'00'").encode() if signed_at else b"D:20261018100807+07'00'"
+    return (b"<< /Type /Sig /Filter /Adobe.PPKLite /SubFilter /adbe.pkcs7.detached /M (" + m + b")"
+            b" /ByteRange [0 0000000000 0000000000 0000000000] /Contents <" + b"0" * (CONTENTS_SIZE * 2) + b"> >>")
+
+
+def _fill_signature(out, start, cert, key, signed_attributes, make_range=None):
+    """
+    Điền ByteRange (tới hết file) và CMS vào chỗ trống của chữ ký đầu tiên sau offset start
+
+    make_range: (c0, c1, size) -> ByteRange ghi vào file thay cho (0, c0, c1, size - c1)
+                (mẫu ByteRange sai); chữ ký vẫn tính trên out[:c0] + out[c1:]
+    """
+    c0 = out.index(b"/Contents <", start) + len(b"/Contents ")
+    c1 = c0 + CONTENTS_SIZE * 2 + 2
+    byte_range = b"/ByteRange [0 %010d %010d %010d]" % (c0, c1, len(out) - c1)
+    if make_range is not None:
+        numbers = b" ".join(b"%d" % n for n in make_range(c0, c1, len(out)))
+        byte_range = b"/ByteRange [" + numbers.ljust(len(byte_range) - len(b"/ByteRange []")) + b"]"
+    i = out.index(b"/ByteRange [0 0000000000", start)
+    out[i:i + len(byte_range)] = byte_range
+
+    options = [pkcs7.PKCS7Options.DetachedSignature, pkcs7.PKCS7Options.Binary]
+    if not signed_attributes:
+        options.append(pkcs7.PKCS7Options.NoAttributes)
+    cms = (pkcs7.PKCS7SignatureBuilder()
+           .set_data(bytes(out[:c0]) + bytes(out[c1:]))
+           .add_signer(cert, key, hashes.SHA256())
+           .sign(serialization.Encoding.DER, options))
+    out[c0 + 1:c1 - 1] = cms.hex().encode().ljust(CONTENTS_SIZE * 2, b"0")
+    return bytes(out), cms
+
+
+def sign_pdf(cert, key, pages=1, filler_bytes=0, signed_attributes=False, field_name=b'Signature1', make_range=None,
+             signed_at=None):
+    """
+    Tạo PDF một chữ ký (adbe.pkcs7.detached) với ByteRange bao toàn bộ file trừ /Contents
+
+    make_range: xem _fill_signature
+    signed_at: thời gian ký ghi vào /M (datetime UTC)
+
+    Returns:
+        (pdf_bytes, cms_bytes)
+    """
+    filler = (b"% filler " + b"x" * 70 + b"\n") * (filler_bytes // 80) if filler_bytes else b""
+    page_numbers = range(6, 6 + pages)
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R /AcroForm << /Fields [3 0 R] /SigFlags 3 >> >>",
+        b"<< /Type /Pages /Kids [" + b" ".join(b"%d 0 R" % n for n in page_numbers) + b"] /Count %d >>" % pages,
+        b"<< /FT /Sig /T (" + field_name + b") /V 4 0 R /Subtype /Widget /Rect [0 0 0 0] /P 6 0 R >>",
+        _signature_dictionary(signed_at),
+        b"<< /Length %d >>\nstream\n" % len(filler) + filler + b"\nendstream",
+    ]
+    for n in page_numbers:
+        annots = b" /Annots [3 0 R]" if n == 6 else b""
+        objects.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Contents 5 0 R%s >>" % annots)
+
+    return _fill_signature(_serialize(objects), 0, cert, key, signed_attributes, make_range)
+
+
+def append_update(pdf, objects, root_body=None):
+    """
+    Incremental update: thêm object mới (và thay catalog nếu có root_body)
+
+    Args:
+        objects: list body của object mới, đánh số tiếp từ /Size hiện tại
+
+    Returns:
+        (pdf_bytes, list số object đã thêm)
+    """
+    startxref = int(re.findall(rb"startxref\s+(\d+)", pdf)[-1])
+    size = int(re.findall(rb"/Size (\d+)", pdf)[-1])
+    out = bytearray(pdf)
+    offsets = {}
+    numbers = list(range(size, size + len(objects)))
+    for number, body in zip(numbers, objects):
+        offsets[number] = len(out)
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    if root_body is not None:
+        offsets[1] = len(out)
+        out += b"1 0 obj\n" + root_body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n"
+    for number in sorted(offsets):
+        out += b"%d 1\n%010d 00000 n \n" % (number, offsets[number])
+    out += b"trailer\n<< /Size %d /Root 1 0 R /Prev %d >>\nstartxref\n%d\n%%%%EOF\n" % (size + len(objects), startxref, xref)
+    return bytes(out), numbers
+
+
+def add_signature(pdf, cert, key, field_name=b'Signature2', signed_attributes=False):
+    """
+    Thêm chữ ký mới bằng incremental update (PDF nhiều revision)
+
+    ByteRange của chữ ký mới bao toàn bộ file, kể cả revision trước.
+
+    Returns:
+        (pdf_bytes, cms_bytes)
+    """
+    size = int(re.findall(rb"/Size (\d+)", pdf)[-1])
+    root = re.findall(rb"\n1 0 obj\n(.*?)\nendobj", pdf, re.S)[-1]
+    root = re.sub(rb"/Fields \[([^\]]*)\]", lambda m: b"/Fields [" + m.group(1) + b" %d 0 R]" % size, root)
+    objects = [
+        b"<< /FT /Sig /T (" + field_name + b") /V %d 0 R /Subtype /Widget /Rect [0 0 0 0] /P 6 0 R >>" % (size + 1),
+        _signature_dictionary(),
+    ]
+    out = bytearray(append_update(pdf, objects, root)[0])
+    return _fill_signature(out, len(pdf), cert, key, signed_attributes)
+
+
+def add_dss(pdf, cms, certs, crls=(), ocsps=()):
+    """Thêm /DSS (Certs, CRLs, OCSPs, VRI của chữ ký) bằng incremental update"""
+    ders = ([c.public_bytes(serialization.Encoding.DER) for c in certs], list(crls), list(ocsps))
+    streams = [b"<< /Length %d >>\nstream\n" % len(der) + der + b"\nendstream" for group in ders for der in group]
+    size = int(re.findall(rb"/Size (\d+)", pdf)[-1])
+    refs, n = [], size
+    for group in ders:
+        refs.append(b" ".join(b"%d 0 R" % (n + i) for i in range(len(group))))
+        n += len(group)
+    padded = cms.ljust(CONTENTS_SIZE, b"\0")
+    vri_key = hashlib.sha1(padded).hexdigest().upper().encode()
+    dss = (b"<< /Certs [" + refs[0] + b"] /CRLs [" + refs[1] + b"] /OCSPs [" + refs[2] + b"] /VRI << /"
+           + vri_key + b" << /Cert [" + refs[0] + b"] >> >> >>")
+    root = b"<< /Type /Catalog /Pages 2 0 R /AcroForm << /Fields [3 0 R] /SigFlags 3 >> /DSS " + dss + b" >>"
+    return append_update(pdf, streams, root)[0]
+
+
+def make_ocsp_response(cert, issuer, issuer_key, status=ocsp.OCSPCertStatus.GOOD):
+    now = datetime.datetime.now(datetime.timezone.utc)
+    builder = ocsp.OCSPResponseBuilder().add_response(
+        cert=cert, issuer=issuer, algorithm=hashes.SHA1(), cert_status=status,
+        this_update=now, next_update=now + datetime.timedelta(days=1),
+        revocation_time=now if status == ocsp.OCSPCertStatus.REVOKED else None,
+        revocation_reason=None,
+    ).responder_id(ocsp.OCSPResponderEncoding.HASH, issuer)
+    return builder.sign(issuer_key, hashes.SHA256()).public_bytes(serialization.Encoding.DER)
+
+
+class SampleFactory:
+    """Giữ CA + chứng chỉ người ký dùng chung cho mọi mẫu (tạo khoá RSA tốn thời gian)"""
+
+    def __init__(self):
+        self.ca, self.ca_key = make_certificate("Sample Root CA", key_type='rsa2048', ca=True)
+        self.rsa, self.rsa_key = make_certificate("Sample RSA Signer", self.ca, self.ca_key)
+        self.ecdsa, self.ecdsa_key = make_certificate("Sample ECDSA Signer", self.ca, self.ca_key, key_type='p256')
+
+    def build(self, kind):
+        if kind == 'small_rsa':
+            return sign_pdf(self.rsa, self.rsa_key)[0]
+        if kind == 'small_ecdsa':
+            return sign_pdf(self.ecdsa, self.ecdsa_key)[0]
+        if kind == 'signed_attrs':
+            return sign_pdf(self.rsa, self.rsa_key, signed_attributes=True)[0]
+        if kind == 'pages_200':
+            return sign_pdf(self.rsa, self.rsa_key, pages=200)[0]
+        if kind == 'large_5mb':
+            return sign_pdf(self.rsa, self.rsa_key, filler_bytes=5 * 1024 * 1024)[0]
+        if kind == 'ltv_ocsp':
+            pdf, cms = sign_pdf(self.rsa, self.rsa_key)
+            return add_dss(pdf, cms, [self.ca], ocsps=[make_ocsp_response(self.rsa, self.ca, self.ca_key)])
+        raise ValueError(f"Loại mẫu không hỗ trợ: {kind}")
+
+
+SAMPLE_KINDS = ('small_rsa', 'small_ecdsa', 'signed_attrs', 'pages_200', 'large_5mb', 'ltv_ocsp')
+
+
+def generate_samples(directory, kinds=SAMPLE_KINDS, factory=None):
+    """
+    Ghi mỗi loại mẫu ra <directory>/<kind>.pdf
+
+    Returns:
+        dict: kind -> đường dẫn file
+    """
+    factory = factory or SampleFactory()
+    os.makedirs(directory, exist_ok=True)
+    paths = {}
+    for kind in kinds:
+        paths[kind] = os.path.join(directory, f"{kind}.pdf")
+        with open(paths[kind], 'wb') as f:
+            f.write(factory.build(kind))
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Sinh PDF đã ký để đo tải / kiểm thử')
+    parser.add_argument('directory')
+    parser.add_argument('--kinds', default=','.join(SAMPLE_KINDS), help='Danh sách loại mẫu, cách nhau bởi dấu phẩy')
+    args = parser.parse_args()
+    for kind, path in generate_samples(args.directory, args.kinds.split(',')).items():
+        print(f"{kind:<14} {os.path.getsize(path):>10} bytes  {path}")
+
+
+if __name__ == '__main__':
+    main()
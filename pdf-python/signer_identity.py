@@ -0,0 +1,282 @@
+"""
+Xác định danh tính người ký (signer identity)
+
+Gom mọi cách lấy tên người ký vào một chỗ:
+- Subject / issuer của chứng chỉ: duyệt RDN sequence MỘT lần thành dict theo OID
+  (thay cho nhiều lần get_attributes_for_oid + try/except cho mỗi thuộc tính)
+- /Name và các field khác trong signature dictionary của PDF
+- Thuộc tính dạng chuỗi trong CMS (signed attrs, unsigned attrs)
+- Tên signature field (fallback cuối)
+
+Tên hiển thị được chọn theo thứ tự ưu tiên cấu hình được:
+    PDF_SIGNER_NAME_PRECEDENCE=cn,uid,serial_number,pdf_name,cms,pdf_fields,field_name
+
+Phần lấy từ chứng chỉ được cache theo SHA-256 fingerprint, nên cùng một
+chứng chỉ xuất hiện ở nhiều chữ ký / nhiều request chỉ phải duyệt một lần.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+
+from asn1crypto import cms as asn1_cms
+from asn1crypto import core as asn1_core
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes
+
+# OID -> key trong dict signer / issuer của kết quả xác minh
+SUBJECT_ATTRIBUTE_KEYS = {
+    x509.NameOID.COMMON_NAME.dotted_string: 'common_name',
+    x509.NameOID.USER_ID.dotted_string: 'uid',
+    x509.NameOID.SERIAL_NUMBER.dotted_string: 'serial_number',
+    x509.NameOID.COUNTRY_NAME.dotted_string: 'country',
+    x509.NameOID.STATE_OR_PROVINCE_NAME.dotted_string: 'state_or_province',
+    x509.NameOID.LOCALITY_NAME.dotted_string: 'city',
+    x509.NameOID.ORGANIZATION_NAME.dotted_string: 'organization',
+}
+
+# Nguồn tên hiển thị có thể dùng trong PDF_SIGNER_NAME_PRECEDENCE
+NAME_SOURCES = ('cn', 'uid', 'serial_number', 'pdf_name', 'cms', 'pdf_fields', 'field_name')
+DEFAULT_PRECEDENCE = ('cn', 'uid', 'serial_number', 'pdf_name', 'cms', 'pdf_fields', 'field_name')
+
+# Các field khác trong signature dictionary (sau /Name), theo thứ tự ưu tiên
+PDF_FALLBACK_FIELDS = ('/Reason', '/ContactInfo', '/Location', '/Title', '/DN')
+
+MAX_NAME_LENGTH = 100
+CACHE_SIZE = 4096
+
+
+def load_precedence(value=None):
+    """
+    Đọc thứ tự ưu tiên nguồn tên người ký
+
+    Args:
+        value: Chuỗi 'cn,uid,...' (mặc định từ PDF_SIGNER_NAME_PRECEDENCE)
+
+    Returns:
+        tuple: Các nguồn hợp lệ theo thứ tự (bỏ qua nguồn không biết)
+    """
+    value = value if value is not None else os.environ.get('PDF_SIGNER_NAME_PRECEDENCE')
+    if not value:
+        return DEFAULT_PRECEDENCE
+    sources = tuple(s.strip() for s in value.split(',') if s.strip() in NAME_SOURCES)
+    return sources or DEFAULT_PRECEDENCE
+
+
+SIGNER_NAME_PRECEDENCE = load_precedence()
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def name_attributes(name):
+    """
+    Duyệt RDN sequence của một x509.Name một lần
+
+    Returns:
+        dict: OID dotted string -> giá trị (str). Nếu một OID xuất hiện nhiều lần,
+              lấy giá trị đầu tiên (giống get_attributes_for_oid(...)[0])
+    """
+    attributes = {}
+    for attr in name:
+        attributes.setdefault(attr.oid.dotted_string, attr.value)
+    return attributes
+
+
+def _mapped(attributes):
+    return {key: attributes[oid] for oid, key in SUBJECT_ATTRIBUTE_KEYS.items() if oid in attributes}
+
+
+def certificate_fingerprint(cert):
+    """SHA-256 fingerprint (hex) của chứng chỉ"""
+    return cert.fingerprint(hashes.SHA256()).hex()
+
+
+def certificate_identity(cert, fingerprint=None):
+    """
+    Thông tin subject / issuer của chứng chỉ (có cache theo fingerprint)
+
+    Args:
+        cert: cryptography x509.Certificate
+        fingerprint: fingerprint hex nếu đã tính sẵn
+
+    Returns:
+        dict: {'fingerprint', 'subject': {...}, 'issuer': {...}, 'is_self_signed'}
+              subject/issuer dùng key trong SUBJECT_ATTRIBUTE_KEYS
+    """
+    fingerprint = fingerprint or certificate_fingerprint(cert)
+    with _cache_lock:
+        identity = _cache.get(fingerprint)
+        if identity is not None:
+            _cache.move_to_end(fingerprint)
+            return identity
+
+    identity = {
+        'fingerprint': fingerprint,
+        'subject': _mapped(name_attributes(cert.subject)),
+        'issuer': _mapped(name_attributes(cert.issuer)),
+        'is_self_signed': cert.issuer == cert.subject,
+    }
+    with _cache_lock:
+        _cache[fingerprint] = identity
+        if len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+    return identity
+
+
+def _clean(value):
+    value = str(value).strip()
+    if value and value.lower() not in ('none', 'unknown'):
+        return value[:MAX_NAME_LENGTH]
+    return None
+
+
+def pdf_name(v_obj):
+    """/Name trong signature dictionary (chuẩn PDF cho tên người ký)"""
+    if v_obj is not None and '/Name' in v_obj:
+        return _clean(v_obj['/Name'])
+    return None
+
+
+def pdf_fallback_name(v_obj):
+    """Các field khác của signature dictionary: /Reason, /ContactInfo, /Location, /Title, /DN"""
+    if v_obj is None:
+        return None
+    for key in PDF_FALLBACK_FIELDS:
+        if key in v_obj:
+            value = _clean(v_obj[key])
+            if value:
+                return value
+    return None
+
+
+def _printable(value):
+    value = str(value).strip()
+    if (len(value) > 2 and value.lower() != 'unknown' and not value.startswith('0x')
+            and not value.startswith("b'") and '\\x' not in value):
+        return value[:MAX_NAME_LENGTH]
+    return None
+
+
+def _attribute_names(attrs):
+    """Giá trị chuỗi in được trong các thuộc tính CMS (mỗi thuộc tính parse riêng)"""
+    for attr in attrs or ():
+        try:
+            for value in attr['values']:
+                if isinstance(value, asn1_core.Any):
+                    value = value.parsed
+                # Chỉ nhận kiểu chuỗi: content_type (OID 'data'), signing_time,
+                # message_digest... không phải tên người ký
+                if isinstance(value, asn1_core.AbstractString):
+                    name = _printable(value.native)
+                    if name:
+                        yield name
+        except (ValueError, TypeError, KeyError):
+            # Thuộc tính hỏng: bỏ qua, xét tiếp các thuộc tính sau
+            continue
+
+
+def cms_name(cms_bytes):
+    """
+    Tên người ký từ thuộc tính CMS
+
+    Thứ tự: giá trị chuỗi in được đầu tiên trong signed attrs, rồi unsigned attrs.
+    Không dùng issuer của signer identifier - đó là tên CA, không phải người ký.
+
+    Returns:
+        str hoặc None
+    """
+    if not cms_bytes:
+        return None
+    try:
+        content_info = asn1_cms.ContentInfo.load(cms_bytes)
+        if content_info['content_type'].native != 'signed_data':
+            return None
+        signer_infos = content_info['content']['signer_infos']
+        if len(signer_infos) == 0:
+            return None
+        signer_info = signer_infos[0]
+        signed_attrs = signer_info['signed_attrs']
+        unsigned_attrs = signer_info['unsigned_attrs']
+    except (ValueError, TypeError, KeyError):
+        # CMS hỏng / không parse được
+        return None
+
+    for attrs in (signed_attrs, unsigned_attrs):
+        for name in _attribute_names(attrs):
+            return name
+    return None
+
+
+def field_display_name(field_name):
+    """Tên hiển thị dựng từ tên signature field ('Signature_NguyenVanA' -> 'Sig: NguyenVanA')"""
+    if not field_name:
+        return None
+    name = str(field_name).strip()
+    if 'signature' in name.lower():
+        name = name.replace('Signature', '').replace('signature', '').strip('_0123456789')
+    if name and name.lower() not in ('signature', 'sig'):
+        return f"Sig: {name}"[:MAX_NAME_LENGTH]
+    return None
+
+
+def resolve_signer_identity(cert=None, v_obj=None, cms_bytes=None, field_name=None,
+                            fingerprint=None, precedence=None):
+    """
+    Xác định danh tính người ký của một chữ ký
+
+    Args:
+        cert: Chứng chỉ người ký (None nếu không load được)
+        v_obj: Signature dictionary (/V) trong PDF
+        cms_bytes: Raw CMS/PKCS#7 bytes
+        field_name: Tên signature field
+        fingerprint: SHA-256 fingerprint hex của cert nếu đã tính sẵn
+        precedence: Thứ tự nguồn tên (mặc định SIGNER_NAME_PRECEDENCE)
+
+    Returns:
+        dict: {
+            'signer': {...},  # common_name, user_id, country, ..., display_name, display_name_source
+            'issuer': {...},  # common_name, organization, country ('N/A' nếu không có)
+            'is_self_signed': bool,
+        }
+    """
+    subject, issuer, is_self_signed = {}, {}, False
+    if cert is not None:
+        identity = certificate_identity(cert, fingerprint)
+        subject, issuer, is_self_signed = identity['subject'], identity['issuer'], identity['is_self_signed']
+
+    sources = {
+        'cn': lambda: subject.get('common_name'),
+        'uid': lambda: subject.get('uid'),
+        'serial_number': lambda: subject.get('serial_number'),
+        'pdf_name': lambda: pdf_name(v_obj),
+        'cms': lambda: cms_name(cms_bytes),
+        'pdf_fields': lambda: pdf_fallback_name(v_obj),
+        'field_name': lambda: field_display_name(field_name),
+    }
+    display_name, display_source = None, None
+    for source in precedence or SIGNER_NAME_PRECEDENCE:
+        value = sources[source]()
+        if value:
+            display_name, display_source = value, source
+            break
+
+    signer = {'common_name': subject.get('common_name', 'N/A')}
+    user_id = subject.get('uid') or subject.get('serial_number')
+    if user_id:
+        signer['user_id'] = user_id
+    for key in ('country', 'state_or_province', 'city', 'organization'):
+        if key in subject:
+            signer[key] = subject[key]
+    signer['display_name'] = display_name or 'N/A'
+    signer['display_name_source'] = display_source
+
+    return {
+        'signer': signer,
+        'issuer': {
+            'common_name': issuer.get('common_name', 'N/A'),
+            'organization': issuer.get('organization', 'N/A'),
+            'country': issuer.get('country', 'N/A'),
+        },
+        'is_self_signed': is_self_signed,
+    }
@@ -0,0 +1,246 @@
+"""
+Single-flight: gộp các lần xác minh đồng thời của cùng một file
+
+Khi một hợp đồng được gửi đi, hàng chục người nhận xác minh cùng một PDF trong
+vài giây. Thay vì mỗi request chạy read_pdf_signatures riêng, các request có
+cùng document hash (SHA-256 toàn file, xem ingest.py) chờ một lần xác minh
+duy nhất và dùng chung kết quả:
+
+- Trong một worker (gthread): dict key -> _Call, request đến sau chờ Event.
+- Giữa các worker (gunicorn fork nhiều process): lock file <key>.lock (fcntl.flock)
+  trong PDF_SINGLEFLIGHT_DIR. Worker giữ lock xác minh rồi ghi kết quả vào
+  <key>.json; worker khác chờ lock rồi đọc kết quả đó thay vì xác minh lại.
+  Kết quả chỉ được dùng lại trong PDF_SINGLEFLIGHT_RESULT_TTL_SECONDS.
+
+Trong process cũng như giữa các worker, chỉ chia sẻ những gì do nội dung file
+quyết định: kết quả xác minh và lỗi vượt giới hạn admission (ADMISSION_LIMITS,
+HTTP 413) - cùng bytes sẽ vượt cùng giới hạn. Timeout stage / tổng và
+max_rss_bytes phụ thuộc tải lúc đó nên không chia sẻ; lỗi khác cũng vậy -
+request / worker khác tự xác minh lại.
+Không lấy được lock (quá wait_timeout hoặc flock lỗi) thì tự xác minh và không
+ghi kết quả.
+
+Cấu hình qua biến môi trường:
+    PDF_SINGLEFLIGHT=1                        (0 = tắt)
+    PDF_SINGLEFLIGHT_DIR                      (mặc định <tmp>/pdf-verify-singleflight, rỗng = chỉ trong process)
+    PDF_SINGLEFLIGHT_RESULT_TTL_SECONDS=10
+"""
+
+import json
+import os
+import tempfile
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows: chỉ gộp trong process
+    fcntl = None
+
+from limits import ADMISSION_LIMITS, VerificationLimitExceeded
+
+_LOCK_POLL_SECONDS = 0.02
+
+
+def _is_shareable_error(error):
+    """Lỗi do nội dung file quyết định (vượt giới hạn admission) - request khác sẽ gặp lại y hệt"""
+    return isinstance(error, VerificationLimitExceeded) and error.limit in ADMISSION_LIMITS
+
+
+class _Call:
+    """Một lần xác minh đang chạy trong process"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Gộp các lời gọi đồng thời cùng key thành một lần chạy
+
+    Usage:
+        flight = SingleFlight('/tmp/pdf-verify-singleflight')
+        signatures, shared = flight.do(document_hash, lambda: read_pdf_signatures(path))
+    """
+
+    def __init__(self, directory=None, result_ttl=10.0, wait_timeout=120.0):
+        """
+        Args:
+            directory: Thư mục lock/kết quả dùng chung giữa các worker (None = chỉ trong process)
+            result_ttl: Thời gian (giây) kết quả trong thư mục còn được dùng lại
+            wait_timeout: Thời gian chờ tối đa lần xác minh đang chạy, quá thì tự xác minh
+        """
+        self.directory = directory if fcntl is not None else None
+        self.result_ttl = result_ttl
+        self.wait_timeout = wait_timeout
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._last_sweep = 0.0
+        if self.directory:
+            os.makedirs(self.directory, mode=0o700, exist_ok=True)
+
+    def do(self, key, fn):
+        """
+        Chạy fn() một lần cho mỗi key đang bay
+
+        Returns:
+            (result, shared: bool) - shared=True khi dùng kết quả của request khác
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            if not call.done.wait(self.wait_timeout):
+                # Lần xác minh đang chạy bị treo quá lâu: tự xác minh
+                return fn(), False
+            if call.error is not None:
+                if _is_shareable_error(call.error):
+                    raise call.error
+                # Lỗi phụ thuộc tải / lỗi khác của leader: tự xác minh
+                return fn(), False
+            return call.result, True
+
+        try:
+            call.result, shared = self._do_across_workers(key, fn)
+            return call.result, shared
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def _do_across_workers(self, key, fn):
+        if not self.directory:
+            return fn(), False
+
+        base = os.path.join(self.directory, key)
+        fd = os.open(base + '.lock', os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            # Worker khác đang xác minh cùng file: chờ nó ghi kết quả
+            if not self._acquire(fd):
+                # Không giữ lock thì không được ghi kết quả cho worker khác
+                return fn(), False
+
+            shared = self._read_result(base + '.json')
+            if shared is not None:
+                if 'limit_exceeded' in shared:
+                    raise VerificationLimitExceeded(**shared['limit_exceeded'])
+                return shared['result'], True
+
+            try:
+                result = fn()
+            except VerificationLimitExceeded as e:
+                if _is_shareable_error(e):
+                    self._write_result(base + '.json', {'limit_exceeded': dict(e.to_dict(), message=e.message)})
+                raise
+            self._write_result(base + '.json', {'result': result})
+            return result, False
+        finally:
+            # Đóng fd cũng nhả flock
+            os.close(fd)
+            self._sweep()
+
+    def _acquire(self, fd):
+        """flock với timeout (flock không có timeout nên poll LOCK_NB)"""
+        deadline = time.monotonic() + self.wait_timeout
+        while True:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return True
+            except BlockingIOError:
+                if time.monotonic() >= deadline:
+                    return False
+                time.sleep(_LOCK_POLL_SECONDS)
+            except OSError:
+                return False
+
+    def _read_result(self, path):
+        try:
+            if time.time() - os.path.getmtime(path) > self.result_ttl:
+                return None
+            with open(path, 'r', encoding='utf-8') as f:
+                shared = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not isinstance(shared, dict):
+            return None
+        if 'limit_exceeded' in shared:
+            # Chỉ lỗi admission là do file quyết định (file cũ có thể còn lỗi khác)
+            limit_exceeded = shared['limit_exceeded']
+            if not isinstance(limit_exceeded, dict) or limit_exceeded.get('limit') not in ADMISSION_LIMITS:
+                return None
+        elif 'result' not in shared:
+            return None
+        return shared
+
+    def _write_result(self, path, payload):
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(payload, f, ensure_ascii=False)
+            os.replace(temp_path, path)
+        except (OSError, TypeError, ValueError):
+            # Kết quả không ghi được chỉ làm mất phần chia sẻ, không ảnh hưởng request
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def _sweep(self):
+        """Xoá kết quả/lock file quá TTL (tối đa một lần mỗi result_ttl giây)"""
+        now = time.time()
+        if now - self._last_sweep < self.result_ttl:
+            return
+        self._last_sweep = now
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return
+        for name in names:
+            path = os.path.join(self.directory, name)
+            try:
+                if now - os.path.getmtime(path) <= self.result_ttl:
+                    continue
+                if name.endswith('.lock') and not self._is_unlocked(path):
+                    # Worker khác vẫn đang xác minh (mtime lock file không đổi khi flock)
+                    continue
+                os.remove(path)
+            except OSError:
+                pass
+
+    @staticmethod
+    def _is_unlocked(path):
+        fd = os.open(path, os.O_RDWR)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except BlockingIOError:
+            return False
+        finally:
+            os.close(fd)
+
+
+def open_single_flight_from_env(wait_timeout=120.0):
+    """
+    Tạo SingleFlight theo biến môi trường
+
+    Args:
+        wait_timeout: Thời gian chờ tối đa (nên lớn hơn PDF_VERIFY_TIMEOUT_SECONDS)
+
+    Returns:
+        SingleFlight hoặc None (tắt)
+    """
+    if os.environ.get('PDF_SINGLEFLIGHT', '1') == '0':
+        return None
+    directory = os.environ.get('PDF_SINGLEFLIGHT_DIR',
+                               os.path.join(tempfile.gettempdir(), 'pdf-verify-singleflight'))
+    return SingleFlight(
+        directory or None,
+        result_ttl=float(os.environ.get('PDF_SINGLEFLIGHT_RESULT_TTL_SECONDS', '10')),
+        wait_timeout=wait_timeout,
+    )
@@ -0,0 +1,208 @@
+"""
+Đo thời gian khởi động và bộ nhớ của API dưới Gunicorn
+
+So sánh chạy có / không có preload_app:
+- import_seconds: thời gian `import api` trong một interpreter mới
+- time_to_first_request: từ lúc start gunicorn tới khi /api/health trả 200
+- first_verify_seconds: request verify đầu tiên (nếu truyền --pdf), bao gồm lazy import endesive
+- RSS / PSS của từng worker (PSS chia phần page dùng chung theo số process,
+  nên phản ánh đúng lợi ích copy-on-write của preload)
+
+Chỉ chạy trên Linux (đọc /proc).
+
+Usage:
+    python startup_profile.py
+    python startup_profile.py --workers 4 --pdf Test.pdf --json
+"""
+
+import argparse
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+import urllib.request
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def measure_import_time():
+    """
+    Đo thời gian import api.py trong một interpreter mới
+
+    Returns:
+        dict: import_seconds và endesive_loaded (True nếu endesive bị import lúc khởi động)
+    """
+    code = (
+        "import time, sys, json\n"
+        "t = time.perf_counter()\n"
+        "import api\n"
+        "print(json.dumps({'import_seconds': time.perf_counter() - t,"
+        " 'endesive_loaded': 'endesive' in sys.modules}))\n"
+    )
+    out = subprocess.run([sys.executable, '-c', code], cwd=HERE, capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def child_pids(parent_pid):
+    """Danh sách PID con trực tiếp của một process (đọc /proc/<pid>/stat)"""
+    children = []
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                stat = f.read()
+        except OSError:
+            continue
+        # Field thứ 4 (sau tên process trong ngoặc) là ppid
+        fields = stat[stat.rfind(')') + 2:].split()
+        if int(fields[1]) == parent_pid:
+            children.append(int(entry))
+    return children
+
+
+def memory_kb(pid):
+    """
+    RSS và PSS (kB) của một process
+
+    Returns:
+        dict: {'rss_kb': int, 'pss_kb': int or None}
+    """
+    result = {'rss_kb': None, 'pss_kb': None}
+    try:
+        with open(f'/proc/{pid}/smaps_rollup') as f:
+            for line in f:
+                if line.startswith('Rss:'):
+                    result['rss_kb'] = int(line.split()[1])
+                elif line.startswith('Pss:'):
+                    result['pss_kb'] = int(line.split()[1])
+    except OSError:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    result['rss_kb'] = int(line.split()[1])
+    return result
+
+
+def _post_pdf(url, pdf_path):
+    """Gửi file PDF tới /api/verify-pdf (multipart), trả về thời gian phản hồi"""
+    boundary = 'startupprofileboundary'
+    with open(pdf_path, 'rb') as f:
+        pdf_bytes = f.read()
+    body = (
+        f'--{boundary}\r\n'
+        f'Content-Disposition: form-data; name="file"; filename="profile.pdf"\r\n'
+        f'Content-Type: application/pdf\r\n\r\n'
+    ).encode() + pdf_bytes + f'\r\n--{boundary}--\r\n'.encode()
+    req = urllib.request.Request(
+        f'{url}/api/verify-pdf', data=body, method='POST',
+        headers={'Content-Type': f'multipart/form-data; boundary={boundary}'},
+    )
+    started = time.perf_counter()
+    with urllib.request.urlopen(req, timeout=120) as resp:
+        resp.read()
+    return time.perf_counter() - started
+
+
+def profile_server(preload, workers, port, pdf_path=None, startup_timeout=60.0):
+    """
+    Khởi động gunicorn với cấu hình cho trước và đo các chỉ số khởi động
+
+    Returns:
+        dict: kết quả đo của cấu hình này
+    """
+    env = dict(os.environ)
+    env.update({
+        'GUNICORN_BIND': f'127.0.0.1:{port}',
+        'GUNICORN_WORKERS': str(workers),
+        'GUNICORN_PRELOAD': '1' if preload else '0',
+    })
+    url = f'http://127.0.0.1:{port}'
+
+    started = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'api:app'],
+        cwd=HERE, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    result = {'preload': preload, 'workers': workers}
+    try:
+        ttfr = None
+        while time.perf_counter() - started < startup_timeout:
+            try:
+                with urllib.request.urlopen(f'{url}/api/health', timeout=1) as resp:
+                    if resp.status == 200:
+                        ttfr = time.perf_counter() - started
+                        break
+            except OSError:
+                time.sleep(0.02)
+        result['time_to_first_request'] = ttfr
+
+        # Chờ đủ worker và để chúng import xong (không preload thì mỗi worker tự import)
+        while time.perf_counter() - started < startup_timeout:
+            if len(child_pids(proc.pid)) >= workers:
+                break
+            time.sleep(0.05)
+        time.sleep(2.0 if not preload else 0.5)
+        result['all_workers_ready'] = time.perf_counter() - started
+
+        if pdf_path:
+            result['first_verify_seconds'] = _post_pdf(url, pdf_path)
+
+        master = memory_kb(proc.pid)
+        worker_mem = [memory_kb(pid) for pid in child_pids(proc.pid)]
+        result['master_rss_kb'] = master['rss_kb']
+        result['worker_rss_kb'] = [m['rss_kb'] for m in worker_mem]
+        result['worker_pss_kb'] = [m['pss_kb'] for m in worker_mem]
+        pss_values = [m['pss_kb'] for m in worker_mem if m['pss_kb'] is not None]
+        if pss_values:
+            result['total_pss_kb'] = sum(pss_values) + (master['pss_kb'] or 0)
+    finally:
+        proc.send_signal(signal.SIGTERM)
+        try:
+            proc.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+    return result
+
+
+def print_report(report):
+    """In kết quả dạng bảng"""
+    imp = report['import']
+    print(f"import api: {imp['import_seconds'] * 1000:.0f} ms (endesive loaded at startup: {imp['endesive_loaded']})")
+    print()
+    header = f"{'preload':<8} {'workers':>7} {'TTFR ms':>8} {'ready ms':>9} {'verify1 ms':>10} {'worker RSS MB':>14} {'worker PSS MB':>14} {'total PSS MB':>13}"
+    print(header)
+    print('-' * len(header))
+    for r in report['servers']:
+        rss = r['worker_rss_kb']
+        pss = [p for p in r['worker_pss_kb'] if p is not None]
+        avg_rss = sum(rss) / len(rss) / 1024 if rss else 0
+        avg_pss = sum(pss) / len(pss) / 1024 if pss else 0
+        ttfr = f"{r['time_to_first_request'] * 1000:.0f}" if r['time_to_first_request'] else 'timeout'
+        verify = f"{r['first_verify_seconds'] * 1000:.0f}" if 'first_verify_seconds' in r else '-'
+        total = f"{r['total_pss_kb'] / 1024:.1f}" if 'total_pss_kb' in r else '-'
+        print(f"{str(r['preload']):<8} {r['workers']:>7} {ttfr:>8} {r['all_workers_ready'] * 1000:>9.0f} {verify:>10} {avg_rss:>14.1f} {avg_pss:>14.1f} {total:>13}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Startup profile cho PDF Signature Verification API')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--port', type=int, default=5101)
+    parser.add_argument('--pdf', help='PDF dùng để đo request verify đầu tiên')
+    parser.add_argument('--json', action='store_true', help='In kết quả dạng JSON')
+    args = parser.parse_args()
+
+    report = {'import': measure_import_time(), 'servers': []}
+    for preload in (False, True):
+        report['servers'].append(profile_server(preload, args.workers, args.port, args.pdf))
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+
+if __name__ == '__main__':
+    main()
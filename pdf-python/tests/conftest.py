@@ -0,0 +1,17 @@
+import os
+import sys
+
+import pytest
+
+# Các module của service nằm phẳng trong pdf-python/ (không phải package)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def write_pdf(tmp_path):
+    """Ghi bytes ra file .pdf tạm, trả về đường dẫn"""
+    def write(data, name='document.pdf'):
+        path = tmp_path / name
+        path.write_bytes(data)
+        return str(path)
+    return write
@@ -0,0 +1,55 @@
+import time
+
+import pytest
+
+import api
+from diffcheck import CORPUS_CASES, build_case, check_document, stream_digests
+from fast_paths import FAST_PATH_NAMES, ByteRangeLoopError, first_signature_hashok, load_fast_paths
+from limits import VerificationGuard, VerificationLimitExceeded, get_limits
+from sample_pdfs import SampleFactory
+
+ALL = frozenset(FAST_PATH_NAMES)
+
+
+@pytest.fixture(scope='module')
+def factory():
+    return SampleFactory()
+
+
+@pytest.fixture(autouse=True)
+def no_verdict_cache(monkeypatch):
+    monkeypatch.setattr(api, 'VERDICT_CACHE', None)
+
+
+def test_load_fast_paths():
+    assert load_fast_paths('') == frozenset()
+    assert load_fast_paths('all') == ALL
+    assert load_fast_paths(' Integrity, bogus') == frozenset({'integrity'})
+
+
+@pytest.mark.parametrize('case', CORPUS_CASES)
+def test_fast_paths_and_stream_digests_agree_with_default_path(factory, write_pdf, case):
+    limits = get_limits(stage_timeout_seconds=0.5, verify_timeout_seconds=0, max_rss_bytes=0)
+    result = check_document(case, write_pdf(build_case(factory, case)), ALL, limits, repeat=1)
+    assert result['disagreements'] == []
+
+
+def test_reversed_byterange_is_not_stream_digested(factory, write_pdf):
+    path = write_pdf(build_case(factory, 'reversed_byterange'))
+    assert stream_digests(path) == {}
+    signature, = api.read_pdf_signatures(path, fast_paths=ALL)
+    assert signature['cryptographic_signature_valid'] is False
+
+
+def test_looping_byterange_fails_with_the_slow_path_deadline(factory, write_pdf):
+    path = write_pdf(build_case(factory, 'looping_byterange'))
+    with pytest.raises(ByteRangeLoopError):
+        first_signature_hashok(path)
+
+    guard = VerificationGuard(get_limits(stage_timeout_seconds=30, verify_timeout_seconds=0, max_rss_bytes=0))
+    started = time.monotonic()
+    with pytest.raises(VerificationLimitExceeded) as excinfo:
+        api.read_pdf_signatures(path, guard, fast_paths=ALL)
+    assert time.monotonic() - started < 5
+    assert excinfo.value.to_dict() == {'limit': 'stage_timeout_seconds', 'actual': 30, 'maximum': 30,
+                                       'stage': 'integrity'}
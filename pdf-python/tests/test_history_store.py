@@ -0,0 +1,153 @@
+import logging
+import sqlite3
+
+import pytest
+
+from history_store import DOCUMENTS_SIGNED_BY_SQL, HistoryStore, normalize_query_time, normalize_signing_time
+
+
+def _signature(fingerprint, signing_time, valid=True, field_name='Signature1'):
+    return {
+        'field_name': field_name,
+        'signer_fingerprint': fingerprint,
+        'signer': {'common_name': 'Signer'},
+        'issuer': {'common_name': 'Issuer CA'},
+        'signing_time': signing_time,
+        'structure_validation': {'is_structure_valid': valid},
+    }
+
+
+@pytest.fixture
+def store(tmp_path):
+    return HistoryStore(str(tmp_path / 'history.sqlite3'), flush_interval=0.05)
+
+
+def _fill(store, count, fingerprint='aa', same_time=False):
+    for i in range(count):
+        signing_time = '2025-12-01T00:00:00+00:00' if same_time else f'2025-12-{1 + i % 28:02d}T{i % 24:02d}:00:00+00:00'
+        store.record(f'doc{i:03d}', 100, [_signature(fingerprint, signing_time)])
+    store.flush()
+
+
+def _paginate(store, limit, **filters):
+    pages, cursor = [], None
+    while True:
+        rows = store.query(limit=limit, cursor=cursor, **filters)
+        if not rows:
+            return pages
+        pages.append(rows)
+        cursor = store.next_cursor(rows)
+
+
+def test_normalize_times():
+    assert normalize_signing_time('2025-12-01T10:00:00', '+07:00') == '2025-12-01T03:00:00Z'
+    assert normalize_signing_time('not a date') is None
+    assert normalize_query_time('2025-12') == '2025-12-01T00:00:00Z'
+
+
+@pytest.mark.parametrize('same_time', [False, True])
+def test_keyset_pagination_covers_every_row_once(store, same_time):
+    _fill(store, 23, same_time=same_time)
+    pages = _paginate(store, limit=5)
+
+    assert [len(page) for page in pages] == [5, 5, 5, 5, 3]
+    rows = [row for page in pages for row in page]
+    assert len({row['id'] for row in rows}) == 23
+    order = [(row['signing_time'], row['id']) for row in rows]
+    assert order == sorted(order, reverse=True)
+    assert rows == store.query(limit=100)
+
+
+def test_pagination_keeps_filters_and_ignores_rows_added_later(store):
+    _fill(store, 6, fingerprint='aa')
+    _fill(store, 4, fingerprint='bb')
+
+    first = store.query(fingerprint='aa', limit=4)
+    store.record('doc-new', 100, [_signature('aa', '2026-01-01T00:00:00+00:00')])
+    store.flush()
+    rest = store.query(fingerprint='aa', limit=4, cursor=store.next_cursor(first))
+
+    assert len(first) == 4 and len(rest) == 2
+    assert {row['signer_fingerprint'] for row in first + rest} == {'aa'}
+    assert 'doc-new' not in {row['document_hash'] for row in first + rest}
+
+
+def test_next_cursor_empty():
+    assert HistoryStore.next_cursor([]) is None
+
+
+def test_documents_signed_by_groups_by_document(store):
+    store.record('doc1', 100, [_signature('aa', '2025-12-01T00:00:00+00:00')])
+    store.record('doc1', 100, [_signature('aa', '2025-12-05T00:00:00+00:00')])
+    store.record('doc2', 100, [_signature('aa', '2025-11-01T00:00:00+00:00')])
+    store.record('doc3', 100, [_signature('bb', '2025-12-02T00:00:00+00:00')])
+    store.flush()
+
+    assert store.documents_signed_by('aa') == [
+        {'document_hash': 'doc1', 'signing_time': '2025-12-05T00:00:00Z', 'verifications': 2},
+        {'document_hash': 'doc2', 'signing_time': '2025-11-01T00:00:00Z', 'verifications': 1},
+    ]
+    assert [row['document_hash'] for row in store.documents_signed_by('aa', since='2025-12')] == ['doc1']
+
+
+def test_documents_signed_by_pages_each_document_once(store):
+    # doc005 được ký lại sau (hai thời gian ký): chỉ xuất hiện một lần với thời gian mới nhất
+    _fill(store, 12)
+    store.record('doc005', 100, [_signature('aa', '2025-12-31T00:00:00+00:00')])
+    store.flush()
+
+    pages, cursor = [], None
+    while True:
+        documents = store.documents_signed_by('aa', limit=5, cursor=cursor)
+        if not documents:
+            break
+        pages.append(documents)
+        cursor = store.next_document_cursor(documents)
+
+    documents = [row for page in pages for row in page]
+    assert [len(page) for page in pages] == [5, 5, 2]
+    assert documents[0] == {'document_hash': 'doc005', 'signing_time': '2025-12-31T00:00:00Z', 'verifications': 2}
+    assert sorted(row['document_hash'] for row in documents) == [f'doc{i:03d}' for i in range(12)]
+    assert [row['document_hash'] for row in store.documents_signed_by('aa', until='2025-12-31')][:1] == ['doc011']
+
+
+def test_summary_is_backfilled_for_existing_history(store):
+    _fill(store, 3)
+    with sqlite3.connect(store.path) as conn:
+        conn.execute('DROP TABLE signer_documents')
+
+    reopened = HistoryStore(store.path)
+    assert len(reopened.documents_signed_by('aa')) == 3
+
+
+def test_documents_signed_by_skewed_fingerprint_uses_index(store):
+    # Một chứng chỉ chiếm phần lớn bảng: truy vấn phải đi theo index, không sort/group tạm
+    with sqlite3.connect(store.path) as conn:
+        conn.executemany(
+            "INSERT INTO signer_documents VALUES (?, ?, ?, 1)",
+            [('hot' if i % 10 else f'fp{i}', f'doc{i:06d}', f'2025-12-01T00:{i // 60 % 60:02d}:{i % 60:02d}Z')
+             for i in range(20000)])
+        params = {'fingerprint': 'hot', 'since': '', 'until': '~', 'cursor_time': '2025-12-01T00:30:00Z',
+                  'cursor_document': 'doc', 'limit': 100}
+        for upper_bound in ("d.signing_time < :until", "d.signing_time <= :cursor_time"):
+            plan = ' | '.join(row[3] for row in conn.execute(
+                'EXPLAIN QUERY PLAN ' + DOCUMENTS_SIGNED_BY_SQL.format(upper_bound=upper_bound), params))
+            assert 'idx_signer_documents_time' in plan
+            assert 'TEMP B-TREE' not in plan
+
+    documents = store.documents_signed_by('hot', limit=100)
+    assert len(documents) == 100
+    assert documents == sorted(documents, key=lambda row: (row['signing_time'], row['document_hash']), reverse=True)
+
+
+def test_write_errors_are_logged(store, caplog):
+    store.record('doc1', 100, [])
+    store.flush()
+    with sqlite3.connect(store.path) as conn:
+        conn.execute('DROP TABLE verifications')
+
+    with caplog.at_level(logging.ERROR, logger='history_store'):
+        store.record('doc2', 100, [])
+        store.flush()
+
+    assert any('1 dòng' in record.getMessage() and record.exc_info for record in caplog.records)
@@ -0,0 +1,121 @@
+import hashlib
+import io
+import os
+import time
+
+import pytest
+
+from ingest import ingest_upload, parse_byte_ranges_header
+from limits import VerificationLimitExceeded
+
+DATA = b"%PDF-1.7\n" + bytes(range(256)) * 40
+
+
+def _slice_digest(data, byte_range, algorithm='sha256'):
+    off1, len1, off2, len2 = byte_range
+    hasher = hashlib.new(algorithm)
+    hasher.update(data[off1:off1 + len1])
+    hasher.update(data[off2:off2 + len2])
+    return hasher.digest()
+
+
+@pytest.fixture
+def ingest():
+    """ingest_upload() trên bytes, xoá file tạm sau test"""
+    created = []
+
+    def run(data, byte_ranges=(), chunk_size=97, algorithms=('sha256',), max_ranges=None):
+        result = ingest_upload(io.BytesIO(data), byte_ranges=byte_ranges, algorithms=algorithms, chunk_size=chunk_size,
+                               max_ranges=max_ranges)
+        created.append(result.temp_path)
+        return result
+    yield run
+    for path in created:
+        os.remove(path)
+
+
+def test_parse_byte_ranges_header():
+    assert parse_byte_ranges_header("0 840 960 240; 0, 5000, 6000, 100") == [(0, 840, 960, 240), (0, 5000, 6000, 100)]
+    with pytest.raises(ValueError):
+        parse_byte_ranges_header("0 840 960")
+    with pytest.raises(ValueError):
+        parse_byte_ranges_header("0 840 -960 240")
+
+
+@pytest.mark.parametrize('byte_range', [(0, 100, 200, 300), (0, 100, 100, 50), (20, 0, 30, 40), (0, len(DATA), len(DATA), 0)])
+@pytest.mark.parametrize('algorithms', [('sha256',), ('sha256', 'sha1')])
+def test_header_ranges_match_slice_digest(ingest, byte_range, algorithms):
+    result = ingest(DATA, [byte_range], algorithms=algorithms)
+
+    assert result.document_hash == hashlib.sha256(DATA).hexdigest()
+    for algorithm in algorithms:
+        assert result.range_digests[(*byte_range, algorithm)] == _slice_digest(DATA, byte_range, algorithm)
+
+
+@pytest.mark.parametrize('byte_range', [
+    (5000, 50, 0, 50),     # đảo ngược
+    (0, 200, 100, 200),    # chồng nhau
+    (100, 50, 120, 50),    # đoạn hai bắt đầu trong đoạn một
+    (0, 100, 200, 10 ** 6),  # vượt cuối file
+])
+def test_unordered_or_out_of_bounds_ranges_are_not_digested(ingest, byte_range):
+    assert ingest(DATA, [byte_range]).range_digests == {}
+
+
+@pytest.mark.parametrize('chunk_size', [16, 31, 97, 4096])
+def test_discovered_byterange_matches_slice_digest(ingest, chunk_size):
+    prefix = b"%PDF-1.7\n1 0 obj\n<< /ByteRange [0 0000000080 0000000100 0000000050] /Contents <"
+    data = prefix.ljust(80, b" ") + b"<" + b"0" * 18 + b">" + b"x" * 50
+    byte_range = (0, 80, 100, 50)
+
+    result = ingest(data, chunk_size=chunk_size)
+    assert result.range_digests == {(*byte_range, 'sha256'): _slice_digest(data, byte_range)}
+
+
+@pytest.mark.parametrize('numbers', [b"60 20 0 40", b"0 80 40 60"])
+def test_discovered_reversed_or_overlapping_byterange_is_ignored(ingest, numbers):
+    data = (b"%PDF-1.7\n/ByteRange [" + numbers + b"]").ljust(200, b" ")
+    assert ingest(data).range_digests == {}
+
+
+def test_discovered_byteranges_are_capped(ingest):
+    # Hàng nghìn "/ByteRange [0 N N 0]" (mỗi cái hash toàn file) chỉ theo dõi max_ranges cái đầu
+    size = 4 * 1024 * 1024
+    body = b"".join(b"/ByteRange [0 %d %d 0]\n" % (size - i, size - i) for i in range(2000))
+    data = (b"%PDF-1.7\n" + body).ljust(size, b" ")
+
+    started = time.perf_counter()
+    result = ingest(data, chunk_size=256 * 1024, max_ranges=50)
+    elapsed = time.perf_counter() - started
+
+    assert len(result.range_digests) == 50
+    assert result.range_digests[(0, size, size, 0, 'sha256')] == hashlib.sha256(data).digest()
+    assert elapsed < 3.0
+
+
+def test_header_with_too_many_ranges_is_rejected(ingest):
+    byte_ranges = [(0, 100, 200, 10 * i) for i in range(1, 4)]
+    assert len(ingest(DATA, byte_ranges, max_ranges=3).range_digests) == 3
+    with pytest.raises(VerificationLimitExceeded) as excinfo:
+        ingest(DATA, byte_ranges, max_ranges=2)
+    assert excinfo.value.http_status == 413
+    assert excinfo.value.to_dict() == {'limit': 'max_signatures', 'actual': 3, 'maximum': 2, 'stage': 'admission'}
+
+
+def test_api_rejects_header_with_too_many_ranges(monkeypatch):
+    import api
+
+    monkeypatch.setitem(api.VERIFICATION_LIMITS, 'max_signatures', 2)
+    response = api.app.test_client().post(
+        '/api/verify-pdf', data=DATA, content_type='application/pdf',
+        headers={'X-PDF-ByteRanges': '0 10 20 5; 0 10 20 6; 0 10 20 7'})
+
+    assert response.status_code == 413
+    assert response.get_json()['limit_exceeded']['limit'] == 'max_signatures'
+
+
+def test_rejects_non_pdf_and_oversized_upload():
+    with pytest.raises(ValueError):
+        ingest_upload(io.BytesIO(b"not a pdf"))
+    with pytest.raises(VerificationLimitExceeded):
+        ingest_upload(io.BytesIO(DATA), max_bytes=100, chunk_size=64)
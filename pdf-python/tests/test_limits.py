@@ -0,0 +1,148 @@
+import threading
+import time
+
+import pytest
+
+from limits import VerificationGuard, VerificationLimitExceeded, check_admission, deferred_interrupts, get_limits
+
+
+def _signed_pdf_bytes(signatures=1, contents_hex=64, pages=1):
+    body = b"%PDF-1.7\n1 0 obj\n<< /Type /Catalog /Pages 2 0 R >>\nendobj\n"
+    body += b"2 0 obj\n<< /Type /Pages /Kids [3 0 R] /Count %d >>\nendobj\n" % pages
+    body += b"3 0 obj\n<< /Type /Page >>\nendobj\n" * pages
+    for n in range(signatures):
+        off = len(body) + 40
+        body += b"%d 0 obj\n<< /ByteRange [0 %d %d 10] /Contents <" % (4 + n, off, off + contents_hex + 2)
+        body += b"0" * contents_hex + b"> >>\nendobj\n"
+    return body + b"trailer\n<< /Size %d /Root 1 0 R >>\n%%%%EOF\n" % (4 + signatures)
+
+
+def test_admission_passes_and_reports_stats(write_pdf):
+    stats = check_admission(write_pdf(_signed_pdf_bytes(signatures=2)), get_limits())
+    assert stats['signatures'] == 2
+    assert stats['pages'] == 1
+    assert stats['objects'] >= 5
+
+
+@pytest.mark.parametrize('limit, overrides, pdf_kwargs', [
+    ('max_upload_bytes', {'max_upload_bytes': 100}, {}),
+    ('max_signatures', {'max_signatures': 2}, {'signatures': 3}),
+    ('max_contents_bytes', {'max_contents_bytes': 100}, {'contents_hex': 400}),
+    ('max_objects', {'max_objects': 3}, {}),
+    ('max_pages', {'max_pages': 2}, {'pages': 3}),
+])
+def test_admission_rejects_with_413(write_pdf, limit, overrides, pdf_kwargs):
+    with pytest.raises(VerificationLimitExceeded) as excinfo:
+        check_admission(write_pdf(_signed_pdf_bytes(**pdf_kwargs)), get_limits(**overrides))
+    assert excinfo.value.limit == limit
+    assert excinfo.value.stage == 'admission'
+    assert excinfo.value.http_status == 413
+
+
+def test_admission_zero_disables_limit(write_pdf):
+    check_admission(write_pdf(_signed_pdf_bytes(signatures=3)), get_limits(max_signatures=0))
+
+
+def test_admission_scan_is_linear_on_long_digit_runs(write_pdf):
+    # /Contents hex đệm 0 từng làm regex object header quét O(n^2)
+    path = write_pdf(b"%PDF-1.7\n" + b"0" * 2_000_000 + b"\n%%EOF\n")
+    started = time.monotonic()
+    check_admission(path, get_limits(max_upload_bytes=0))
+    assert time.monotonic() - started < 1.0
+
+
+def _limits(stage_timeout):
+    return get_limits(stage_timeout_seconds=stage_timeout, verify_timeout_seconds=0, max_rss_bytes=0)
+
+
+def test_runaway_stage_is_interrupted_despite_broad_except():
+    guard = VerificationGuard(_limits(0.2))
+    started = time.monotonic()
+    with pytest.raises(VerificationLimitExceeded) as excinfo:
+        with guard.run():
+            guard.enter('integrity')
+            while True:
+                try:
+                    time.sleep(0.01)
+                except Exception:
+                    pass
+    assert excinfo.value.limit == 'stage_timeout_seconds'
+    assert excinfo.value.stage == 'integrity'
+    assert excinfo.value.http_status == 422
+    assert time.monotonic() - started < 2.0
+
+
+def test_timeout_is_deferred_until_critical_section_ends():
+    guard = VerificationGuard(_limits(0.1))
+    completed = []
+    with pytest.raises(VerificationLimitExceeded):
+        with guard.run():
+            guard.enter('integrity')
+            with deferred_interrupts():
+                time.sleep(0.3)
+                completed.append('section')
+            completed.append('after section')
+    assert completed == ['section']
+
+
+def test_stages_are_timed_and_closed_in_order():
+    guard = VerificationGuard(_limits(5))
+    with guard.run():
+        guard.enter('parse')
+        guard.enter('dss')
+    assert set(guard.stage_timings) == {'parse', 'dss'}
+
+
+def test_error_in_stage_propagates_unchanged():
+    guard = VerificationGuard(_limits(5))
+    with pytest.raises(KeyError):
+        with guard.run():
+            guard.enter('parse')
+            raise KeyError('boom')
+    assert 'parse' in guard.stage_timings
+
+
+def test_total_deadline_is_enforced():
+    guard = VerificationGuard(get_limits(stage_timeout_seconds=0, verify_timeout_seconds=0.1, max_rss_bytes=0))
+    with pytest.raises(VerificationLimitExceeded) as excinfo:
+        with guard.stage('parse'):
+            time.sleep(0.5)
+    assert excinfo.value.limit == 'verify_timeout_seconds'
+
+
+def test_worker_thread_checks_deadline_when_stage_closes():
+    errors = []
+
+    def verify():
+        guard = VerificationGuard(_limits(0.1))
+        try:
+            with guard.run():
+                guard.enter('parse')
+                time.sleep(0.2)
+                guard.enter('dss')
+        except VerificationLimitExceeded as e:
+            errors.append(e.stage)
+
+    thread = threading.Thread(target=verify)
+    thread.start()
+    thread.join()
+    assert errors == ['parse']
+
+
+@pytest.mark.parametrize('limits, expected', [
+    ({'stage_timeout_seconds': 30, 'verify_timeout_seconds': 0}, ('stage_timeout_seconds', 30)),
+    ({'stage_timeout_seconds': 30, 'verify_timeout_seconds': 10}, ('verify_timeout_seconds', 10)),
+    ({'stage_timeout_seconds': 0, 'verify_timeout_seconds': 0}, ('stage_timeout_seconds', 0)),
+])
+def test_expire_reports_the_deadline_the_stage_would_hit(limits, expected):
+    guard = VerificationGuard(get_limits(max_rss_bytes=0, **limits))
+    started = time.monotonic()
+    with pytest.raises(VerificationLimitExceeded) as excinfo:
+        with guard.run():
+            guard.enter('integrity')
+            guard.expire('ByteRange lặp')
+    assert (excinfo.value.limit, excinfo.value.actual) == expected
+    assert excinfo.value.stage == 'integrity'
+    assert 'ByteRange lặp' in excinfo.value.message
+    assert time.monotonic() - started < 1.0
+    assert 'integrity' in guard.stage_timings
@@ -0,0 +1,282 @@
+import datetime
+import hashlib
+import io
+
+import pytest
+from asn1crypto import cms as asn1_cms
+from asn1crypto import tsp as asn1_tsp
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.x509 import ocsp
+from cryptography.x509.oid import ExtendedKeyUsageOID
+from pypdf import PdfReader
+
+from ltv import ValidationDataPool, load_validation_data
+from sample_pdfs import add_dss, append_update, make_certificate, make_ocsp_response, sign_pdf
+
+NOW = datetime.datetime.now(datetime.timezone.utc)
+GOOD = ocsp.OCSPCertStatus.GOOD
+REVOKED = ocsp.OCSPCertStatus.REVOKED
+
+
+@pytest.fixture(scope='module')
+def pki():
+    ca, ca_key = make_certificate('LTV Root CA', key_type='p256', ca=True)
+    signer, signer_key = make_certificate('LTV Signer', ca, ca_key, key_type='p256')
+    # Cùng tên với CA thật nhưng khoá khác
+    rogue, rogue_key = make_certificate('LTV Root CA', key_type='p256', ca=True)
+    return {'ca': ca, 'ca_key': ca_key, 'signer': signer, 'signer_key': signer_key,
+            'rogue': rogue, 'rogue_key': rogue_key}
+
+
+def _responder(pki, eku=True, issuer='ca'):
+    key_cert, key = make_certificate('LTV OCSP Responder', key_type='p256')
+    builder = (x509.CertificateBuilder()
+               .subject_name(key_cert.subject)
+               .issuer_name(pki[issuer].subject)
+               .public_key(key.public_key())
+               .serial_number(x509.random_serial_number())
+               .not_valid_before(NOW - datetime.timedelta(days=1))
+               .not_valid_after(NOW + datetime.timedelta(days=30)))
+    if eku:
+        builder = builder.add_extension(x509.ExtendedKeyUsage([ExtendedKeyUsageOID.OCSP_SIGNING]), critical=False)
+    return builder.sign(pki[f'{issuer}_key'], hashes.SHA256()), key
+
+
+def _ocsp(pki, status=GOOD, forged=False, responder=None, this_update=NOW, next_update=None):
+    """
+    OCSP response cho pki['signer'], mặc định do CA ký và hạn 1 ngày
+
+    forged: ký bằng khoá của CA giả cùng tên (responder id theo tên trùng với CA thật)
+    """
+    next_update = next_update or this_update + datetime.timedelta(days=1)
+    builder = ocsp.OCSPResponseBuilder().add_response(
+        cert=pki['signer'], issuer=pki['ca'], algorithm=hashes.SHA1(), cert_status=status,
+        this_update=this_update, next_update=next_update,
+        revocation_time=this_update if status == REVOKED else None, revocation_reason=None,
+    )
+    if responder is not None:
+        cert, key = responder
+        builder = builder.responder_id(ocsp.OCSPResponderEncoding.HASH, cert).certificates([cert])
+    elif forged:
+        builder = builder.responder_id(ocsp.OCSPResponderEncoding.NAME, pki['rogue'])
+        key = pki['rogue_key']
+    else:
+        builder = builder.responder_id(ocsp.OCSPResponderEncoding.HASH, pki['ca'])
+        key = pki['ca_key']
+    return builder.sign(key, hashes.SHA256()).public_bytes(serialization.Encoding.DER)
+
+
+def _crl(pki, revoked=(), key=None, last_update=NOW, next_update=NOW + datetime.timedelta(days=1), revoked_at=NOW):
+    builder = (x509.CertificateRevocationListBuilder()
+               .issuer_name(pki['ca'].subject)
+               .last_update(last_update))
+    if next_update is not None:
+        builder = builder.next_update(next_update)
+    for serial in revoked:
+        builder = builder.add_revoked_certificate(
+            x509.RevokedCertificateBuilder().serial_number(serial).revocation_date(revoked_at).build())
+    return builder.sign(key or pki['ca_key'], hashes.SHA256()).public_bytes(serialization.Encoding.DER)
+
+
+def _status(pki, ocsps=(), crls=(), certs=('ca',), issuer=True, validation_time=None):
+    pool = ValidationDataPool()
+    pool.add_certificates([pki[name] for name in certs])
+    for der in ocsps:
+        pool.add_ocsp(der)
+    for der in crls:
+        pool.add_crl(der)
+    return pool.revocation_status(pki['signer'], pki['ca'] if issuer else None, validation_time)
+
+
+@pytest.mark.parametrize('status, expected', [(GOOD, 'good'), (REVOKED, 'revoked')])
+def test_ocsp_signed_by_issuer(pki, status, expected):
+    assert _status(pki, [_ocsp(pki, status)]) == (expected, 'ocsp')
+    # Không truyền issuer: tìm trong pool
+    assert _status(pki, [_ocsp(pki, status)], issuer=False) == (expected, 'ocsp')
+
+
+@pytest.mark.parametrize('status', [GOOD, REVOKED])
+def test_forged_ocsp_is_ignored(pki, status):
+    assert _status(pki, [_ocsp(pki, status, forged=True)]) == ('unknown', None)
+
+
+def test_forged_ocsp_does_not_shadow_genuine_response(pki):
+    forged = _ocsp(pki, REVOKED, forged=True)
+    assert _status(pki, [forged, _ocsp(pki, GOOD)]) == ('good', 'ocsp')
+
+
+def test_delegated_responder(pki):
+    assert _status(pki, [_ocsp(pki, REVOKED, responder=_responder(pki))]) == ('revoked', 'ocsp')
+    # Thiếu EKU id-kp-OCSPSigning, hoặc responder không do issuer cấp
+    assert _status(pki, [_ocsp(pki, REVOKED, responder=_responder(pki, eku=False))]) == ('unknown', None)
+    assert _status(pki, [_ocsp(pki, REVOKED, responder=_responder(pki, issuer='rogue'))]) == ('unknown', None)
+
+
+@pytest.mark.parametrize('this_update, next_update', [
+    (NOW - datetime.timedelta(days=10), NOW - datetime.timedelta(days=9)),
+    (NOW + datetime.timedelta(days=2), NOW + datetime.timedelta(days=3)),
+])
+def test_stale_ocsp_is_ignored(pki, this_update, next_update):
+    assert _status(pki, [_ocsp(pki, GOOD, this_update=this_update, next_update=next_update)]) == ('unknown', None)
+
+
+def test_validation_time_controls_freshness(pki):
+    pool = ValidationDataPool(validation_time=NOW - datetime.timedelta(days=9, hours=12))
+    pool.add_certificates([pki['ca']])
+    pool.add_ocsp(_ocsp(pki, GOOD, this_update=NOW - datetime.timedelta(days=10),
+                        next_update=NOW - datetime.timedelta(days=9)))
+    assert pool.revocation_status(pki['signer'], pki['ca']) == ('good', 'ocsp')
+
+
+@pytest.mark.parametrize('hours, expected', [(-1, 'good'), (1, 'revoked')])
+def test_revocation_is_judged_at_validation_time(pki, hours, expected):
+    # Bị thu hồi lúc NOW; chữ ký lúc NOW + hours
+    validation_time = NOW + datetime.timedelta(hours=hours)
+    serial = pki['signer'].serial_number
+    assert _status(pki, [_ocsp(pki, REVOKED)], validation_time=validation_time) == (expected, 'ocsp')
+    assert _status(pki, crls=[_crl(pki, [serial])], validation_time=validation_time) == (expected, 'crl')
+
+
+def test_data_fetched_after_validation_time_is_used(pki):
+    # OCSP / CRL lấy sau khi ký (LTV bổ sung sau) vẫn chứng minh cert chưa bị thu hồi lúc ký
+    validation_time = NOW - datetime.timedelta(days=30)
+    assert _status(pki, [_ocsp(pki, GOOD)], validation_time=validation_time) == ('good', 'ocsp')
+    assert _status(pki, crls=[_crl(pki)], validation_time=validation_time) == ('good', 'crl')
+
+
+@pytest.mark.parametrize('last_update, next_update', [
+    (NOW - datetime.timedelta(days=10), NOW - datetime.timedelta(days=9)),
+    (NOW + datetime.timedelta(days=2), NOW + datetime.timedelta(days=3)),
+])
+def test_stale_crl_is_ignored(pki, last_update, next_update):
+    crl = _crl(pki, [pki['signer'].serial_number], last_update=last_update, next_update=next_update,
+               revoked_at=NOW - datetime.timedelta(days=20))
+    assert _status(pki, crls=[crl]) == ('unknown', None)
+
+
+def test_validate_is_cached_per_validation_time(pki):
+    pool = ValidationDataPool()
+    pool.add_certificates([pki['ca']])
+    pool.add_ocsp(_ocsp(pki, REVOKED))
+    before, after = NOW - datetime.timedelta(hours=1), NOW + datetime.timedelta(hours=1)
+
+    assert pool.validate(pki['signer'], before)['revocation'] == [('good', 'ocsp')]
+    assert pool.validate(pki['signer'], after)['revocation'] == [('revoked', 'ocsp')]
+    assert pool.summary(pki['signer'], b'', before)['validation_time'] == before.isoformat()
+
+
+def test_crl_signature_is_verified(pki):
+    serial = pki['signer'].serial_number
+    assert _status(pki, crls=[_crl(pki, [serial])]) == ('revoked', 'crl')
+    assert _status(pki, crls=[_crl(pki)]) == ('good', 'crl')
+    assert _status(pki, crls=[_crl(pki, key=pki['rogue_key'])]) == ('unknown', None)
+    # Issuer không có trong pool (chỉ có cert cùng tên khác khoá): bỏ CRL
+    assert _status(pki, crls=[_crl(pki, [serial])], certs=('rogue',), issuer=False) == ('unknown', None)
+
+
+def _reader(pdf):
+    return PdfReader(io.BytesIO(pdf))
+
+
+def test_load_validation_data_from_dss(pki):
+    pdf, cms = sign_pdf(pki['signer'], pki['signer_key'])
+    pdf = add_dss(pdf, cms, [pki['ca']], ocsps=[make_ocsp_response(pki['signer'], pki['ca'], pki['ca_key'])])
+
+    pool = load_validation_data(_reader(pdf))
+    assert pool.has_dss and pool.cert_count == 1 and pool.ocsp_count == 1
+    assert pool.revocation_status(pki['signer']) == ('good', 'ocsp')
+    assert list(pool.vri.values()) == [{'certs': 1, 'crls': 0, 'ocsps': 0}]
+
+
+CATALOG = b"<< /Type /Catalog /Pages 2 0 R /AcroForm << /Fields [3 0 R] /SigFlags 3 >> /DSS %s >>"
+
+
+@pytest.mark.parametrize('dss', [
+    b"5",
+    b"<< /Certs 42 >>",
+    b"<< /Certs [42 (abc) << /A 1 >>] /OCSPs [/Name] >>",
+    b"<< /Certs [%d 0 R] /VRI 7 >>",
+    b"<< /VRI << /ABC 5 /DEF << /Cert [42] /OCSP 3 >> >> >>",
+])
+def test_malformed_dss_does_not_raise(pki, dss):
+    pdf, _ = sign_pdf(pki['signer'], pki['signer_key'])
+    stream = b"<< /Length 3 >>\nstream\nabc\nendstream"
+    size = int(pdf.rsplit(b"/Size ", 1)[1].split()[0])
+    pdf, _ = append_update(pdf, [stream], CATALOG % (dss % size if b"%d" in dss else dss))
+
+    pool = load_validation_data(_reader(pdf))
+    assert pool.cert_count == 0 and pool.ocsp_count == 0
+    assert pool.revocation_status(pki['signer']) == ('unknown', None)
+
+
+def test_malformed_dss_still_returns_report(pki, write_pdf):
+    from api import read_pdf_signatures
+
+    pdf, _ = sign_pdf(pki['signer'], pki['signer_key'])
+    for dss in (b"5", b"<< /Certs [42] >>"):
+        signatures = read_pdf_signatures(write_pdf(append_update(pdf, [], CATALOG % dss)[0]))
+        assert len(signatures) == 1
+        assert signatures[0]['signer']['common_name'] == 'LTV Signer'
+
+
+def _with_timestamp(pdf, cms, gen_time, imprint=None):
+    """
+    Thêm timestamp token (RFC 3161, gen_time) vào unsigned attrs của CMS và ghi lại /Contents
+
+    /Contents nằm ngoài ByteRange nên chữ ký vẫn hợp lệ. Token không có chữ ký của TSA
+    (service chỉ đọc gen_time và kiểm tra message imprint).
+    """
+    content_info = asn1_cms.ContentInfo.load(cms)
+    signer_info = content_info['content']['signer_infos'][0]
+    tst_info = asn1_tsp.TSTInfo({
+        'version': 'v1',
+        'policy': '1.2.3.4',
+        'message_imprint': {
+            'hash_algorithm': {'algorithm': 'sha256'},
+            'hashed_message': imprint or hashlib.sha256(signer_info['signature'].native).digest(),
+        },
+        'serial_number': 1,
+        'gen_time': gen_time,
+    })
+    token = asn1_cms.ContentInfo({'content_type': 'signed_data', 'content': {
+        'version': 'v3',
+        'digest_algorithms': [],
+        'encap_content_info': {'content_type': 'tst_info', 'content': tst_info},
+        'signer_infos': [],
+    }})
+    signer_info['unsigned_attrs'] = [{'type': 'signature_time_stamp_token', 'values': [token]}]
+    stamped = content_info.dump(force=True)
+    old, new = cms.hex().encode(), stamped.hex().encode()
+    return pdf.replace(old + b"0" * (len(new) - len(old)), new, 1), stamped
+
+
+SIGNED_AT = NOW.replace(microsecond=0) - datetime.timedelta(days=2)  # /M không có phần lẻ giây
+
+
+@pytest.mark.parametrize('revoked_after, timestamp_after, expected', [
+    (datetime.timedelta(hours=1), None, 'good'),                          # thu hồi sau lúc ký (/M)
+    (-datetime.timedelta(hours=1), None, 'revoked'),                      # thu hồi trước lúc ký
+    (datetime.timedelta(hours=1), datetime.timedelta(hours=2), 'revoked'),  # gen_time TSA ưu tiên hơn /M
+])
+def test_report_judges_revocation_at_signing_time(pki, write_pdf, revoked_after, timestamp_after, expected):
+    from api import read_pdf_signatures
+
+    pdf, cms = sign_pdf(pki['signer'], pki['signer_key'], signed_at=SIGNED_AT)
+    if timestamp_after is not None:
+        pdf, cms = _with_timestamp(pdf, cms, SIGNED_AT + timestamp_after)
+    response = _ocsp(pki, REVOKED, this_update=SIGNED_AT + revoked_after)
+    pdf = add_dss(pdf, cms, [pki['ca']], ocsps=[response])
+
+    signature, = read_pdf_signatures(write_pdf(pdf))
+    assert signature['has_timestamp'] is (timestamp_after is not None)
+    assert signature['ltv']['revocation_status'] == expected
+    assert signature['ltv']['validation_time'] == (SIGNED_AT + (timestamp_after or datetime.timedelta())).isoformat()
+
+
+def test_timestamp_for_another_signature_is_ignored(pki):
+    from api import check_tsa_presence
+
+    pdf, cms = sign_pdf(pki['signer'], pki['signer_key'])
+    assert check_tsa_presence(_with_timestamp(pdf, cms, NOW)[1])[0] is True
+    assert check_tsa_presence(_with_timestamp(pdf, cms, NOW, imprint=b'\0' * 32)[1]) == (False, None)
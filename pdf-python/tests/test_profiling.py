@@ -0,0 +1,44 @@
+import threading
+import tracemalloc
+
+from profiling import SamplingProfiler
+
+
+def test_single_profile_reports_and_stops_tracemalloc():
+    assert not tracemalloc.is_tracing()
+    with SamplingProfiler(interval=0.001) as profiler:
+        data = [bytes(1024) for _ in range(1000)]
+    report = profiler.report()
+    del data
+
+    assert not tracemalloc.is_tracing()
+    assert report['tracemalloc_peak_bytes'] >= 1024 * 1000
+    assert report['tracemalloc_overlapped'] is False
+    assert report['top_allocations']
+
+
+def test_overlapping_profiles_share_tracemalloc():
+    # A (thread chính) bắt đầu, B bắt đầu, A kết thúc trước B: A không được stop tracemalloc của B
+    b_entered, a_exited = threading.Event(), threading.Event()
+    errors, second = [], SamplingProfiler(interval=0.001)
+
+    def run_second():
+        try:
+            with second:
+                b_entered.set()
+                a_exited.wait(5)
+                assert tracemalloc.is_tracing()
+        except BaseException as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=run_second)
+    with SamplingProfiler(interval=0.001) as first:
+        thread.start()
+        assert b_entered.wait(5)
+    a_exited.set()
+    thread.join()
+
+    assert errors == []
+    assert first.tracemalloc_overlapped and second.tracemalloc_overlapped
+    assert second.top_allocations
+    assert not tracemalloc.is_tracing()
@@ -0,0 +1,149 @@
+import datetime
+
+import pytest
+from asn1crypto import cms as asn1_cms
+from asn1crypto import core as asn1_core
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.x509.oid import NameOID
+from pypdf.generic import DictionaryObject, NameObject, TextStringObject
+
+from sample_pdfs import make_certificate, sign_pdf
+from signer_identity import (DEFAULT_PRECEDENCE, cms_name, field_display_name, load_precedence, name_attributes,
+                             resolve_signer_identity)
+
+
+def _certificate(*attributes, issuer_cn='Test CA'):
+    key = ec.generate_private_key(ec.SECP256R1())
+    now = datetime.datetime.now(datetime.timezone.utc)
+    subject = x509.Name([x509.NameAttribute(oid, value) for oid, value in attributes])
+    return (x509.CertificateBuilder()
+            .subject_name(subject)
+            .issuer_name(x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, issuer_cn)]))
+            .public_key(key.public_key())
+            .serial_number(x509.random_serial_number())
+            .not_valid_before(now - datetime.timedelta(days=1))
+            .not_valid_after(now + datetime.timedelta(days=30))
+            .sign(key, hashes.SHA256()))
+
+
+def _v_obj(**fields):
+    return DictionaryObject({NameObject(f'/{key}'): TextStringObject(value) for key, value in fields.items()})
+
+
+def test_load_precedence():
+    assert load_precedence('') == DEFAULT_PRECEDENCE
+    assert load_precedence('pdf_name, cn ,bogus') == ('pdf_name', 'cn')
+    assert load_precedence('bogus') == DEFAULT_PRECEDENCE
+
+
+def test_name_attributes_keeps_first_value():
+    name = x509.Name([
+        x509.NameAttribute(NameOID.COMMON_NAME, 'First'),
+        x509.NameAttribute(NameOID.COMMON_NAME, 'Second'),
+    ])
+    assert name_attributes(name) == {NameOID.COMMON_NAME.dotted_string: 'First'}
+
+
+def test_common_name_wins_by_default():
+    cert = _certificate((NameOID.COMMON_NAME, 'Nguyen Van A'), (NameOID.USER_ID, 'CMND:123'),
+                        (NameOID.COUNTRY_NAME, 'VN'))
+    identity = resolve_signer_identity(cert, v_obj=_v_obj(Name='PDF Name'), field_name='Signature1')
+
+    assert identity['signer']['display_name'] == 'Nguyen Van A'
+    assert identity['signer']['display_name_source'] == 'cn'
+    assert identity['signer']['common_name'] == 'Nguyen Van A'
+    assert identity['signer']['user_id'] == 'CMND:123'
+    assert identity['signer']['country'] == 'VN'
+    assert identity['issuer'] == {'common_name': 'Test CA', 'organization': 'N/A', 'country': 'N/A'}
+    assert identity['is_self_signed'] is False
+
+
+def test_configured_precedence_overrides_common_name():
+    cert = _certificate((NameOID.COMMON_NAME, 'Nguyen Van A'))
+    identity = resolve_signer_identity(cert, v_obj=_v_obj(Name='PDF Name'), precedence=('pdf_name', 'cn'))
+
+    assert identity['signer']['display_name'] == 'PDF Name'
+    assert identity['signer']['display_name_source'] == 'pdf_name'
+    assert identity['signer']['common_name'] == 'Nguyen Van A'
+
+
+@pytest.mark.parametrize('attributes, v_obj, field_name, expected', [
+    (((NameOID.USER_ID, 'CMND:123'),), None, None, ('CMND:123', 'uid')),
+    (((NameOID.SERIAL_NUMBER, 'MST:0101'),), None, None, ('MST:0101', 'serial_number')),
+    (((NameOID.COUNTRY_NAME, 'VN'),), {'Name': 'PDF Name'}, None, ('PDF Name', 'pdf_name')),
+    (((NameOID.COUNTRY_NAME, 'VN'),), {'Name': 'unknown', 'Reason': 'Approved'}, None, ('Approved', 'pdf_fields')),
+    (((NameOID.COUNTRY_NAME, 'VN'),), None, 'Signature_NguyenVanA', ('Sig: NguyenVanA', 'field_name')),
+    (((NameOID.COUNTRY_NAME, 'VN'),), None, 'Signature1', ('N/A', None)),
+])
+def test_fallback_when_certificate_has_no_common_name(attributes, v_obj, field_name, expected):
+    cert = _certificate(*attributes)
+    identity = resolve_signer_identity(cert, v_obj=_v_obj(**v_obj) if v_obj else None, field_name=field_name)
+
+    assert identity['signer']['common_name'] == 'N/A'
+    assert (identity['signer']['display_name'], identity['signer']['display_name_source']) == expected
+
+
+def test_without_certificate_uses_pdf_then_field_name():
+    identity = resolve_signer_identity(v_obj=_v_obj(Location='Ha Noi'), cms_bytes=b'not cms', field_name='Sig_B')
+    assert identity['signer']['display_name'] == 'Ha Noi'
+    assert identity['signer']['display_name_source'] == 'pdf_fields'
+    assert identity['issuer']['common_name'] == 'N/A'
+
+    identity = resolve_signer_identity(cms_bytes=b'not cms', field_name='Signature_B')
+    assert identity['signer']['display_name'] == 'Sig: B'
+
+
+def test_field_display_name():
+    assert field_display_name('Signature_NguyenVanA') == 'Sig: NguyenVanA'
+    assert field_display_name('Approval') == 'Sig: Approval'
+    assert field_display_name('Signature2') is None
+    assert field_display_name(None) is None
+
+
+@pytest.fixture(scope='module', params=[False, True], ids=['no-signed-attrs', 'signed-attrs'])
+def signed(request):
+    """PDF + CMS thật ký bởi 'Alice', CA 'Sample Root CA', field Signature_Alice"""
+    ca, ca_key = make_certificate('Sample Root CA', ca=True)
+    cert, key = make_certificate('Alice', ca, ca_key)
+    return sign_pdf(cert, key, signed_attributes=request.param, field_name=b'Signature_Alice')
+
+
+def _with_unsigned_attrs(cms_bytes, *attrs):
+    content_info = asn1_cms.ContentInfo.load(cms_bytes)
+    signer_info = content_info['content']['signer_infos'][0]
+    signer_info['unsigned_attrs'] = asn1_cms.CMSAttributes([
+        asn1_cms.CMSAttribute({'type': oid, 'values': [value]}) for oid, value in attrs])
+    return content_info.dump(force=True)
+
+
+def test_cms_without_name_attributes_falls_back_to_field_name(signed):
+    _, cms = signed
+    # content_type / signing_time / message_digest không phải tên; issuer của sid là tên CA
+    assert cms_name(cms) is None
+    identity = resolve_signer_identity(cms_bytes=cms, field_name='Signature_Alice')
+    assert (identity['signer']['display_name'], identity['signer']['display_name_source']) == ('Sig: Alice', 'field_name')
+
+
+def test_cms_name_skips_broken_attribute(signed):
+    _, cms = signed
+    cms = _with_unsigned_attrs(cms, ('1.2.3.4', asn1_core.UTF8String('@@')),
+                               ('1.2.3.5', asn1_core.UTF8String('Nguyen Van A')))
+    # Thuộc tính đầu thành UTF-8 sai (chỉ lỗi khi đọc giá trị)
+    cms = cms.replace(b'\x0c\x02@@', b'\x0c\x02\xff\xfe')
+    assert cms_name(cms) == 'Nguyen Van A'
+
+
+def test_error_path_names_signer_from_field(signed, write_pdf, monkeypatch):
+    import api
+
+    def broken(data):
+        raise ValueError('cannot load certificates')
+
+    pdf, _ = signed
+    monkeypatch.setattr(api.pkcs7, 'load_der_pkcs7_certificates', broken)
+    signature, = api.read_pdf_signatures(write_pdf(pdf))
+
+    assert signature['structure_validation']['is_structure_valid'] is False
+    assert signature['signer']['common_name'] == 'Sig: Alice'
@@ -0,0 +1,172 @@
+import json
+import os
+import threading
+import time
+
+import pytest
+
+from limits import VerificationLimitExceeded
+from singleflight import SingleFlight
+
+KEY = 'a' * 64
+
+
+class Counter:
+    """fn() cho SingleFlight: đếm số lần chạy, trả result hoặc raise error"""
+
+    def __init__(self, result=None, error=None, delay=0.0):
+        self.calls = 0
+        self.result = result if result is not None else [{'field_name': 'Signature1'}]
+        self.error = error
+        self.delay = delay
+
+    def __call__(self):
+        self.calls += 1
+        time.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+@pytest.fixture
+def workers(tmp_path):
+    """Hai SingleFlight dùng chung thư mục - như hai worker gunicorn"""
+    return SingleFlight(str(tmp_path), result_ttl=10.0), SingleFlight(str(tmp_path), result_ttl=10.0)
+
+
+def test_in_process_callers_share_one_run():
+    flight = SingleFlight(None)
+    fn = Counter(delay=0.2)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(flight.do(KEY, fn))) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert fn.calls == 1
+    assert sorted(shared for _, shared in results) == [False, True, True, True, True]
+
+
+def _run_with_follower(flight, leader_fn, follower_fn):
+    """Leader chạy leader_fn; trong lúc đó một request khác cùng key chạy follower_fn"""
+    outcome = {}
+
+    def leader():
+        try:
+            flight.do(KEY, leader_fn)
+        except BaseException as e:
+            outcome['leader_error'] = e
+
+    thread = threading.Thread(target=leader)
+    thread.start()
+    time.sleep(0.1)
+    try:
+        outcome['follower'] = flight.do(KEY, follower_fn)
+    except BaseException as e:
+        outcome['follower_error'] = e
+    thread.join()
+    return outcome
+
+
+@pytest.mark.parametrize('error', [
+    VerificationLimitExceeded('stage_timeout_seconds', 5.1, 5, stage='integrity'),
+    VerificationLimitExceeded('max_rss_bytes', 2 << 30, 1 << 30, stage='parse'),
+    RuntimeError('boom'),
+])
+def test_in_process_follower_reruns_after_load_dependent_error(error):
+    leader, follower = Counter(error=error, delay=0.3), Counter()
+    outcome = _run_with_follower(SingleFlight(None), leader, follower)
+
+    assert outcome['leader_error'] is error
+    assert outcome['follower'] == (follower.result, False)
+    assert (leader.calls, follower.calls) == (1, 1)
+
+
+def test_in_process_follower_shares_admission_error():
+    error = VerificationLimitExceeded('max_pages', 900, 500, stage='parse')
+    leader, follower = Counter(error=error, delay=0.3), Counter()
+    outcome = _run_with_follower(SingleFlight(None), leader, follower)
+
+    assert outcome['follower_error'] is error
+    assert follower.calls == 0
+
+
+def test_result_is_shared_across_workers(workers):
+    first, second = workers
+    fn = Counter()
+    assert first.do(KEY, fn) == (fn.result, False)
+    assert second.do(KEY, fn) == (fn.result, True)
+    assert fn.calls == 1
+
+
+def test_expired_result_is_not_reused(tmp_path):
+    flight = SingleFlight(str(tmp_path), result_ttl=10.0)
+    fn = Counter()
+    flight.do(KEY, fn)
+    stale = time.time() - 60
+    os.utime(tmp_path / f'{KEY}.json', (stale, stale))
+
+    assert flight.do(KEY, fn) == (fn.result, False)
+    assert fn.calls == 2
+
+
+@pytest.mark.parametrize('limit, stage', [('max_pages', 'parse'), ('max_signatures', 'admission')])
+def test_admission_limits_are_shared(workers, limit, stage):
+    first, second = workers
+    fn = Counter(error=VerificationLimitExceeded(limit, 900, 500, stage=stage))
+    with pytest.raises(VerificationLimitExceeded):
+        first.do(KEY, fn)
+    with pytest.raises(VerificationLimitExceeded) as excinfo:
+        second.do(KEY, fn)
+
+    assert fn.calls == 1
+    assert excinfo.value.http_status == 413
+    assert excinfo.value.to_dict() == {'limit': limit, 'actual': 900, 'maximum': 500, 'stage': stage}
+
+
+@pytest.mark.parametrize('error', [
+    VerificationLimitExceeded('stage_timeout_seconds', 5.1, 5, stage='integrity'),
+    VerificationLimitExceeded('verify_timeout_seconds', 31, 30, stage='cryptographic'),
+    VerificationLimitExceeded('max_rss_bytes', 2 << 30, 1 << 30, stage='parse'),
+    RuntimeError('boom'),
+])
+def test_load_dependent_errors_are_not_shared(workers, tmp_path, error):
+    first, second = workers
+    with pytest.raises(type(error)):
+        first.do(KEY, Counter(error=error))
+    assert not (tmp_path / f'{KEY}.json').exists()
+
+    fn = Counter()
+    assert second.do(KEY, fn) == (fn.result, False)
+    assert fn.calls == 1
+
+
+def test_old_timeout_result_file_is_ignored(tmp_path):
+    (tmp_path / f'{KEY}.json').write_text(json.dumps({'limit_exceeded': {
+        'limit': 'stage_timeout_seconds', 'actual': 6, 'maximum': 5, 'stage': 'integrity', 'message': 'x'}}))
+    fn = Counter()
+    assert SingleFlight(str(tmp_path)).do(KEY, fn) == (fn.result, False)
+
+
+def test_lock_timeout_computes_locally_without_publishing(workers, tmp_path, monkeypatch):
+    first, second = workers
+    monkeypatch.setattr(second, '_acquire', lambda fd: False)
+    fn = Counter()
+
+    assert second.do(KEY, fn) == (fn.result, False)
+    assert not (tmp_path / f'{KEY}.json').exists()
+    assert first.do(KEY, fn) == (fn.result, False)
+    assert fn.calls == 2
+
+
+def test_waiting_worker_uses_result_of_lock_holder(tmp_path):
+    first, second = SingleFlight(str(tmp_path)), SingleFlight(str(tmp_path), wait_timeout=5.0)
+    slow, fast = Counter(delay=0.3), Counter(result=[{'other': True}])
+    leader = threading.Thread(target=first.do, args=(KEY, slow))
+    leader.start()
+    time.sleep(0.1)
+
+    assert second.do(KEY, fast) == (slow.result, True)
+    leader.join()
+    assert (slow.calls, fast.calls) == (1, 0)
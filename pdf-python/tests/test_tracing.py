@@ -0,0 +1,88 @@
+import json
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+
+from tracing import FileExporter, OTLPHTTPExporter, parse_traceparent, span, start_trace
+
+TRACEPARENT = '00-4bf92f3577b34da6a3ce929d0e0e4736-00f067aa0ba902b7-01'
+
+
+@pytest.fixture
+def collector():
+    """Collector OTLP/HTTP giả: lưu body JSON nhận được"""
+    received = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            received.append(json.loads(self.rfile.read(int(self.headers['Content-Length']))))
+            self.send_response(200)
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f'http://127.0.0.1:{server.server_port}/v1/traces', received
+    server.shutdown()
+
+
+def _wait(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return predicate()
+
+
+def test_parse_traceparent():
+    assert parse_traceparent(TRACEPARENT) == ('4bf92f3577b34da6a3ce929d0e0e4736', '00f067aa0ba902b7', True)
+    assert parse_traceparent(TRACEPARENT[:-1] + '0')[2] is False
+    assert parse_traceparent('ff' + TRACEPARENT[2:]) is None
+    assert parse_traceparent('00-' + '0' * 32 + '-00f067aa0ba902b7-01') is None
+    assert parse_traceparent('garbage') is None
+
+
+def test_spans_join_incoming_trace(tmp_path):
+    path = tmp_path / 'traces.jsonl'
+    with start_trace('POST /api/verify-pdf', TRACEPARENT, [FileExporter(str(path))]):
+        with span('parse', **{'pdf.signature_count': 2}):
+            pass
+
+    parse, root = [json.loads(line) for line in path.read_text().splitlines()]
+    assert root['trace_id'] == parse['trace_id'] == '4bf92f3577b34da6a3ce929d0e0e4736'
+    assert root['parent_span_id'] == '00f067aa0ba902b7'
+    assert parse['parent_span_id'] == root['span_id']
+    assert parse['attributes'] == {'pdf.signature_count': 2}
+
+
+def test_exporter_error_does_not_fail_request(caplog):
+    class Broken:
+        def export(self, spans):
+            raise ValueError('broken exporter')
+
+    with caplog.at_level(logging.ERROR, logger='tracing'):
+        with start_trace('POST /api/verify-pdf', None, [Broken()]) as root:
+            pass
+    assert root is not None
+    assert any('Broken' in record.getMessage() for record in caplog.records)
+
+
+def test_send_loop_survives_malformed_endpoint(collector, caplog):
+    endpoint, received = collector
+    exporter = OTLPHTTPExporter('not a url')
+    with caplog.at_level(logging.ERROR, logger='tracing'):
+        with start_trace('first', None, [exporter]):
+            pass
+        assert _wait(lambda: exporter.dropped == 1)
+    assert any(record.exc_info for record in caplog.records)
+
+    exporter.endpoint = endpoint
+    with start_trace('second', None, [exporter]):
+        pass
+    assert _wait(lambda: received)
+    assert received[0]['resourceSpans'][0]['scopeSpans'][0]['spans'][0]['name'] == 'second'
+    assert exporter.dropped == 1
@@ -0,0 +1,118 @@
+import re
+import sqlite3
+
+import pytest
+from cryptography.hazmat.primitives.serialization import pkcs7
+
+import verdict_cache
+from sample_pdfs import make_certificate, sign_pdf
+from verdict_cache import VerdictCache, verdict_key
+
+KEY_PARTS = ('sha256', b'\x01' * 32, b'\x02' * 64, 'ab' * 32)
+
+
+@pytest.fixture(scope='module')
+def signed():
+    """PDF một chữ ký + ByteRange + CMS + chứng chỉ người ký"""
+    cert, key = make_certificate('Verdict Signer', key_type='p256')
+    pdf, cms = sign_pdf(cert, key)
+    byte_range = tuple(int(n) for n in re.search(rb"/ByteRange \[(\d+) (\d+) (\d+) (\d+)\]", pdf).groups())
+    return pdf, byte_range, cms, pkcs7.load_der_pkcs7_certificates(cms)[0]
+
+
+@pytest.fixture
+def verify_calls(monkeypatch):
+    """Đếm số lần api chạy verify RSA/ECDSA thật, với VERDICT_CACHE mới"""
+    import api
+
+    calls = []
+    verify = api.verify_signature_value
+
+    def counting(*args):
+        calls.append(args)
+        return verify(*args)
+
+    monkeypatch.setattr(api, 'verify_signature_value', counting)
+    monkeypatch.setattr(api, 'VERDICT_CACHE', VerdictCache(16))
+    return calls
+
+
+def test_api_hit_skips_verification(signed, write_pdf, verify_calls):
+    import api
+
+    pdf, byte_range, cms, cert = signed
+    path = write_pdf(pdf)
+    first = api.verify_signed_byte_range(path, byte_range, cert, cms)
+    second = api.verify_signed_byte_range(path, byte_range, cert, cms)
+
+    assert first == second and first[0] is True
+    assert len(verify_calls) == 1
+    assert (api.VERDICT_CACHE.hits, api.VERDICT_CACHE.misses) == (1, 1)
+
+
+def test_api_changed_signed_data_misses(signed, write_pdf, verify_calls):
+    import api
+
+    pdf, byte_range, cms, cert = signed
+    assert api.verify_signed_byte_range(write_pdf(pdf), byte_range, cert, cms)[0] is True
+    # Sửa một byte trong vùng được ký: digest khác -> không dùng verdict cũ
+    tampered = pdf[:20] + (b'X' if pdf[20:21] != b'X' else b'Y') + pdf[21:]
+    assert api.verify_signed_byte_range(write_pdf(tampered, 'tampered.pdf'), byte_range, cert, cms)[0] is False
+
+    assert len(verify_calls) == 2
+    assert (api.VERDICT_CACHE.hits, api.VERDICT_CACHE.misses) == (0, 2)
+
+
+@pytest.mark.parametrize('index, value', [
+    (0, 'sha384'),
+    (1, b'\x03' * 32),
+    (2, b'\x04' * 64),
+    (3, 'cd' * 32),
+])
+def test_key_depends_on_every_part(index, value):
+    cache = VerdictCache(16)
+    cache.put(verdict_key(*KEY_PARTS), (True, 'ok'))
+
+    parts = list(KEY_PARTS)
+    parts[index] = value
+    assert cache.get(verdict_key(*parts)) is None
+    assert cache.get(verdict_key(*KEY_PARTS)) == (True, 'ok')
+
+
+def test_key_parts_are_length_prefixed():
+    assert verdict_key('sha256', b'ab', b'c', 'f') != verdict_key('sha256', b'a', b'bc', 'f')
+
+
+def test_in_process_lru_keeps_max_entries():
+    cache = VerdictCache(2)
+    keys = [verdict_key('sha256', bytes([i]) * 32, b'sig', 'fp') for i in range(3)]
+    cache.put(keys[0], (True, 'a'))
+    cache.put(keys[1], (True, 'b'))
+    cache.get(keys[0])
+    cache.put(keys[2], (True, 'c'))
+
+    assert cache.get(keys[1]) is None
+    assert cache.get(keys[0]) == (True, 'a')
+
+
+def test_sqlite_tier_is_shared_between_instances(tmp_path):
+    path = str(tmp_path / 'verdicts.sqlite3')
+    first, second = VerdictCache(16, path), VerdictCache(16, path)
+    key = verdict_key(*KEY_PARTS)
+
+    first.put(key, (False, 'Chữ ký không hợp lệ'))
+    assert second.get(key) == (False, 'Chữ ký không hợp lệ')
+    assert (second.hits, second.misses) == (1, 0)
+
+
+def test_sqlite_tier_is_pruned_to_max_shared_entries(tmp_path, monkeypatch):
+    monkeypatch.setattr(verdict_cache, '_PRUNE_EVERY', 4)
+    path = str(tmp_path / 'verdicts.sqlite3')
+    cache = VerdictCache(16, path, max_shared_entries=3)
+    keys = [verdict_key('sha256', bytes([i]) * 32, b'sig', 'fp') for i in range(8)]
+    for i, key in enumerate(keys):
+        cache.put(key, (True, str(i)))
+
+    with sqlite3.connect(path) as conn:
+        remaining = [row[0] for row in conn.execute('SELECT key FROM verdicts ORDER BY rowid')]
+    assert remaining == keys[-3:]
@@ -0,0 +1,299 @@
+"""
+Tracing kiểu OpenTelemetry cho /api/verify-pdf (không cần SDK ngoài)
+
+- Nhận trace context W3C từ header `traceparent` (Next.js route.ts gửi kèm), nên
+  span của Python nằm dưới span của proxy trong cùng một trace.
+- Span con cho từng giai đoạn: upload.read, admission, parse, dss và từng bước
+  xác minh đánh số của mỗi chữ ký (signature_info 1-5, integrity 6,
+  cryptographic 7, chain_timestamp 8-9).
+- Attribute: pdf.file_size, pdf.signature_count, ...
+
+Span được export khi span gốc của request kết thúc:
+- File JSONL (một span mỗi dòng) - dùng offline, không cần collector
+- OTLP/HTTP JSON tới collector (ví dụ http://localhost:4318/v1/traces), gửi
+  trong thread nền để không làm chậm request
+
+Không đặt biến nào thì tracing tắt, span() chỉ là context manager rỗng.
+
+Cấu hình qua biến môi trường:
+    PDF_TRACE_FILE=/data/traces.jsonl
+    PDF_TRACE_OTLP_ENDPOINT=http://localhost:4318/v1/traces
+    PDF_TRACE_SERVICE_NAME=pdf-python
+"""
+
+import functools
+import json
+import logging
+import os
+import queue
+import re
+import threading
+import time
+import urllib.request
+from contextlib import contextmanager
+
+from flask import request
+
+logger = logging.getLogger(__name__)
+
+SERVICE_NAME = os.environ.get('PDF_TRACE_SERVICE_NAME', 'pdf-python')
+
+_TRACEPARENT_RE = re.compile(r'^([0-9a-f]{2})-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$')
+
+# Span kind theo OTLP
+KIND_INTERNAL = 1
+KIND_SERVER = 2
+
+_local = threading.local()
+
+
+def parse_traceparent(value):
+    """
+    Parse header traceparent (W3C Trace Context)
+
+    Returns:
+        (trace_id, parent_span_id, sampled: bool) hoặc None nếu không hợp lệ
+    """
+    match = _TRACEPARENT_RE.match((value or '').strip().lower())
+    if not match:
+        return None
+    version, trace_id, span_id, flags = match.groups()
+    if version == 'ff' or trace_id == '0' * 32 or span_id == '0' * 16:
+        return None
+    return trace_id, span_id, bool(int(flags, 16) & 0x01)
+
+
+def _new_id(n_bytes):
+    return os.urandom(n_bytes).hex()
+
+
+class Span:
+    """Một span đã/đang ghi"""
+
+    __slots__ = ('trace_id', 'span_id', 'parent_span_id', 'name', 'kind',
+                 'start_ns', 'end_ns', 'attributes', 'error')
+
+    def __init__(self, trace_id, parent_span_id, name, kind=KIND_INTERNAL, attributes=None):
+        self.trace_id = trace_id
+        self.span_id = _new_id(8)
+        self.parent_span_id = parent_span_id
+        self.name = name
+        self.kind = kind
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.attributes = dict(attributes or {})
+        self.error = None
+
+    def to_dict(self):
+        return {
+            'service': SERVICE_NAME,
+            'trace_id': self.trace_id,
+            'span_id': self.span_id,
+            'parent_span_id': self.parent_span_id,
+            'name': self.name,
+            'kind': self.kind,
+            'start_time_unix_nano': self.start_ns,
+            'end_time_unix_nano': self.end_ns,
+            'duration_ms': round((self.end_ns - self.start_ns) / 1e6, 3),
+            'attributes': self.attributes,
+            'status': 'error' if self.error else 'ok',
+            'error': self.error,
+        }
+
+
+class FileExporter:
+    """Ghi span dạng JSONL; cả trace ghi trong một lần write (O_APPEND) nên các worker không chen nhau"""
+
+    def __init__(self, path):
+        self.path = path
+
+    def export(self, spans):
+        data = ''.join(json.dumps(s.to_dict(), ensure_ascii=False, default=str) + '\n' for s in spans)
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(data)
+
+
+def _otlp_value(value):
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
+
+
+class OTLPHTTPExporter:
+    """
+    Gửi span tới collector theo OTLP/HTTP JSON
+
+    Queue + thread nền theo từng process (tạo lazily, gunicorn preload fork sau khi import).
+    Queue đầy hoặc collector lỗi thì bỏ span, không ảnh hưởng request.
+    """
+
+    def __init__(self, endpoint, timeout=2.0, max_queue=1000):
+        self.endpoint = endpoint
+        self.timeout = timeout
+        self.max_queue = max_queue
+        self.dropped = 0
+        self._pid = None
+        self._queue = None
+        self._lock = threading.Lock()
+
+    def _ensure_process(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._queue = queue.Queue(maxsize=self.max_queue)
+            threading.Thread(target=self._send_loop, name='trace-exporter', daemon=True).start()
+            self._pid = os.getpid()
+
+    def export(self, spans):
+        self._ensure_process()
+        try:
+            self._queue.put_nowait(spans)
+        except queue.Full:
+            self.dropped += len(spans)
+
+    def payload(self, spans):
+        return {'resourceSpans': [{
+            'resource': {'attributes': [{'key': 'service.name', 'value': {'stringValue': SERVICE_NAME}}]},
+            'scopeSpans': [{
+                'scope': {'name': 'pdf-python'},
+                'spans': [{
+                    'traceId': s.trace_id,
+                    'spanId': s.span_id,
+                    'parentSpanId': s.parent_span_id or '',
+                    'name': s.name,
+                    'kind': s.kind,
+                    'startTimeUnixNano': str(s.start_ns),
+                    'endTimeUnixNano': str(s.end_ns),
+                    'attributes': [{'key': k, 'value': _otlp_value(v)} for k, v in s.attributes.items()],
+                    'status': {'code': 2, 'message': s.error} if s.error else {'code': 1},
+                } for s in spans],
+            }],
+        }]}
+
+    def _send_loop(self):
+        while True:
+            spans = self._queue.get()
+            try:
+                body = json.dumps(self.payload(spans), default=str).encode()
+                req = urllib.request.Request(self.endpoint, data=body, headers={'Content-Type': 'application/json'})
+                urllib.request.urlopen(req, timeout=self.timeout).close()
+            except OSError as e:
+                # Collector không tới được: bỏ batch, không cần traceback
+                self.dropped += len(spans)
+                logger.warning("Không gửi được %d span tới %s: %s", len(spans), self.endpoint, e)
+            except Exception:
+                # Lỗi khác (endpoint sai định dạng, ...) không được làm chết thread gửi
+                self.dropped += len(spans)
+                logger.exception("Không gửi được %d span tới %s", len(spans), self.endpoint)
+
+
+def exporters_from_env():
+    exporters = []
+    if os.environ.get('PDF_TRACE_FILE'):
+        exporters.append(FileExporter(os.environ['PDF_TRACE_FILE']))
+    if os.environ.get('PDF_TRACE_OTLP_ENDPOINT'):
+        exporters.append(OTLPHTTPExporter(os.environ['PDF_TRACE_OTLP_ENDPOINT']))
+    return exporters
+
+
+EXPORTERS = exporters_from_env()
+
+
+def current_span():
+    stack = getattr(_local, 'stack', None)
+    return stack[-1] if stack else None
+
+
+def set_attribute(key, value):
+    """Gắn attribute vào span hiện tại (không làm gì nếu không có trace)"""
+    span_ = current_span()
+    if span_ is not None:
+        span_.attributes[key] = value
+
+
+def _end(span_, exc):
+    span_.end_ns = time.time_ns()
+    if exc is not None:
+        span_.error = f"{type(exc).__name__}: {str(exc)[:200]}"
+
+
+@contextmanager
+def start_trace(name, traceparent=None, exporters=None, **attributes):
+    """
+    Mở span gốc (kind SERVER) của request; export mọi span khi kết thúc
+
+    Args:
+        name: Tên span, ví dụ "POST /api/verify-pdf"
+        traceparent: Header traceparent nhận được (None = trace mới)
+        exporters: Mặc định EXPORTERS (từ biến môi trường)
+    """
+    exporters = EXPORTERS if exporters is None else exporters
+    parent = parse_traceparent(traceparent)
+    if not exporters or (parent and not parent[2]):
+        # Tracing tắt hoặc phía gọi không sample trace này
+        yield None
+        return
+
+    trace_id, parent_span_id = (parent[0], parent[1]) if parent else (_new_id(16), None)
+    root = Span(trace_id, parent_span_id, name, KIND_SERVER, attributes)
+    _local.stack = [root]
+    _local.finished = []
+    exc = None
+    try:
+        yield root
+    except BaseException as e:
+        exc = e
+        raise
+    finally:
+        _end(root, exc)
+        spans = _local.finished + [root]
+        _local.stack = None
+        _local.finished = None
+        for exporter in exporters:
+            try:
+                exporter.export(spans)
+            except Exception:
+                logger.exception("Export trace lỗi (%s)", type(exporter).__name__)
+
+
+@contextmanager
+def span(name, **attributes):
+    """Span con của span hiện tại (context manager rỗng nếu không có trace)"""
+    parent = current_span()
+    if parent is None:
+        yield None
+        return
+
+    child = Span(parent.trace_id, parent.span_id, name, KIND_INTERNAL, attributes)
+    _local.stack.append(child)
+    exc = None
+    try:
+        yield child
+    except BaseException as e:
+        exc = e
+        raise
+    finally:
+        _end(child, exc)
+        _local.stack.pop()
+        _local.finished.append(child)
+
+
+def traced_view(view):
+    """Decorator cho Flask view: span gốc theo traceparent của request + http.status_code"""
+
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        with start_trace(f"{request.method} {request.path}", request.headers.get('traceparent'),
+                         **{'http.method': request.method, 'http.route': request.path}) as root:
+            response = view(*args, **kwargs)
+            if root is not None:
+                root.attributes['http.status_code'] = response[1] if isinstance(response, tuple) else response.status_code
+            return response
+
+    return wrapper
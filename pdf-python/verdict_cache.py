@@ -0,0 +1,166 @@
+"""
+Cache kết quả xác minh chữ ký cryptographic
+
+Các tài liệu sinh từ cùng một mẫu đã ký sẵn có CMS và digest ByteRange giống hệt
+nhau, nên phép verify RSA/ECDSA cho ra cùng một kết quả. Kết quả được cache theo
+(thuật toán digest, digest dữ liệu được ký, signature value, fingerprint chứng chỉ)
+- cùng bộ này thì verify luôn cho cùng kết quả, không cần hết hạn.
+
+Hai tầng:
+- LRU trong process (OrderedDict, giới hạn số entry)
+- SQLite dùng chung giữa các worker (tuỳ chọn, WAL mode), giới hạn số dòng
+
+Cấu hình qua biến môi trường:
+    PDF_VERDICT_CACHE_SIZE=4096               (0 = tắt cache)
+    PDF_VERDICT_CACHE_DB=/data/verdicts.sqlite3   (tầng dùng chung, mặc định tắt)
+    PDF_VERDICT_CACHE_DB_MAX_ENTRIES=100000
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS verdicts (
+    key BLOB PRIMARY KEY,
+    is_valid INTEGER NOT NULL,
+    message TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+"""
+
+# Số lần ghi (mỗi process) giữa hai lần cắt bớt bảng verdicts
+_PRUNE_EVERY = 256
+
+
+def verdict_key(algorithm, digest, signature, fingerprint):
+    """
+    Key cache: SHA-256 của (thuật toán, digest, signature value, fingerprint)
+
+    Các phần được ghép kèm độ dài nên không thể trùng key do cắt ghép khác nhau.
+
+    Returns:
+        bytes (32)
+    """
+    h = hashlib.sha256()
+    for part in (algorithm.encode(), digest, signature, fingerprint.encode()):
+        h.update(len(part).to_bytes(4, 'big'))
+        h.update(part)
+    return h.digest()
+
+
+class VerdictCache:
+    """
+    Cache (is_valid, message) của verify_cryptographic_signature
+
+    Usage:
+        cache = VerdictCache(4096, '/data/verdicts.sqlite3')
+        key = verdict_key('sha256', digest, signature_value, fingerprint)
+        verdict = cache.get(key)
+        if verdict is None:
+            verdict = ...  # verify RSA/ECDSA
+            cache.put(key, verdict)
+    """
+
+    def __init__(self, max_entries=4096, path=None, max_shared_entries=100000):
+        self.max_entries = max_entries
+        self.path = path
+        self.max_shared_entries = max_shared_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._writes = 0
+
+        if path:
+            conn = self._connect()
+            try:
+                conn.executescript(SCHEMA)
+            finally:
+                conn.close()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=5)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    def _conn(self):
+        """Connection theo thread và process (connection SQLite không an toàn qua fork)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = self._local.conn = self._connect()
+            self._local.pid = os.getpid()
+        return conn
+
+    def _remember(self, key, verdict):
+        with self._lock:
+            self._entries[key] = verdict
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get(self, key):
+        """
+        Returns:
+            (is_valid: bool, message: str) hoặc None nếu chưa có
+        """
+        with self._lock:
+            verdict = self._entries.get(key)
+            if verdict is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return verdict
+
+        if self.path:
+            try:
+                row = self._conn().execute('SELECT is_valid, message FROM verdicts WHERE key = ?', (key,)).fetchone()
+            except sqlite3.Error:
+                row = None
+            if row is not None:
+                verdict = (bool(row[0]), row[1])
+                self._remember(key, verdict)
+                self.hits += 1
+                return verdict
+
+        self.misses += 1
+        return None
+
+    def put(self, key, verdict):
+        self._remember(key, verdict)
+        if not self.path:
+            return
+        try:
+            conn = self._conn()
+            with conn:
+                conn.execute('INSERT OR REPLACE INTO verdicts (key, is_valid, message, created_at) VALUES (?, ?, ?, ?)',
+                             (key, int(verdict[0]), verdict[1], time.time()))
+                self._writes += 1
+                if self._writes % _PRUNE_EVERY == 0:
+                    # rowid tăng dần theo lần ghi: giữ lại max_shared_entries dòng mới nhất
+                    conn.execute('DELETE FROM verdicts WHERE rowid <= (SELECT MAX(rowid) FROM verdicts) - ?',
+                                 (self.max_shared_entries,))
+        except sqlite3.Error:
+            # Tầng dùng chung lỗi (khoá lâu, hết dung lượng) không ảnh hưởng kết quả xác minh
+            pass
+
+
+def open_verdict_cache_from_env():
+    """
+    Tạo VerdictCache theo biến môi trường
+
+    Returns:
+        VerdictCache hoặc None (tắt)
+    """
+    max_entries = int(os.environ.get('PDF_VERDICT_CACHE_SIZE', '4096'))
+    if max_entries <= 0:
+        return None
+    return VerdictCache(
+        max_entries,
+        path=os.environ.get('PDF_VERDICT_CACHE_DB') or None,
+        max_shared_entries=int(os.environ.get('PDF_VERDICT_CACHE_DB_MAX_ENTRIES', '100000')),
+    )